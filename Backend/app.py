@@ -1,19 +1,83 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+import heapq
 import json
+import os
+import threading
+from itertools import islice
+
+from distance import distance_miles
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, ndjson_response, wants_ndjson
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=[NEXT_CURSOR_HEADER])
+
+STATIONS_FILE = "stations.json"
+GRADES = ("regular", "midgrade", "premium", "diesel", "e85")
+
+class StationSnapshot :
+    """Process-wide parsed copy of the stations file.
+
+    The file is only re-read when its mtime or size changes. Callers share the
+    same dictionaries, so they must treat them as read-only and build new
+    dicts when they need a different shape.
+
+    Each load also builds price indexes: for every grade, the station keys
+    sorted by that grade's price, plus "lowest" sorted by each station's
+    cheapest price. Stations and indexes are swapped together.
+    """
+
+    def __init__(self, path) :
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._state = ({}, {})
+
+    def get(self) :
+        return self.getIndexed()[0]
+
+    def getIndexed(self) :
+        """Return (stations, priceIndex) from the same version of the file"""
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp :
+            with self._lock :
+                # Another request may have reloaded while we waited for the lock
+                if stamp != self._stamp :
+                    with open(self.path, "r") as file :
+                        stations = json.load(file)
+                    self._state = (stations, buildPriceIndex(stations))
+                    self._stamp = stamp
+        return self._state
+
+def buildPriceIndex(stations) :
+    priceIndex = {}
+    for grade in GRADES :
+        priced = [key for key, info in stations.items() if info["prices"].get(grade) is not None]
+        # sorted() is stable, so equal prices keep file order
+        priceIndex[grade] = sorted(priced, key=lambda key: stations[key]["prices"][grade])
+
+    lowest = {}
+    for key, info in stations.items() :
+        prices = [p for p in info["prices"].values() if p is not None]
+        if prices :
+            lowest[key] = min(prices)
+    priceIndex["lowest"] = sorted(lowest, key=lowest.get)
+    return priceIndex
+
+snapshot = StationSnapshot(STATIONS_FILE)
 
 @app.route("/", methods=["GET"])
 def requestForData(): 
     grade = request.args.get("grade", "default").lower()
     brand = request.args.get("brand", "default").lower()
     sortingType = request.args.get("sortingType", "default").lower()
+    try :
+        limit = positiveIntArg("limit")
+    except ValueError as e :
+        return jsonify({"error": str(e)}), 400
 
-    file = open("stations.json", "r")
-    dictionary = json.load(file)
-    file.close()
+    dictionary, priceIndex = snapshot.getIndexed()
     
     if grade != "default" :
         dictionary = sortByGrade(dictionary, grade)
@@ -22,44 +86,71 @@ def requestForData():
     if sortingType != "default" :
         match sortingType :
             case "shortest":
-                dictionary = sortByShortest(dictionary)
+                lat = request.args.get("lat", type=float)
+                lon = request.args.get("lon", type=float)
+                if lat is None or lon is None :
+                    return jsonify({"error": "lat and lon are required for shortest sorting"}), 400
+                dictionary = sortByShortest(dictionary, lat, lon, limit)
             case "cheapest":
-                dictionary = sortByCheapest(dictionary)
+                dictionary = sortByCheapest(dictionary, priceIndex, grade, limit)
+
+    # Cursor pagination: resume after the station key the previous page ended on
+    try :
+        pageSize = positiveIntArg("page_size")
+    except ValueError as e :
+        return jsonify({"error": str(e)}), 400
+    cursor = request.args.get("cursor")
+    if pageSize is not None or cursor :
+        if limit is not None :
+            return jsonify({"error": "'limit' cannot be combined with 'page_size' or 'cursor'"}), 400
+        return paginate(dictionary, pageSize, cursor)
 
-    return jsonify(list(dictionary.values()))
+    if wants_ndjson() :
+        return ndjson_response(islice(dictionary.values(), limit))
+    return jsonify(list(islice(dictionary.values(), limit)))
+
+def positiveIntArg(name) :
+    # None when the query parameter is absent; anything but a whole number >= 1 is rejected
+    value = request.args.get(name)
+    if value is None :
+        return None
+    if not value.isdigit() or int(value) < 1 :
+        raise ValueError(f"'{name}' must be a positive integer")
+    return int(value)
+
+def paginate(dictionary, pageSize, cursor) :
+    keys = iter(dictionary)
+    if cursor :
+        try :
+            last = decode_cursor(cursor)["key"]
+        except (ValueError, KeyError) as e :
+            return jsonify({"error": str(e)}), 400
+        if last not in dictionary :
+            return jsonify({"error": "Cursor no longer matches the result set"}), 400
+        # Advance the iterator just past the last key that was returned
+        for key in keys :
+            if key == last :
+                break
+
+    page = list(islice(keys, pageSize))
+    hasMore = next(keys, None) is not None
+    nextCursor = encode_cursor({"key": page[-1]}) if page and hasMore else None
+    if wants_ndjson() :
+        return ndjson_response((dictionary[key] for key in page), next_cursor=nextCursor)
+
+    return jsonify({
+        "results": [dictionary[key] for key in page],
+        "next_cursor": nextCursor
+    })
 
 def sortByGrade(dictionary, grade) :
+    # Build projected copies that only carry the requested price; the snapshot
+    # records are shared between requests and must not be modified
     filtered = {}
     for key, info in dictionary.items() :
-        if info["prices"][grade] is not None :
-            match grade :
-                case "regular":
-                    del info["prices"]["midgrade"]
-                    del info["prices"]["premium"]
-                    del info["prices"]["diesel"]
-                    del info["prices"]["e85"]
-                case "midgrade":
-                    del info["prices"]["regular"]
-                    del info["prices"]["premium"]
-                    del info["prices"]["diesel"]
-                    del info["prices"]["e85"]
-                case "premium":
-                    del info["prices"]["regular"]
-                    del info["prices"]["midgrade"]
-                    del info["prices"]["diesel"]
-                    del info["prices"]["e85"]
-                case "diesel":
-                    del info["prices"]["regular"]
-                    del info["prices"]["midgrade"]
-                    del info["prices"]["premium"]
-                    del info["prices"]["e85"]
-                case "e85":
-                    del info["prices"]["regular"]
-                    del info["prices"]["midgrade"]
-                    del info["prices"]["premium"]
-                    del info["prices"]["diesel"]
-            
-            filtered[key] = info
+        price = info["prices"].get(grade)
+        if price is not None :
+            filtered[key] = {**info, "prices": {grade: price}}
 
     return filtered
 
@@ -71,22 +162,34 @@ def sortByBrand(dictionary, brand) :
     
     return filtered
 
-def sortByShortest(dictionary) :
-    
-    pass
+def sortByShortest(dictionary, lat, lon, limit=None) :
+    def distance(item) :
+        location = item[1]["location"]
+        return distance_miles(lat, lon, location["latitude"], location["longitude"])
 
-def sortByCheapest(dictionary) :
-    cheapest = None
-    lowestPrice = float("inf")
-    
-    for key, info in dictionary.items() :
-        prices = info["prices"].values()
-        minPrice = float("inf")
+    # heapq.nsmallest keeps a heap of `limit` entries instead of sorting everything
+    if limit is None :
+        closest = sorted(dictionary.items(), key=distance)
+    else :
+        closest = heapq.nsmallest(limit, dictionary.items(), key=distance)
+    return dict(closest)
+
+def sortByCheapest(dictionary, priceIndex, grade="default", limit=None) :
+    # Walk the prebuilt price index and keep the stations still in the filtered
+    # set, stopping once `limit` are found. Stations without a price go last.
+    order = priceIndex.get(grade if grade != "default" else "lowest", [])
+    cheapest = {}
 
-        for p in prices :
-            if p is not None and p < minPrice:
-                minPrice = p
+    for key in order :
+        if limit is not None and len(cheapest) >= limit :
+            return cheapest
+        if key in dictionary :
+            cheapest[key] = dictionary[key]
+
+    for key, info in dictionary.items() :
+        if limit is not None and len(cheapest) >= limit :
+            break
+        if key not in cheapest :
+            cheapest[key] = info
 
-        if minPrice < lowestPrice : 
-            lowestPrice = minPrice
-            cheapest = {key: info}
+    return cheapest
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the Gas Station Finder
+Serves the app's async views (/geocode, /travel-info) as coroutines on the
+ASGI server's event loop, so requests waiting on Mapbox or Nominatim hold no
+thread at all. Every other route runs as plain WSGI on a bounded thread pool;
+streamed responses (/price-stream, NDJSON) then continue on a thread of their
+own, so long-lived streams can't use up the pool. Needs an ASGI server and
+aiohttp:
+
+    pip install uvicorn aiohttp
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Each uvicorn worker imports the app and loads its own station snapshot; use
+serve.py to share one snapshot between pre-forked WSGI workers instead.
+"""
+
+import asyncio
+import inspect
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from flask import Flask
+from werkzeug.exceptions import HTTPException
+
+import async_upstream
+from priceUpdater import app as flask_app
+
+# Threads running the synchronous (WSGI) routes in each process
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', '64'))
+
+
+def build_environ(scope: Dict, body: bytes) -> Dict:
+    """WSGI environ for an ASGI HTTP request whose body has been read"""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI carries the raw path bytes as latin-1 text
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def _encode_headers(headers: List[Tuple[str, str]]) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+class FlaskASGI:
+    """ASGI app: async Flask views natively on the server's loop, the rest through a thread pool"""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+        elif self._is_async_view(scope):
+            await self._serve_async(scope, receive, send)
+        else:
+            await self._serve_wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_upstream.close_shared_client()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _is_async_view(self, scope: Dict) -> bool:
+        # CORS preflights and routing errors are left to Flask's usual handling
+        if scope['method'] == 'OPTIONS':
+            return False
+        try:
+            endpoint, _ = self.app.url_map.bind('localhost').match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return False
+        return inspect.iscoroutinefunction(self.app.view_functions.get(endpoint))
+
+    @staticmethod
+    async def _read_body(receive):
+        """The whole request body, or None if the client went away"""
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def _serve_async(self, scope, receive, send):
+        """Flask's full_dispatch_request, awaiting the view on this loop"""
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        app = self.app
+        ctx = app.request_context(build_environ(scope, body))
+        error = None
+        try:
+            ctx.push()
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        request = ctx.request
+                        if request.routing_exception is not None:
+                            app.raise_routing_exception(request)
+                        rv = await app.view_functions[request.url_rule.endpoint](**request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            await send({'type': 'http.response.start', 'status': response.status_code,
+                        'headers': _encode_headers(response.headers.to_wsgi_list())})
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            response.close()
+        finally:
+            ctx.pop(error)
+
+    async def _serve_wsgi(self, scope, receive, send):
+        """Run the WSGI app on the thread pool, streaming its output back through the loop"""
+        body = await self._read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            """Call the app; a streamed response is returned to be sent from another thread"""
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                if exc_info and started:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                started[:] = [int(status.split(' ', 1)[0]), _encode_headers(headers)]
+
+            result = self.app(build_environ(scope, body), start_response)
+            if self._is_streamed(started):
+                return lambda: send_result(result, started)
+            send_result(result, started)
+            return None
+
+        def send_result(result, started):
+            try:
+                for chunk in result:
+                    # Streams (e.g. /price-stream) end at their next chunk after a disconnect
+                    if disconnected.is_set():
+                        return
+                    if chunk:
+                        self._start(send_from_thread, started)
+                        send_from_thread({'type': 'http.response.body', 'body': chunk,
+                                          'more_body': True})
+                self._start(send_from_thread, started)
+                send_from_thread({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            stream = await loop.run_in_executor(self.executor, run)
+            if stream is not None:
+                await self._run_in_thread(loop, stream)
+        finally:
+            watcher.cancel()
+
+    @staticmethod
+    def _is_streamed(started: list) -> bool:
+        # Werkzeug sets Content-Length on every buffered response, so a
+        # response without one is a generator of unknown length
+        return len(started) == 2 and not any(name == b'content-length' for name, _ in started[1])
+
+    @staticmethod
+    async def _run_in_thread(loop, func):
+        """Run func on a new thread, outside the bounded pool, and wait for it"""
+        done = loop.create_future()
+
+        def finish(error=None):
+            if done.done():
+                return
+            if error is None:
+                done.set_result(None)
+            else:
+                done.set_exception(error)
+
+        def target():
+            try:
+                func()
+            except BaseException as e:
+                loop.call_soon_threadsafe(finish, e)
+            else:
+                loop.call_soon_threadsafe(finish)
+
+        threading.Thread(target=target, name="wsgi-stream", daemon=True).start()
+        await done
+
+    @staticmethod
+    def _start(send_from_thread, started: list):
+        """Send the response status and headers before the first body chunk"""
+        if len(started) == 2:
+            status, headers = started
+            send_from_thread({'type': 'http.response.start', 'status': status, 'headers': headers})
+            started.append(True)
+
+
+app = FlaskASGI(flask_app)
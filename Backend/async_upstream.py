@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Asynchronous outbound HTTP for the Gas Station Finder
+A pooled async HTTP client (aiohttp, optional) for Mapbox and Nominatim calls,
+one event loop per process that async Flask views run on, and the Flask
+subclass that sends them there. While a request waits on upstream it is a
+suspended coroutine on that loop rather than a blocked socket read.
+
+Under the WSGI servers (priceUpdater.py, serve.py) each request still holds
+its server thread until the view returns; asgi.py serves the async views on
+an ASGI server's own loop, where an upstream wait costs only a coroutine.
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from flask import Flask
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is optional; without it async views run the blocking clients on threads
+    aiohttp = None
+
+# Most upstream connections open at once per process; they are kept alive and reused
+MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '200'))
+
+
+class UpstreamError(Exception):
+    """An upstream request failed: connection error, timeout or HTTP error status"""
+
+
+def available() -> bool:
+    """True if an async HTTP client is installed"""
+    return aiohttp is not None
+
+
+def _socket_timeout(seconds: float):
+    # Like requests' timeout: limits connecting and each read, not the wait for a pooled connection
+    return aiohttp.ClientTimeout(total=None, sock_connect=seconds, sock_read=seconds)
+
+
+class AsyncHTTPClient:
+    """
+    Pooled async HTTP client bound to one event loop
+
+    Connections are reused across requests and capped at MAX_CONNECTIONS;
+    coroutines beyond that wait for a free connection instead of opening more.
+    """
+
+    def __init__(self, timeout: float = 5.0, headers: Optional[Dict[str, str]] = None):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed")
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+            timeout=_socket_timeout(timeout), headers=headers)
+
+    async def get_json(self, url: str, params: Optional[Dict] = None,
+                       headers: Optional[Dict[str, str]] = None,
+                       timeout: Optional[float] = None) -> Any:
+        """GET url and decode its JSON body; raises UpstreamError on any failure"""
+        kwargs = {} if timeout is None else {'timeout': _socket_timeout(timeout)}
+        try:
+            async with self._session.get(url, params=params, headers=headers, **kwargs) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+        except asyncio.TimeoutError as e:
+            raise UpstreamError(f"{url} timed out") from e
+        except (aiohttp.ClientError, ValueError) as e:
+            raise UpstreamError(str(e) or type(e).__name__) from e
+
+    async def aclose(self):
+        await self._session.close()
+
+
+# One client per event loop: aiohttp sessions belong to the loop that opened them
+_clients: Dict[asyncio.AbstractEventLoop, AsyncHTTPClient] = {}
+
+
+def shared_client() -> AsyncHTTPClient:
+    """The running event loop's pooled client, created on first use"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        for stale in [other for other in _clients if other.is_closed()]:
+            del _clients[stale]
+        client = _clients[loop] = AsyncHTTPClient()
+    return client
+
+
+async def close_shared_client():
+    """Close the running loop's client, e.g. on ASGI lifespan shutdown"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class UpstreamLoop:
+    """
+    An event loop on a background thread that runs coroutines for sync callers
+
+    run() blocks the calling thread until the coroutine finishes; the
+    coroutine sees the caller's context variables, so Flask's request, g and
+    the metrics spans work as they do in a sync view.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="upstream-loop", daemon=True).start()
+                self._loop = loop
+                atexit.register(self.close)
+            return self._loop
+
+    def run(self, coro):
+        # run_coroutine_threadsafe schedules under a copy of this thread's context
+        return asyncio.run_coroutine_threadsafe(coro, self._loop or self._start()).result()
+
+    def close(self):
+        """Close the loop's pooled client (run at exit)"""
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(close_shared_client(), loop).result(timeout=1.0)
+            except Exception as e:
+                print(f"⚠️ Could not close the upstream HTTP client: {e}")
+
+    def after_fork(self):
+        """Forget the parent's loop: its thread does not exist in a forked worker"""
+        self._loop = None
+        self._lock = threading.Lock()
+        _clients.clear()
+
+
+upstream_loop = UpstreamLoop()
+
+
+class AsyncFlask(Flask):
+    """
+    Flask app whose async views run on this process's UpstreamLoop
+
+    Flask's default runs each async view on a new event loop (through
+    asgiref), so no connection pool could outlive a request.
+    """
+
+    def async_to_sync(self, func):
+        def run(*args, **kwargs):
+            return upstream_loop.run(func(*args, **kwargs))
+        return run
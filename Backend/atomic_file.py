@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Atomic file replacement for station data
+Output is written to a temporary file in the target's directory and renamed
+over the target, so readers only ever see the complete old file or the
+complete new one. The new file keeps the old one's permissions (or gets the
+usual umask-based mode), rather than mkstemp's owner-only 0600.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def _current_umask() -> int:
+    # The umask can only be read by setting it; done once, at import
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _current_umask()
+
+
+def _target_mode(filename: str) -> int:
+    """Permissions for a file replacing `filename`: its current mode, or what open() would give"""
+    try:
+        return os.stat(filename).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+@contextmanager
+def atomic_path(filename: str, suffix: str = '.tmp'):
+    """
+    Yield a temporary path next to `filename`, renamed over it on success
+
+    For writers that open the file themselves (e.g. SQLite); the temporary
+    file is removed if the block raises.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.stations-', suffix=suffix)
+    try:
+        os.fchmod(fd, _target_mode(filename))
+        os.close(fd)
+        yield temp_path
+        os.replace(temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+@contextmanager
+def atomic_open(filename: str, mode: str = 'w', **kwargs):
+    """Open a temporary file next to `filename`, fsync it and rename it into place on success"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.stations-', suffix='.tmp')
+    try:
+        os.fchmod(fd, _target_mode(filename))
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filename)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the search and listing hot paths
+
+Runs station loading, search_gas_stations, app.py's requestForData filters and
+JSON serialization against catalogs of 43 (the real stations.json), 10k, 100k
+and 1M synthetic stations, all generated from fixed seeds.
+
+Usage (from Backend/):
+    python benchmarks/bench.py                        # all sizes, writes benchmarks/results/latest.json
+    python benchmarks/bench.py --sizes 43,10000       # a subset
+    python benchmarks/bench.py --save-baseline benchmarks/results/baseline.json
+    python benchmarks/bench.py --baseline benchmarks/results/baseline.json --threshold 0.15
+
+With --baseline, a case whose median latency grew by more than the threshold
+is reported as a regression and the exit status is 1.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+DATA_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'data')
+sys.path.insert(0, BACKEND_DIR)
+
+# Keep the apps' side effects (geocode cache, price history) out of the working tree
+os.environ.setdefault('STATIONS_FILE', os.path.join(BACKEND_DIR, 'stations.json'))
+os.environ.setdefault('GEOCODE_CACHE_PATH', '')
+os.environ.setdefault('PRICE_HISTORY_DIR', os.path.join(tempfile.mkdtemp(prefix='bench-'), 'history'))
+
+import app as listing_app
+import priceGenerator
+import priceUpdater
+from station_repository import FileStationRepository, SQLiteStationRepository, TiledStationRepository
+
+DEFAULT_SIZES = (43, 10_000, 100_000, 1_000_000)
+DATA_SEED = 20240601
+QUERY_SEED = 7
+QUERY_POINTS = 64
+# Central Kansas, far from every generated metro: searches here find nothing
+EMPTY_POINT = (40.0, -100.0)
+
+
+def dataset_path(size: int) -> str:
+    """stations.json for 43, otherwise a cached synthetic catalog of `size` stations"""
+    if size == len(priceGenerator.STATION_DEFINITIONS):
+        return os.path.join(BACKEND_DIR, 'stations.json')
+    path = os.path.join(DATA_DIR, f"stations-{size}-{DATA_SEED}.json")
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        priceGenerator.stream_bulk_json(
+            priceGenerator.generate_bulk_stations(size, seed=DATA_SEED), path, size)
+    return path
+
+
+def empty_search(finder, repository=None, **options) -> List[str]:
+    """
+    Encoded /search results for a query that matches nothing
+
+    With `repository`, its search (and the per-query store it returns) is used
+    instead of the finder's ranking. Raises AssertionError unless the result
+    is an empty list; empty stores once crashed the fragment serializer.
+    """
+    if repository is None:
+        ranked = finder.rank_stations(*EMPTY_POINT, **options)
+    else:
+        store, indices, distances = repository.search(*EMPTY_POINT, **options)
+        ranked = (store, indices, distances, distances, None)
+    results = list(finder.encode_results(ranked))
+    assert results == [], f"expected no results, got {len(results)}"
+    return results
+
+
+def measure(fn: Callable[[int], object], min_iterations: int = 5, max_iterations: int = 200,
+            budget_seconds: float = 2.0) -> Dict:
+    """
+    Time fn(i) over repeated iterations, then measure its peak memory once
+
+    Runs one warm-up call, then at least `min_iterations` and at most
+    `max_iterations` timed calls, stopping early once `budget_seconds` is spent.
+    """
+    fn(0)
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_iterations:
+        gc.collect()
+        t0 = time.perf_counter_ns()
+        fn(len(samples))
+        samples.append(time.perf_counter_ns() - t0)
+        if len(samples) >= min_iterations and time.perf_counter() - started > budget_seconds:
+            break
+
+    gc.collect()
+    tracemalloc.start()
+    fn(0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ms = np.array(samples) / 1e6
+    return {
+        'iterations': len(samples),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'ops_per_sec': round(float(len(ms) / (ms.sum() / 1e3)), 2),
+        'peak_memory_bytes': int(peak),
+    }
+
+
+def run_size(size: int, cases: Dict[str, Dict]):
+    path = dataset_path(size)
+    print(f"\n📊 {size} stations ({os.path.basename(path)})")
+    iterations = dict(max_iterations=20) if size >= 1_000_000 else {}
+
+    def record(name, fn, **options):
+        key = f"{name}[{size}]"
+        cases[key] = measure(fn, **{**iterations, **options})
+        result = cases[key]
+        print(f"  {name:<28} p50 {result['p50_ms']:>10.3f} ms   p95 {result['p95_ms']:>10.3f} ms   "
+              f"{result['ops_per_sec']:>10.1f} ops/s   peak {result['peak_memory_bytes'] / 2**20:8.1f} MiB")
+
+    finder = priceUpdater.GasStationFinderWeb(data_path=path)
+    record('load_stations_from_json', lambda i: FileStationRepository.load_json(path),
+           min_iterations=3, max_iterations=10)
+    store = finder.repository.store
+    stem = os.path.join(DATA_DIR, os.path.splitext(os.path.basename(path))[0])
+    if not os.path.exists(f"{stem}.bin"):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        store.save_binary(f"{stem}.bin")
+    record('load_stations_from_binary', lambda i: FileStationRepository.load_binary(f"{stem}.bin"))
+    if not os.path.exists(f"{stem}.sqlite3"):
+        SQLiteStationRepository(f"{stem}.sqlite3").append(store)
+    sqlite_repository = SQLiteStationRepository(f"{stem}.sqlite3")
+    if not os.path.exists(f"{stem}.tiles"):
+        TiledStationRepository(f"{stem}.tiles").replace_store(store)
+    tiled_repository = TiledStationRepository(f"{stem}.tiles")
+
+    # Query points near real stations, so every search has something in range
+    rng = np.random.default_rng(QUERY_SEED)
+    picks = rng.integers(0, len(store), size=QUERY_POINTS)
+    points = np.column_stack((store.lats[picks], store.lons[picks])) + rng.normal(0, 0.02, (QUERY_POINTS, 2))
+    points = points.tolist()
+
+    for sort_by in ('closest', 'cheapest', 'optimal'):
+        record(f'search_{sort_by}_top20', lambda i, s=sort_by: finder.search_gas_stations(
+            *points[i % QUERY_POINTS], sort_by=s, gas_type='87', radius=10.0, limit=20))
+    record('search_closest_all', lambda i: finder.search_gas_stations(
+        *points[i % QUERY_POINTS], sort_by='closest', radius=10.0))
+    record('search_empty_area', lambda i: empty_search(
+        finder, sort_by='cheapest', gas_type='87', radius=10.0, limit=20))
+    record('search_unknown_grade', lambda i: empty_search(finder, gas_type='bogus'))
+    record('search_brand_cheapest', lambda i: finder.search_gas_stations(
+        *points[i % QUERY_POINTS], sort_by='cheapest', gas_type='87', brand='Chevron',
+        radius=25.0, limit=20))
+    record('sqlite_search_radius', lambda i: sqlite_repository.search(
+        *points[i % QUERY_POINTS], 10.0, grade='87'))
+    record('sqlite_search_brand', lambda i: sqlite_repository.search(
+        *points[i % QUERY_POINTS], 25.0, brand='Chevron', grade='87'))
+    record('sqlite_search_empty_area', lambda i: empty_search(
+        finder, sqlite_repository, radius=10.0, grade='87'))
+    record('tiles_search_radius', lambda i: tiled_repository.search(
+        *points[i % QUERY_POINTS], 10.0, grade='87'))
+    record('tiles_search_brand', lambda i: tiled_repository.search(
+        *points[i % QUERY_POINTS], 25.0, brand='Chevron', grade='87'))
+    record('tiles_search_empty_area', lambda i: empty_search(
+        finder, tiled_repository, radius=10.0, grade='87'))
+
+    with priceUpdater.app.app_context():
+        results = finder.search_gas_stations(*points[0], sort_by='closest', radius=10.0)
+        record('jsonify_search_results', lambda i: priceUpdater.jsonify(
+            {'success': True, 'results': results}).get_data())
+    record('json_dumps_all_stations', lambda i: json.dumps(
+        {'success': True, 'results': finder.gas_stations}), max_iterations=50)
+
+    # app.py reads its catalog through the module-level snapshot
+    listing_app.snapshot = listing_app.StationSnapshot(path)
+    listing_app.snapshot.getIndexed()
+    client = listing_app.app.test_client()
+    lat, lon = points[0]
+    queries = {
+        'app_cheapest_grade_brand': 'grade=regular&brand=shell&sortingType=cheapest&limit=20',
+        'app_shortest_top20': f'sortingType=shortest&lat={lat}&lon={lon}&limit=20',
+        'app_grade_page50': 'grade=premium&page_size=50',
+    }
+    for name, query in queries.items():
+        record(name, lambda i, q=query: client.get(f'/?{q}').get_data())
+
+    sqlite_repository.close()
+    del finder, store, client, sqlite_repository, tiled_repository
+    listing_app.snapshot = listing_app.StationSnapshot(listing_app.STATIONS_FILE)
+    gc.collect()
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Names of cases whose p50 latency exceeds the baseline by more than `threshold`"""
+    regressions = []
+    print(f"\n📈 Compared with baseline ({baseline['meta'].get('created', 'unknown date')}):")
+    for name, result in results['cases'].items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  ❌ REGRESSION'
+        print(f"  {name:<40} {before['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} ms  ({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the search and listing hot paths.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated catalog sizes")
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'latest.json'),
+                        help="Where to write the results")
+    parser.add_argument('--baseline', help="Results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Allowed p50 slowdown before a case counts as a regression (0.10 = 10%%)")
+    parser.add_argument('--save-baseline', help="Also write the results to this baseline file")
+    args = parser.parse_args(argv)
+
+    results = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'data_seed': DATA_SEED,
+            'query_seed': QUERY_SEED,
+        },
+        'cases': {},
+    }
+    for size in (int(value) for value in args.sizes.split(',')):
+        run_size(size, results['cases'])
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) above {args.threshold:.0%}")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
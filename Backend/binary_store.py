@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped binary station file
+A compact alternative to stations.json: fixed-width numeric columns, string
+tables and the store's prebuilt indexes, laid out so a reader can mmap the
+file and use every array in place. Loading is independent of catalog size
+and the pages are shared by every process that maps the same file.
+
+Layout (little-endian):
+    header      magic, format version, section count, station count, grid cell size
+    directory   one (name, dtype, offset, length) entry per section
+    sections    8-byte aligned arrays, e.g. 'lat', 'price:87', 'order:87',
+                'station_ids.offsets' + 'station_ids.data', 'grid.cells'
+"""
+
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from atomic_file import atomic_open
+
+MAGIC = b"GASSTN\x00\x01"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sIIQd")
+_ENTRY = struct.Struct("<24s8sQQ")
+_ALIGN = 8
+
+
+class StringTable(Sequence):
+    """
+    Read-only list of strings backed by an offsets array and a UTF-8 blob
+
+    Strings are decoded on access, so a table over millions of entries costs
+    nothing until it is read.
+    """
+
+    def __init__(self, offsets: np.ndarray, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string table index out of range")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return str(self._data[start:end], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        data = self._data
+        offsets = self._offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield str(data[start:end], "utf-8")
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, StringTable):
+            return np.array_equal(self._offsets, other._offsets) and self._data == other._data
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    @classmethod
+    def gather(cls, parts: Sequence) -> "StringTable":
+        """
+        A new table of chosen entries from other tables, from (table, indices) pairs
+
+        The bytes are copied with array indexing, so nothing is decoded.
+        """
+        lengths, chunks = [], []
+        for table, indices in parts:
+            indices = np.asarray(indices, dtype=np.int64)
+            starts = table._offsets[indices].astype(np.int64)
+            sizes = table._offsets[indices + 1].astype(np.int64) - starts
+            # Source position of every output byte: each entry's start, counted up
+            first = np.cumsum(sizes) - sizes
+            sources = np.repeat(starts - first, sizes) + np.arange(int(sizes.sum()))
+            chunks.append(np.frombuffer(table._data, dtype=np.uint8)[sources])
+            lengths.append(sizes)
+        sizes = np.concatenate(lengths) if lengths else np.empty(0, dtype=np.int64)
+        offsets = np.zeros(sizes.size + 1, dtype=np.uint64)
+        np.cumsum(sizes, out=offsets[1:])
+        data = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint8)
+        return cls(offsets, memoryview(data))
+
+
+def encode_strings(values: Sequence):
+    """(offsets uint64 array, UTF-8 bytes) for a string table"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def write_sections(path: str, station_count: int, cell_size: float,
+                   sections: Dict[str, np.ndarray]):
+    """
+    Write named arrays to `path` atomically (temp file + rename)
+
+    A reader holding the old file mapped keeps seeing the old data until it
+    reopens the path.
+    """
+    entries = []
+    offset = _HEADER.size + _ENTRY.size * len(sections)
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        offset += -offset % _ALIGN
+        entries.append((name, array, offset))
+        offset += array.nbytes
+
+    with atomic_open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(entries), station_count, cell_size))
+        for name, array, start in entries:
+            dtype = array.dtype.newbyteorder("<").str.encode("ascii")
+            f.write(_ENTRY.pack(name.encode("ascii"), dtype, start, array.size))
+        for name, array, start in entries:
+            f.write(b"\0" * (start - f.tell()))
+            f.write(array.astype(array.dtype.newbyteorder("<"), copy=False).tobytes())
+
+
+class MappedFile:
+    """A station file mapped read-only, with its sections as zero-copy NumPy views"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError(f"{path} is not a station binary file")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, section_count, self.station_count, self.cell_size = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a station binary file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        self.mtime = os.path.getmtime(path)
+        self.sections: Dict[str, np.ndarray] = {}
+        buffer = memoryview(self._mmap)
+        for i in range(section_count):
+            name, dtype, offset, length = _ENTRY.unpack_from(self._mmap, _HEADER.size + i * _ENTRY.size)
+            dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+            if offset + length * dtype.itemsize > size:
+                raise ValueError(f"{path} is truncated")
+            self.sections[name.rstrip(b"\0").decode("ascii")] = np.frombuffer(
+                buffer, dtype=dtype, count=length, offset=offset)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.sections[name]
+
+    def get(self, name: str) -> Optional[np.ndarray]:
+        return self.sections.get(name)
+
+    def strings(self, name: str) -> StringTable:
+        return StringTable(self.sections[f"{name}.offsets"],
+                           memoryview(self.sections[f"{name}.data"]))
+
+    def string_list(self, name: str) -> List[str]:
+        """Decode a (small) string table eagerly"""
+        return list(self.strings(name))
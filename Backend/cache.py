@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Caching layers for the Gas Station Finder
+In-memory LRU/TTL and size-bounded LRU caches, a geocoding cache with an
+on-disk SQLite tier and a directions cache keyed by snapped origin and station
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# Returned by cache lookups when there is no live entry, so that a cached
+# None (e.g. "address not found") can be told apart from a miss
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+class SizedLRUCache:
+    """
+    Thread-safe LRU cache bounded by the total size of its entries
+
+    Callers give each entry's size (e.g. bytes). Least recently used entries
+    are evicted once the total exceeds max_size, except the newest one, so an
+    entry larger than the whole budget is still cached until the next insert.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.total_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, size: int):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_size -= previous[0]
+            self._entries[key] = (size, value)
+            self.total_size += size
+            while self.total_size > self.max_size and len(self._entries) > 1:
+                evicted_size, _ = self._entries.popitem(last=False)[1]
+                self.total_size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                'bytes': self.total_size, 'evictions': self.evictions}
+
+
+_PUNCTUATION = re.compile(r"[.,#;:'\"()]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_address(address: str) -> str:
+    """Canonical cache key for a typed address: case, punctuation and spacing don't matter"""
+    text = unicodedata.normalize('NFKC', address).lower()
+    text = _PUNCTUATION.sub(' ', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+class GeocodeCache:
+    """
+    Two-tier geocoding cache
+
+    Lookups check an in-memory LRU first, then an SQLite table that survives
+    restarts, and only then call the live geocoder. "Not found" answers are
+    cached too, with a shorter TTL. Errors are never cached.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 2048,
+                 ttl: float = 30 * 24 * 3600, negative_ttl: float = 3600.0):
+        """
+        Args:
+            path: SQLite file for the persistent tier (None for memory only)
+            max_entries: In-memory LRU capacity
+            ttl: Seconds a successful geocode stays valid
+            negative_ttl: Seconds an "address not found" answer stays valid
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = TTLCache(max_entries, ttl)
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        if not self.path:
+            return
+        try:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Geocode cache database unavailable ({e}); using memory only")
+            self._db = None
+
+    def after_fork(self):
+        """Open a fresh database connection in a forked worker; the parent's must not be shared"""
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._connect()
+
+    def _ttl_for(self, value: Any) -> float:
+        return self.ttl if value is not None else self.negative_ttl
+
+    def get(self, provider: str, address: str) -> Any:
+        """Return the cached result for address, or MISSING"""
+        key = f"{provider}:{normalize_address(address)}"
+        value = self.memory.get(key)
+        if value is not MISSING or self._db is None:
+            return value
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM geocode WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return MISSING
+
+        value = json.loads(row[0])
+        if isinstance(value, list):
+            value = tuple(value)
+        # Promote to memory for the rest of this entry's lifetime
+        self.memory.set(key, value, ttl=row[1] - time.time())
+        return value
+
+    def set(self, provider: str, address: str, value: Any):
+        key = f"{provider}:{normalize_address(address)}"
+        ttl = self._ttl_for(value)
+        self.memory.set(key, value, ttl=ttl)
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl))
+            self._db.commit()
+
+    def lookup(self, provider: str, address: str, fetch: Callable[[str], Any]) -> Any:
+        """Return the cached result for address, calling fetch(address) on a miss"""
+        value = self.get(provider, address)
+        if value is MISSING:
+            value = fetch(address)
+            self.set(provider, address, value)
+        return value
+
+    async def lookup_async(self, provider: str, address: str,
+                           fetch: Callable[[str], Awaitable[Any]]) -> Any:
+        """lookup() for a coroutine fetch; the cache tiers are local and read inline"""
+        value = self.get(provider, address)
+        if value is MISSING:
+            value = await fetch(address)
+            self.set(provider, address, value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return self.memory.stats()
+
+
+class DirectionsCache:
+    """
+    Cache of Mapbox directions keyed by (profile, snapped origin, station id)
+
+    Destinations are always stations, so they are keyed by station id. Origins
+    are snapped to a grid of `grid_deg` degrees, so nearby starting points share
+    one entry. The cached route starts from whichever origin in the cell was
+    looked up first.
+    """
+
+    def __init__(self, grid_deg: float = 0.002, max_entries: int = 4096, ttl: float = 900.0):
+        """
+        Args:
+            grid_deg: Origin grid size in degrees (0.002 deg is ~200 m)
+            max_entries: LRU capacity
+            ttl: Seconds a route stays valid
+        """
+        self.grid_deg = grid_deg
+        self.memory = TTLCache(max_entries, ttl)
+
+    def key(self, profile: str, origin, station_id: str) -> tuple:
+        lat, lon = origin
+        return (profile, round(lat / self.grid_deg), round(lon / self.grid_deg), station_id)
+
+    def get(self, profile: str, origin, station_id: str) -> Any:
+        return self.memory.get(self.key(profile, origin, station_id))
+
+    def set(self, profile: str, origin, station_id: str, route: Dict):
+        self.memory.set(self.key(profile, origin, station_id), route)
+
+    def stats(self) -> Dict[str, int]:
+        return self.memory.stats()
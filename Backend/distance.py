@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Shared distance calculations for the Gas Station Finder
+Computes haversine distances from one origin to many stations as a single
+NumPy array operation, with optional exact geodesic refinement
+"""
+
+import math
+from typing import Optional
+
+import numpy as np
+
+try:
+    from geopy.distance import geodesic
+except ImportError:  # geopy is only needed for boundary refinement
+    geodesic = None
+
+EARTH_RADIUS_MILES = 3958.8
+METERS_PER_MILE = 1609.34
+
+# Haversine assumes a spherical earth; against the WGS-84 ellipsoid it is off by
+# at most ~0.5%. Stations whose spherical distance falls inside this band
+# around the radius get an exact geodesic distance before being filtered.
+SPHERICAL_ERROR = 0.005
+
+
+def haversine_miles(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """
+    Great-circle distance in miles from (lat, lon) to every point in lats/lons
+
+    Args:
+        lat, lon: Origin in degrees
+        lats, lons: Array-likes of destination coordinates in degrees
+
+    Returns:
+        float64 array of distances, same shape as lats
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    phi = math.radians(lat)
+
+    a = (np.sin((lats - phi) * 0.5) ** 2 +
+         math.cos(phi) * np.cos(lats) * np.sin((lons - math.radians(lon)) * 0.5) ** 2)
+    return 2.0 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distance_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in miles"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distances_from(lat: float, lon: float, lats, lons,
+                   radius_miles: Optional[float] = None, refine: bool = True) -> np.ndarray:
+    """
+    Distances in miles from (lat, lon) to every station
+
+    When radius_miles is given and refine is True, entries close enough to the
+    radius that the spherical approximation could put them on the wrong side of
+    it are recomputed with geopy's exact geodesic distance.
+    """
+    distances = haversine_miles(lat, lon, lats, lons)
+
+    if radius_miles is not None and refine and geodesic is not None and distances.size:
+        band = radius_miles * SPHERICAL_ERROR
+        boundary = np.flatnonzero(np.abs(distances - radius_miles) <= band)
+        if boundary.size:
+            lats = np.asarray(lats, dtype=np.float64)
+            lons = np.asarray(lons, dtype=np.float64)
+            for i in boundary:
+                distances[i] = geodesic((lat, lon), (lats[i], lons[i])).miles
+
+    return distances
+
+
+def within_radius(lat: float, lon: float, lats, lons, radius_miles: float,
+                  refine: bool = True):
+    """
+    Select the points within radius_miles of (lat, lon)
+
+    Returns:
+        (positions, distances) - positions into lats/lons and their distances
+    """
+    distances = distances_from(lat, lon, lats, lons, radius_miles, refine)
+    positions = np.flatnonzero(distances <= radius_miles)
+    return positions, distances[positions]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Geohash tiles for the Gas Station Finder
+A geohash of precision p names one cell of a fixed lat/lon grid: 5p bits
+alternating longitude and latitude halvings, written in base 32. Cells are
+handled here as integer (row, col) pairs so covering a bounding box is plain
+arithmetic, and converted to geohash strings only to name tiles.
+"""
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {char: value for value, char in enumerate(_BASE32)}
+
+
+def grid_shape(precision: int) -> Tuple[int, int]:
+    """(rows, cols) of the geohash grid at this precision; longitude gets the odd bit"""
+    bits = 5 * precision
+    return 1 << (bits // 2), 1 << ((bits + 1) // 2)
+
+
+def cell_degrees(precision: int) -> Tuple[float, float]:
+    """(lat, lon) size of one cell in degrees (precision 4 is about 20 x 39 km)"""
+    rows, cols = grid_shape(precision)
+    return 180.0 / rows, 360.0 / cols
+
+
+def cell_of(lat: float, lon: float, precision: int) -> Tuple[int, int]:
+    """(row, col) of the cell holding a point"""
+    rows, cols = grid_shape(precision)
+    lat_deg, lon_deg = cell_degrees(precision)
+    return (min(max(math.floor((lat + 90.0) / lat_deg), 0), rows - 1),
+            min(max(math.floor((lon + 180.0) / lon_deg), 0), cols - 1))
+
+
+def cells_of(lats: np.ndarray, lons: np.ndarray, precision: int) -> Tuple[np.ndarray, np.ndarray]:
+    """cell_of() for arrays of points (without NaNs)"""
+    rows, cols = grid_shape(precision)
+    lat_deg, lon_deg = cell_degrees(precision)
+    return (np.clip(np.floor((lats + 90.0) / lat_deg), 0, rows - 1).astype(np.int64),
+            np.clip(np.floor((lons + 180.0) / lon_deg), 0, cols - 1).astype(np.int64))
+
+
+def encode_cell(row: int, col: int, precision: int) -> str:
+    """Geohash string for a (row, col) cell"""
+    bits = 5 * precision
+    lat_bits, lon_bits = bits // 2, (bits + 1) // 2
+    value = 0
+    for i in range(bits):
+        # Even bits come from longitude, odd bits from latitude, most significant first
+        if i % 2 == 0:
+            lon_bits -= 1
+            value = (value << 1) | ((col >> lon_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((row >> lat_bits) & 1)
+    return "".join(_BASE32[(value >> shift) & 31] for shift in range(bits - 5, -1, -5))
+
+
+def decode_cell(geohash: str) -> Tuple[int, int]:
+    """(row, col) for a geohash string; its length is the precision"""
+    row = col = 0
+    i = 0
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if i % 2 == 0:
+                col = (col << 1) | bit
+            else:
+                row = (row << 1) | bit
+            i += 1
+    return row, col
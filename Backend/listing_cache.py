@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Precompressed, versioned response bodies with conditional GET support
+A listing is encoded and compressed once per data version; repeat requests
+are answered from memory, or with 304 Not Modified when the client is current
+"""
+
+import gzip
+import hashlib
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Optional
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Preferred first when the client accepts several encodings equally
+ENCODINGS = ("br", "gzip", "identity")
+
+
+class EncodedListing:
+    """One response body in every content encoding we serve, plus its validators"""
+
+    def __init__(self, body: bytes, last_modified: float, mimetype: str = "application/json"):
+        self.mimetype = mimetype
+        self.last_modified = int(last_modified)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        # Strong ETags must differ per representation, so each encoding gets its own
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body)
+        self.etags = {encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+                      for encoding in self.bodies}
+
+    def choose_encoding(self) -> str:
+        accepted = request.accept_encodings
+        best, best_quality = "identity", 0.0
+        for encoding in ENCODINGS:
+            if encoding not in self.bodies:
+                continue
+            quality = accepted[encoding] if encoding != "identity" else 1e-3
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def is_fresh(self) -> bool:
+        """True if the client's validators say its cached copy is current"""
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            # Weak comparison, as RFC 9110 requires for If-None-Match
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return any(etag in tags for etag in self.etags.values())
+
+        if_modified_since = request.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def response(self) -> Response:
+        """Full, compressed or 304 response for the current request"""
+        encoding = self.choose_encoding()
+        headers = {
+            "ETag": self.etags[encoding],
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "no-cache",
+        }
+        if self.is_fresh():
+            return Response(status=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(self.bodies[encoding], mimetype=self.mimetype, headers=headers)
+
+
+class ListingCache:
+    """Holds the EncodedListing for the latest data version"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (version, listing), replaced as a unit so readers never see a mismatch
+        self._entry = (None, None)
+
+    def get(self, version, build: Callable[[], bytes], last_modified: float) -> EncodedListing:
+        cached_version, listing = self._entry
+        if cached_version == version:
+            return listing
+        with self._lock:
+            cached_version, listing = self._entry
+            if cached_version != version:
+                listing = EncodedListing(build(), last_modified)
+                self._entry = (version, listing)
+            return listing
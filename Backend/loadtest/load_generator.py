@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the Gas Station Finder backend
+Sends a mix of /search, /geocode and /travel-info requests at a target rate
+and reports per-endpoint throughput, error rate and p50/p95/p99 latency.
+
+Requests are scheduled at fixed intervals whether or not earlier ones have
+finished, and latency is measured from each request's scheduled start, so a
+slow upstream shows up in the tail instead of silently lowering the rate.
+
+Usage (from Backend/, with the backend and loadtest/upstream_stub.py running):
+    python loadtest/load_generator.py --url http://127.0.0.1:5000 --rps 200 --duration 30
+    python loadtest/load_generator.py --mix search=1 --rps 500 --output /tmp/load.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+import requests
+
+# Searches and trips start inside this box (Orange County, like stations.json)
+ORIGIN_BOX = (33.62, -117.95, 33.71, -117.86)
+STREETS = ["Harbor Blvd", "Bristol St", "Newport Blvd", "Fairview Rd", "Baker St", "17th St"]
+CITIES = ["Costa Mesa", "Newport Beach", "Santa Ana", "Fountain Valley"]
+SORTS = ["closest", "cheapest", "optimal"]
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+class Workload:
+    """Builds randomized request bodies for each endpoint"""
+
+    def __init__(self, base_url: str, seed: int, address_pool: int):
+        self.base_url = base_url.rstrip('/')
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.address_pool = address_pool
+        self.stations = self._fetch_stations()
+
+    def _fetch_stations(self) -> List[Dict]:
+        try:
+            response = requests.get(f"{self.base_url}/all-stations", timeout=10)
+            response.raise_for_status()
+            return response.json().get('results') or []
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠️ Could not fetch /all-stations ({e}); /travel-info will use random destinations")
+            return []
+
+    def _origin(self):
+        min_lat, min_lon, max_lat, max_lon = ORIGIN_BOX
+        return self.rng.uniform(min_lat, max_lat), self.rng.uniform(min_lon, max_lon)
+
+    def search(self):
+        with self.lock:
+            lat, lon = self._origin()
+            body = {'lat': lat, 'lon': lon, 'sort_by': self.rng.choice(SORTS),
+                    'gas_type': '87', 'radius': 10, 'limit': 20}
+        return 'POST', '/search', body
+
+    def geocode(self):
+        # Addresses repeat within a pool of this size, so caches see a realistic hit rate
+        with self.lock:
+            n = self.rng.randrange(self.address_pool)
+        address = f"{100 + n % 3000} {STREETS[n % len(STREETS)]}, {CITIES[n % len(CITIES)]}, CA"
+        return 'POST', '/geocode', {'address': address}
+
+    def travel_info(self):
+        with self.lock:
+            origin_lat, origin_lon = self._origin()
+            if self.stations:
+                station = self.rng.choice(self.stations)
+                dest_lat, dest_lon = station['lat'], station['lon']
+            else:
+                dest_lat, dest_lon = self._origin()
+        return 'POST', '/travel-info', {'origin_lat': origin_lat, 'origin_lon': origin_lon,
+                                        'dest_lat': dest_lat, 'dest_lon': dest_lon,
+                                        'mode': 'driving'}
+
+
+def _failed(response: requests.Response) -> bool:
+    """Non-2xx, or a 200 whose JSON body reports an error"""
+    if not response.ok:
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return isinstance(body, dict) and ('error' in body or body.get('success') is False)
+
+
+def run(base_url: str, rps: float, duration: float, mix: Dict[str, float], workers: int,
+        timeout: float, seed: int, address_pool: int) -> Dict:
+    workload = Workload(base_url, seed, address_pool)
+    builders = {'search': workload.search, 'geocode': workload.geocode,
+                'travel-info': workload.travel_info}
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    chooser = random.Random(seed + 1)
+
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+
+    def fire(name: str, scheduled: float):
+        method, path, body = builders[name]()
+        try:
+            response = _session().request(method, f"{workload.base_url}{path}", json=body,
+                                          timeout=timeout)
+            failed = _failed(response)
+        except requests.RequestException:
+            failed = True
+        latency = time.perf_counter() - scheduled
+        with lock:
+            samples[name].append(latency)
+            errors[name] += failed
+
+    total = int(rps * duration)
+    interval = 1.0 / rps
+    print(f"🚀 {total} requests at {rps:g} rps over {duration:g}s against {base_url}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(total):
+            scheduled = started + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, chooser.choices(names, weights)[0], scheduled)
+    elapsed = time.perf_counter() - started
+
+    report = {'url': base_url, 'target_rps': rps, 'duration_s': round(elapsed, 2),
+              'achieved_rps': round(total / elapsed, 2), 'endpoints': {}}
+    for name in names:
+        ms = np.array(samples[name]) * 1000
+        if not ms.size:
+            continue
+        report['endpoints'][name] = {
+            'requests': int(ms.size),
+            'errors': errors[name],
+            'error_rate': round(errors[name] / ms.size, 4),
+            'p50_ms': round(float(np.percentile(ms, 50)), 2),
+            'p95_ms': round(float(np.percentile(ms, 95)), 2),
+            'p99_ms': round(float(np.percentile(ms, 99)), 2),
+            'max_ms': round(float(ms.max()), 2),
+        }
+    return report
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ('search', 'geocode', 'travel-info'):
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Drive the backend at a target request rate.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Backend base URL")
+    parser.add_argument('--rps', type=float, default=50.0, help="Target requests per second")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to run")
+    parser.add_argument('--mix', type=_parse_mix, default='search=6,geocode=2,travel-info=2',
+                        help="Relative weights, e.g. search=6,geocode=2,travel-info=2")
+    parser.add_argument('--workers', type=int, default=256,
+                        help="Maximum requests in flight")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout (s)")
+    parser.add_argument('--address-pool', type=int, default=1000,
+                        help="Distinct addresses /geocode draws from")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.url, args.rps, args.duration, args.mix, args.workers, args.timeout,
+                 args.seed, args.address_pool)
+
+    print(f"\n📊 Achieved {report['achieved_rps']} rps (target {args.rps:g})")
+    for name, stats in report['endpoints'].items():
+        print(f"  {name:<12} {stats['requests']:>7} req   errors {stats['error_rate']:>7.2%}   "
+              f"p50 {stats['p50_ms']:>8.1f} ms   p95 {stats['p95_ms']:>8.1f} ms   "
+              f"p99 {stats['p99_ms']:>8.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
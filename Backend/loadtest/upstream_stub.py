@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Mapbox and Nominatim APIs
+Serves the geocoding, directions, directions-matrix and Nominatim search
+endpoints the backend calls, with synthetic but consistent answers, so the
+whole stack can be load-tested offline. Latency and error rate are
+configurable to exercise tail behavior when upstream is slow.
+
+Usage (from Backend/):
+    python loadtest/upstream_stub.py --port 8800 --latency-ms 80 --latency-sigma 0.5 --error-rate 0.01
+
+Then start the backend against it:
+    MAPBOX_BASE_URL=http://127.0.0.1:8800 NOMINATIM_DOMAIN=127.0.0.1:8800 NOMINATIM_SCHEME=http \\
+        GEOCODE_CACHE_PATH= python priceUpdater.py
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+from flask import Flask, abort, jsonify, request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from distance import METERS_PER_MILE, distance_miles
+
+app = Flask(__name__)
+
+# Geocoded addresses land inside this box (Orange County, like stations.json)
+GEOCODE_BOX = (33.60, -117.95, 33.72, -117.85)
+
+# Average speeds used to turn road distance into duration, and road/straight-line ratio
+PROFILE_SPEEDS_MPH = {'driving': 30.0, 'driving-traffic': 22.0, 'walking': 3.0, 'cycling': 11.0}
+ROAD_FACTOR = 1.3
+
+POI_BRANDS = ['Shell', 'Chevron', 'Arco', 'Mobil', '76', 'Valero', 'Costco', 'Speedway']
+
+settings = {'latency_ms': 0.0, 'latency_sigma': 0.0, 'error_rate': 0.0}
+_random = random.Random()
+_random_lock = threading.Lock()
+counters = {'requests': 0, 'errors': 0}
+
+
+@app.before_request
+def simulate_upstream():
+    """Sleep for a lognormal latency and fail a share of requests with 503"""
+    with _random_lock:
+        counters['requests'] += 1
+        latency = settings['latency_ms']
+        if latency and settings['latency_sigma']:
+            latency *= _random.lognormvariate(0.0, settings['latency_sigma'])
+        fail = _random.random() < settings['error_rate']
+        if fail:
+            counters['errors'] += 1
+    if latency:
+        time.sleep(latency / 1000.0)
+    if fail:
+        abort(503)
+
+
+def _point_for(text: str) -> Tuple[float, float]:
+    """Deterministic (lat, lon) in GEOCODE_BOX for a query string"""
+    digest = hashlib.sha256(text.strip().lower().encode('utf-8')).digest()
+    u = int.from_bytes(digest[:8], 'big') / 2**64
+    v = int.from_bytes(digest[8:16], 'big') / 2**64
+    min_lat, min_lon, max_lat, max_lon = GEOCODE_BOX
+    return min_lat + u * (max_lat - min_lat), min_lon + v * (max_lon - min_lon)
+
+
+def _parse_coordinates(path: str) -> List[Tuple[float, float]]:
+    """'lon,lat;lon,lat' path segment as [(lat, lon), ...]"""
+    try:
+        pairs = [pair.split(',') for pair in path.split(';')]
+        return [(float(lat), float(lon)) for lon, lat in pairs]
+    except ValueError:
+        abort(422)
+
+
+def _leg(origin: Tuple[float, float], destination: Tuple[float, float], profile: str):
+    """(duration seconds, distance meters) of a synthetic road route"""
+    miles = distance_miles(*origin, *destination) * ROAD_FACTOR
+    speed = PROFILE_SPEEDS_MPH.get(profile, PROFILE_SPEEDS_MPH['driving'])
+    return round(miles / speed * 3600, 1), round(miles * METERS_PER_MILE, 1)
+
+
+@app.route('/geocoding/v5/mapbox.places/<path:query>.json')
+def mapbox_geocoding(query):
+    limit = request.args.get('limit', 5, type=int)
+
+    if request.args.get('types') == 'poi' and request.args.get('proximity'):
+        # POI search: stations scattered within a few miles of the proximity point
+        lon, lat = (float(value) for value in request.args['proximity'].split(','))
+        seeded = random.Random(f"{query}:{lat:.3f}:{lon:.3f}")
+        features = []
+        for i in range(limit):
+            brand = seeded.choice(POI_BRANDS)
+            point_lat = lat + seeded.uniform(-0.05, 0.05)
+            point_lon = lon + seeded.uniform(-0.05, 0.05)
+            features.append({
+                'id': f"poi.{seeded.getrandbits(48)}",
+                'type': 'Feature',
+                'place_type': ['poi'],
+                'text': f"{brand} {query}",
+                'properties': {'name': f"{brand} Gas Station", 'category': 'gas station, fuel',
+                               'address': f"{seeded.randint(100, 9999)} Main St"},
+                'geometry': {'type': 'Point', 'coordinates': [point_lon, point_lat]},
+            })
+        return jsonify({'type': 'FeatureCollection', 'features': features})
+
+    lat, lon = _point_for(query)
+    return jsonify({'type': 'FeatureCollection', 'features': [{
+        'id': 'address.stub',
+        'type': 'Feature',
+        'place_name': query,
+        'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+    }][:limit]})
+
+
+@app.route('/directions/v5/mapbox/<profile>/<coordinates>')
+def mapbox_directions(profile, coordinates):
+    points = _parse_coordinates(coordinates)
+    if len(points) < 2:
+        abort(422)
+    duration, distance = _leg(points[0], points[-1], profile)
+    return jsonify({
+        'code': 'Ok',
+        'routes': [{
+            'duration': duration,
+            'distance': distance,
+            'summary': 'Stub Route',
+            'geometry': {'type': 'LineString', 'coordinates': [[lon, lat] for lat, lon in points]},
+            'legs': [{'duration': duration, 'distance': distance, 'steps': [], 'summary': 'Stub Route'}],
+        }],
+    })
+
+
+@app.route('/directions-matrix/v1/mapbox/<profile>/<coordinates>')
+def mapbox_matrix(profile, coordinates):
+    points = _parse_coordinates(coordinates)
+
+    def indices(name):
+        value = request.args.get(name, 'all')
+        return list(range(len(points))) if value == 'all' else [int(i) for i in value.split(';')]
+
+    sources, destinations = indices('sources'), indices('destinations')
+    legs = [[_leg(points[s], points[d], profile) for d in destinations] for s in sources]
+    waypoint = lambda i: {'name': '', 'location': [points[i][1], points[i][0]]}
+    return jsonify({
+        'code': 'Ok',
+        'durations': [[duration for duration, _ in row] for row in legs],
+        'distances': [[distance for _, distance in row] for row in legs],
+        'sources': [waypoint(i) for i in sources],
+        'destinations': [waypoint(i) for i in destinations],
+    })
+
+
+@app.route('/search')
+def nominatim_search():
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify([])
+    lat, lon = _point_for(query)
+    return jsonify([{
+        'place_id': int(hashlib.sha256(query.encode('utf-8')).hexdigest()[:8], 16),
+        'lat': f"{lat:.7f}",
+        'lon': f"{lon:.7f}",
+        'display_name': f"{query} (stub)",
+        'class': 'place',
+        'type': 'house',
+        'importance': 0.5,
+    }])
+
+
+@app.route('/stub-stats')
+def stub_stats():
+    return jsonify({**counters, **settings})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Mapbox/Nominatim stand-in server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help="Median added latency per request")
+    parser.add_argument('--latency-sigma', type=float, default=0.0,
+                        help="Lognormal shape of the latency (0 = fixed; 1 = heavy tail)")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Share of requests answered with 503 (0-1)")
+    parser.add_argument('--seed', type=int, help="Seed for latency and error sampling")
+    args = parser.parse_args(argv)
+
+    settings.update(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                    error_rate=args.error_rate)
+    _random.seed(args.seed)
+    print(f"🧪 Upstream stub on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms} ms, sigma {args.latency_sigma}, errors {args.error_rate:.1%})")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,107 @@ Provides real-time gas station data and travel information using Mapbox APIs
 
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import os
+import time
+
+from distance import haversine_miles
+from async_upstream import UpstreamError, shared_client
+from cache import GeocodeCache
+from metrics import upstream
+
+# Most coordinates (including the source) the Matrix API accepts per request
+MATRIX_MAX_COORDINATES = {
+    'driving': 25,
+    'walking': 25,
+    'cycling': 25,
+    'driving-traffic': 10
+}
+
+
+def _directions_request(base_url: str, access_token: str, origin: Tuple[float, float],
+                        destination: Tuple[float, float], profile: str) -> Tuple[str, Dict]:
+    """(url, params) of a Directions API call between two (lat, lon) points"""
+    # Mapbox expects lon,lat format
+    origin_coords = f"{origin[1]},{origin[0]}"  # lon,lat
+    dest_coords = f"{destination[1]},{destination[0]}"  # lon,lat
+
+    url = f"{base_url}/directions/v5/mapbox/{profile}/{origin_coords};{dest_coords}"
+
+    params = {
+        'access_token': access_token,
+        'geometries': 'geojson',
+        'overview': 'full',
+        'steps': 'true',
+    }
+    return url, params
+
+
+def _route_info(data: Dict, profile: str) -> Optional[Dict]:
+    """Route information from a Directions API response, or None if it has no route"""
+    if not data.get('routes'):
+        print("No routes found")
+        return None
+
+    route = data['routes'][0]
+    leg = route['legs'][0]
+
+    return {
+        'duration_text': f"{int(leg['duration'] / 60)} min",
+        'duration_seconds': leg['duration'],
+        'distance_text': f"{leg['distance'] / 1609.34:.1f} mi",
+        'distance_meters': leg['distance'],
+        'start_address': 'Origin',
+        'end_address': 'Destination',
+        'geometry': route.get('geometry'),
+        'steps': leg.get('steps', []),
+        'summary': route.get('summary', ''),
+        'profile': profile
+    }
+
+
+def _first_feature_point(data: Dict) -> Optional[Tuple[float, float]]:
+    """(lat, lon) of the first feature in a Geocoding API response, or None"""
+    if data.get('features'):
+        coordinates = data['features'][0]['geometry']['coordinates']
+        return coordinates[1], coordinates[0]  # lat, lon
+    return None
+
 
 class MapboxGasStationService:
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, geocode_cache: Optional[GeocodeCache] = None,
+                 max_workers: int = 8, request_timeout: float = 5.0,
+                 base_url: Optional[str] = None):
         self.access_token = access_token
-        self.base_url = "https://api.mapbox.com"
+        # MAPBOX_BASE_URL points the service at a stand-in (e.g. loadtest/upstream_stub.py)
+        self.base_url = (base_url or os.getenv('MAPBOX_BASE_URL', 'https://api.mapbox.com')).rstrip('/')
+        self.session = requests.Session()
+        self.geocode_cache = geocode_cache
+        # Shared, bounded pool for fanning out independent Mapbox requests
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mapbox")
+        self.request_timeout = request_timeout
+
+    def after_fork(self):
+        """
+        New connection pool and executor for a forked worker
+
+        Pooled sockets would otherwise be shared with the parent, and the
+        parent's executor threads do not exist in the child.
+        """
         self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mapbox")
+    
+    def _get(self, operation: str, url: str, params: Dict,
+             timeout: Optional[float] = None) -> requests.Response:
+        """GET a Mapbox endpoint, timed and counted under `operation`; raises on HTTP errors"""
+        with upstream('mapbox', operation):
+            response = self.session.get(url, params=params,
+                                        timeout=self.request_timeout if timeout is None else timeout)
+            response.raise_for_status()
+        return response
     
     def search_poi(self, lat: float, lon: float, radius: int = 5000, 
                poi_type: str = "gas_station") -> List[Dict]:
@@ -41,38 +133,79 @@ class MapboxGasStationService:
             "chevron"
         ]
         
+        # Run every query at once, bounded by one overall deadline. Each request's
+        # timeout is cut to the time left, so a thread still waiting on Mapbox
+        # at the deadline is freed by then instead of a full timeout later
+        deadline = time.monotonic() + self.request_timeout * 2
+        futures = [self.executor.submit(self._fetch_poi_features, query, lat, lon, deadline)
+                   for query in search_queries]
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        
         all_stations = []
+        seen = set()
         
-        for query in search_queries:
+        # Merge in query order so results are deterministic
+        for query, future in zip(search_queries, futures):
+            if future not in done:
+                future.cancel()
+                print(f"Timed out fetching POI data for '{query}'")
+                continue
             try:
-                url = f"{self.base_url}/geocoding/v5/mapbox.places/{query}.json"
-                
-                params = {
-                    'proximity': f"{lon},{lat}",
-                    'types': 'poi',
-                    'limit': 10,
-                    'access_token': self.access_token
-                }
-                
-                response = self.session.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                for feature in data.get('features', []):
-                    station_data = self._process_poi_data(feature, lat, lon)
-                    if station_data and self._is_gas_station(station_data):
-                        # Avoid duplicates
-                        if not any(s['name'] == station_data['name'] for s in all_stations):
-                            all_stations.append(station_data)
-                
+                features = future.result()
             except requests.RequestException as e:
                 print(f"Error fetching POI data for '{query}': {e}")
                 continue
+            
+            # Measure every feature in the response with one array operation
+            distances = haversine_miles(
+                lat, lon,
+                [f['geometry']['coordinates'][1] for f in features],
+                [f['geometry']['coordinates'][0] for f in features])
+            
+            for feature, distance in zip(features, distances.tolist()):
+                station_data = self._process_poi_data(feature, distance)
+                if station_data and self._is_gas_station(station_data):
+                    # Avoid duplicates: the same place comes back from several
+                    # queries, while different stations can share a brand name
+                    key = station_data['place_id'] or (round(station_data['lat'], 5),
+                                                       round(station_data['lon'], 5))
+                    if key not in seen:
+                        seen.add(key)
+                        all_stations.append(station_data)
         
         return all_stations
     
-    def _process_poi_data(self, feature: Dict, user_lat: float, user_lon: float) -> Optional[Dict]:
-        """Process Mapbox POI data into our format"""
+    def _fetch_poi_features(self, query: str, lat: float, lon: float,
+                            deadline: Optional[float] = None) -> List[Dict]:
+        """
+        Run one POI geocoding query and return its features that have coordinates
+
+        With a deadline (time.monotonic() value) the request's connect and read
+        timeouts are cut to the time left, and raise requests.Timeout once it
+        has passed.
+        """
+        timeout = None
+        if deadline is not None:
+            timeout = min(self.request_timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise requests.Timeout(f"deadline passed before '{query}' was sent")
+        url = f"{self.base_url}/geocoding/v5/mapbox.places/{query}.json"
+        
+        params = {
+            'proximity': f"{lon},{lat}",
+            'types': 'poi',
+            'limit': 10,
+            'access_token': self.access_token
+        }
+        
+        response = self._get('poi_search', url, params, timeout)
+        data = response.json()
+        
+        return [f for f in data.get('features', [])
+                if len(f.get('geometry', {}).get('coordinates', [])) >= 2]
+    
+    def _process_poi_data(self, feature: Dict, distance: float) -> Optional[Dict]:
+        """Process Mapbox POI data into our format, given its distance in miles from the user"""
         try:
             # Extract basic information
             properties = feature.get('properties', {})
@@ -92,9 +225,6 @@ class MapboxGasStationService:
             category = properties.get('category', '')
             brand = self._extract_brand_from_category(category, name)
             
-            # Calculate distance
-            distance = self._calculate_distance(user_lat, user_lon, lat, lon)
-            
             return {
                 'name': name,
                 'brand': brand,
@@ -149,24 +279,6 @@ class MapboxGasStationService:
         
         return 'Other'
     
-    def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """Calculate distance between two points in miles using Haversine formula"""
-        import math
-        
-        R = 3959  # Earth's radius in miles
-        
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lon = math.radians(lon2 - lon1)
-        
-        a = (math.sin(delta_lat / 2) ** 2 + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * 
-             math.sin(delta_lon / 2) ** 2)
-        c = 2 * math.asin(math.sqrt(a))
-        
-        return R * c
-    
     def _get_fuel_prices(self) -> Dict[str, float]:
         """
         Get fuel prices for a gas station
@@ -194,75 +306,42 @@ class MapboxGasStationService:
         Returns:
             Dict with route information
         """
-        # Mapbox expects lon,lat format
-        origin_coords = f"{origin[1]},{origin[0]}"  # lon,lat
-        dest_coords = f"{destination[1]},{destination[0]}"  # lon,lat
-
-        url = f"{self.base_url}/directions/v5/mapbox/{profile}/{origin_coords};{dest_coords}"
-
-        params = {
-            'access_token': self.access_token,
-            'geometries': 'geojson',
-            'overview': 'full',
-            'steps': 'true',
-        }
+        url, params = _directions_request(self.base_url, self.access_token,
+                                          origin, destination, profile)
         
         try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('routes'):
-                route = data['routes'][0]
-                leg = route['legs'][0]
-                
-                return {
-                    'duration_text': f"{int(leg['duration'] / 60)} min",
-                    'duration_seconds': leg['duration'],
-                    'distance_text': f"{leg['distance'] / 1609.34:.1f} mi",
-                    'distance_meters': leg['distance'],
-                    'start_address': 'Origin',
-                    'end_address': 'Destination',
-                    'geometry': route.get('geometry'),
-                    'steps': leg.get('steps', []),
-                    'summary': route.get('summary', ''),
-                    'profile': profile
-                }
-            else:
-                print("No routes found")
-                return None
-                
+            response = self._get('directions', url, params)
+            return _route_info(response.json(), profile)
         except requests.RequestException as e:
             print(f"Error getting directions: {e}")
             return None
     
     def get_matrix(self, coordinates: List[Tuple[float, float]], 
-                   profile: str = 'driving') -> Optional[Dict]:
+                   profile: str = 'driving', destinations: str = 'all') -> Optional[Dict]:
         """
         Get travel time matrix between multiple points
         
         Args:
             coordinates: List of (lat, lon) tuples
             profile: 'driving', 'walking', 'cycling'
+            destinations: 'all' or ';'-separated coordinate indices
         
         Returns:
             Matrix with travel times and distances
         """
-        url = f"{self.base_url}/directions-matrix/v1/mapbox/{profile}"
-        
-        # Convert to lon,lat format
+        # Mapbox expects lon,lat pairs in the URL path
         coords_str = ";".join([f"{lon},{lat}" for lat, lon in coordinates])
+        url = f"{self.base_url}/directions-matrix/v1/mapbox/{profile}/{coords_str}"
         
         params = {
-            'coordinates': coords_str,
             'access_token': self.access_token,
             'sources': '0',  # First coordinate is source
-            'destinations': 'all'
+            'destinations': destinations,
+            'annotations': 'duration,distance'
         }
         
         try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
+            response = self._get('matrix', url, params)
             data = response.json()
             
             return {
@@ -276,6 +355,50 @@ class MapboxGasStationService:
             print(f"Error getting matrix: {e}")
             return None
     
+    def get_travel_times(self, origin: Tuple[float, float],
+                         destinations: List[Tuple[float, float]],
+                         profile: str = 'driving') -> List[Optional[Dict]]:
+        """
+        Road travel time and distance from one origin to many destinations
+        
+        Destinations are split into chunks that fit the Matrix API's coordinate
+        limit (the origin takes one slot per chunk), and the chunks are
+        requested in parallel.
+        
+        Args:
+            origin: (lat, lon) of starting point
+            destinations: List of (lat, lon) tuples
+            profile: 'driving', 'walking', 'cycling', 'driving-traffic'
+        
+        Returns:
+            One {'duration_seconds', 'distance_meters'} dict per destination, in
+            order; None where Mapbox had no route or the chunk failed
+        """
+        chunk_size = MATRIX_MAX_COORDINATES.get(profile, 25) - 1
+        chunks = [destinations[i:i + chunk_size]
+                  for i in range(0, len(destinations), chunk_size)]
+        
+        futures = [
+            self.executor.submit(
+                self.get_matrix, [origin] + chunk, profile,
+                ";".join(str(j) for j in range(1, len(chunk) + 1)))
+            for chunk in chunks
+        ]
+        
+        results: List[Optional[Dict]] = []
+        for chunk, future in zip(chunks, futures):
+            matrix = future.result()
+            durations = (matrix or {}).get('durations') or [[]]
+            distances = (matrix or {}).get('distances') or [[]]
+            for j in range(len(chunk)):
+                duration = durations[0][j] if j < len(durations[0]) else None
+                distance = distances[0][j] if j < len(distances[0]) else None
+                if duration is None:
+                    results.append(None)
+                else:
+                    results.append({'duration_seconds': duration, 'distance_meters': distance})
+        return results
+    
     def geocode_address(self, address: str) -> Optional[Tuple[float, float]]:
         """
         Geocode an address to coordinates
@@ -286,6 +409,16 @@ class MapboxGasStationService:
         Returns:
             (lat, lon) tuple or None
         """
+        try:
+            if self.geocode_cache is not None:
+                return self.geocode_cache.lookup('mapbox', address, self._fetch_geocode)
+            return self._fetch_geocode(address)
+        except requests.RequestException as e:
+            print(f"Error geocoding address: {e}")
+            return None
+    
+    def _fetch_geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        """Live Mapbox geocoding call; raises requests.RequestException on failure"""
         url = f"{self.base_url}/geocoding/v5/mapbox.places/{address}.json"
         
         params = {
@@ -293,21 +426,8 @@ class MapboxGasStationService:
             'limit': 1
         }
         
-        try:
-            response = self.session.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('features'):
-                feature = data['features'][0]
-                coordinates = feature['geometry']['coordinates']
-                return coordinates[1], coordinates[0]  # lat, lon
-            else:
-                return None
-                
-        except requests.RequestException as e:
-            print(f"Error geocoding address: {e}")
-            return None
+        response = self._get('geocode', url, params)
+        return _first_feature_point(response.json())
     
     def search_with_filters(self, lat: float, lon: float, radius: int = 5000,
                            brand_filter: str = None) -> List[Dict]:
@@ -335,6 +455,56 @@ class MapboxGasStationService:
         
         return stations
 
+
+class AsyncMapboxGasStationService:
+    """
+    Coroutine versions of the per-request Mapbox calls (directions, geocoding)
+
+    Requests go through the running event loop's pooled client (see
+    async_upstream.py), so a waiting call holds a coroutine, not a thread.
+    Answers are the same as MapboxGasStationService's.
+    """
+
+    def __init__(self, access_token: str, geocode_cache: Optional[GeocodeCache] = None,
+                 request_timeout: float = 5.0, base_url: Optional[str] = None):
+        self.access_token = access_token
+        self.base_url = (base_url or os.getenv('MAPBOX_BASE_URL', 'https://api.mapbox.com')).rstrip('/')
+        self.geocode_cache = geocode_cache
+        self.request_timeout = request_timeout
+
+    async def _get_json(self, operation: str, url: str, params: Dict) -> Dict:
+        """GET a Mapbox endpoint, timed and counted under `operation`; raises UpstreamError"""
+        with upstream('mapbox', operation):
+            return await shared_client().get_json(url, params=params, timeout=self.request_timeout)
+
+    async def get_directions(self, origin: Tuple[float, float], destination: Tuple[float, float],
+                             profile: str = 'driving') -> Optional[Dict]:
+        """Route information between two (lat, lon) points, or None"""
+        url, params = _directions_request(self.base_url, self.access_token,
+                                          origin, destination, profile)
+        try:
+            return _route_info(await self._get_json('directions', url, params), profile)
+        except UpstreamError as e:
+            print(f"Error getting directions: {e}")
+            return None
+
+    async def geocode_address(self, address: str) -> Optional[Tuple[float, float]]:
+        """(lat, lon) of an address, or None"""
+        try:
+            if self.geocode_cache is not None:
+                return await self.geocode_cache.lookup_async('mapbox', address, self._fetch_geocode)
+            return await self._fetch_geocode(address)
+        except UpstreamError as e:
+            print(f"Error geocoding address: {e}")
+            return None
+
+    async def _fetch_geocode(self, address: str) -> Optional[Tuple[float, float]]:
+        """Live Mapbox geocoding call; raises UpstreamError on failure"""
+        url = f"{self.base_url}/geocoding/v5/mapbox.places/{address}.json"
+        data = await self._get_json('geocode', url, {'access_token': self.access_token, 'limit': 1})
+        return _first_feature_point(data)
+
+
 # Example usage and testing
 def main():
     # Get access token from environment variable
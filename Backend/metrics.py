@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Request instrumentation for the Gas Station Finder
+Timing spans around request stages and outbound API calls, reported per
+request in a Server-Timing header and aggregated into Prometheus-format
+counters and latency histograms for /metrics
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from flask import Flask, g, has_request_context, request
+
+# Histogram upper bounds in seconds, from sub-millisecond stages to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (counts per bucket, not yet cumulative)"""
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.total = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms
+
+    Recording is a dict lookup and a few additions under one lock, so it can
+    stay on in production. Collectors add values that are read at scrape time
+    (cache statistics, snapshot size) instead of being pushed on every change.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _labels(**labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _labels(**labels)
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(len(self.buckets) + 1)
+            histogram.counts[bucket] += 1
+            histogram.total += seconds
+            histogram.count += 1
+
+    def add_collector(self, collect: Callable[[], Iterable[tuple]]):
+        """
+        Register a scrape-time source of values
+
+        collect() yields (name, type, help, labels dict, value) tuples, where
+        type is 'counter' or 'gauge'.
+        """
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {labels: (list(h.counts), h.total, h.count)
+                                 for labels, h in series.items()}
+                          for name, series in self._histograms.items()}
+
+        for name in sorted(counters):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for name in sorted(histograms):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, (counts, total, count) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(labels, f'le="{bound:g}"')
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _format_labels(labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{bucket_labels} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        collected: Dict[str, list] = {}
+        for collect in self._collectors:
+            for name, kind, help_text, labels, value in collect():
+                collected.setdefault(name, [kind, help_text, []])[2].append((labels, value))
+        for name, (kind, help_text, samples) in sorted(collected.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = _format_labels(tuple((k, _escape(str(v))) for k, v in sorted(labels.items())))
+                lines.append(f"{name}{label_text} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by the app and the API clients
+metrics = Metrics()
+metrics.describe("http_requests_total", "HTTP requests by endpoint, method and status")
+metrics.describe("http_request_duration_seconds", "HTTP request latency by endpoint")
+metrics.describe("stage_duration_seconds", "Time spent in each request stage")
+metrics.describe("upstream_requests_total", "Outbound API calls by service and operation")
+metrics.describe("upstream_errors_total", "Outbound API calls that raised or returned an HTTP error")
+metrics.describe("upstream_duration_seconds", "Outbound API call latency by service and operation")
+
+
+def _record_span(name: str, elapsed: float):
+    """Remember a span on the current request for its Server-Timing header"""
+    if has_request_context():
+        spans = g.get("_spans")
+        if spans is None:
+            spans = g._spans = {}
+        spans[name] = spans.get(name, 0.0) + elapsed
+
+
+class span:
+    """
+    Time a stage of request handling
+
+        with span("sort"):
+            order = top_k(...)
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        metrics.observe("stage_duration_seconds", elapsed, stage=self.name)
+        _record_span(self.name, elapsed)
+        return False
+
+
+class upstream:
+    """
+    Time one outbound API call and count it, and count it as an error if it raises
+
+        with upstream("mapbox", "directions"):
+            response = session.get(...)
+            response.raise_for_status()
+    """
+    __slots__ = ("service", "operation", "start")
+
+    def __init__(self, service: str, operation: str):
+        self.service = service
+        self.operation = operation
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        metrics.inc("upstream_requests_total", service=self.service, operation=self.operation)
+        if exc_type is not None:
+            metrics.inc("upstream_errors_total", service=self.service, operation=self.operation)
+        metrics.observe("upstream_duration_seconds", elapsed,
+                        service=self.service, operation=self.operation)
+        # Calls made on worker threads have no request; they only feed the histogram
+        _record_span(self.service, elapsed)
+        return False
+
+
+def instrument(app: Flask, server_timing: bool = None):
+    """
+    Count and time every request, and add a Server-Timing header listing its spans
+
+    Set SERVER_TIMING=0 to keep the metrics but leave the header off responses.
+    """
+    if server_timing is None:
+        server_timing = os.getenv("SERVER_TIMING", "1") != "0"
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_timer(response):
+        start = g.get("_request_start")
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or "unmatched"
+        metrics.inc("http_requests_total", endpoint=endpoint, method=request.method,
+                    status=response.status_code)
+        metrics.observe("http_request_duration_seconds", elapsed, endpoint=endpoint)
+
+        if server_timing:
+            entries = [f"{name};dur={seconds * 1000:.2f}"
+                       for name, seconds in (g.get("_spans") or {}).items()]
+            # Streamed bodies are still being produced, so "total" covers the handler only
+            entries.append(f"total;dur={elapsed * 1000:.2f}")
+            response.headers["Server-Timing"] = ", ".join(entries)
+        return response
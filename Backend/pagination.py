@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Cursor pagination and NDJSON streaming helpers shared by the Flask apps
+"""
+
+import base64
+import json
+from typing import Dict, Iterable, Optional
+
+from flask import Response, current_app, request, stream_with_context
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# NDJSON pages have no envelope, so the next page's cursor travels in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(position: Dict) -> str:
+    """Opaque, URL-safe cursor for a position in a stable ordering"""
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict:
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def wants_ndjson(options: Dict = None) -> bool:
+    """True if the client asked for NDJSON via ?format=, a body field or the Accept header"""
+    requested = (options or {}).get('format') or request.args.get('format')
+    if requested:
+        return requested == 'ndjson'
+    # JSON is listed first so wildcards like */* keep getting plain JSON
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def ndjson_response(items: Iterable, encoded: bool = False,
+                    next_cursor: Optional[str] = None) -> Response:
+    """
+    Stream items as newline-delimited JSON, encoding each one as it is produced
+
+    With encoded=True the items are already JSON texts and are sent as they are.
+    A next_cursor is sent in the X-Next-Cursor header; a paged response without
+    the header is the last page.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        if encoded:
+            for item in items:
+                yield item + "\n"
+            return
+        for item in items:
+            yield dumps(item, separators=(',', ':')) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
@@ -1,6 +1,16 @@
+import argparse
 import json
 import csv
 import random
+from collections import Counter
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from atomic_file import atomic_open, atomic_path
+from station_repository import DEFAULT_TILE_PRECISION, SQLiteStationRepository, TiledStationRepository
+from station_repository import save_as_json as write_json_atomically
+from station_store import JSON_GRADE_KEYS, StationStore
 
 # --- Configuration ---
 OUTPUT_JSON_FILE = 'stations.json'
@@ -137,11 +147,28 @@ def generate_station_data():
 
 def save_as_json(stations_dict, filename):
     """Saves the station dictionary as a JSON file."""
-    with open(filename, 'w') as f:
-        # The stations_dict is already in the format { "OC-001": {...}, ... }
-        json.dump(stations_dict, f, indent=2)
+    # The stations_dict is already in the format { "OC-001": {...}, ... }; it is
+    # written to a temp file and renamed, so a running server never reads half of it
+    write_json_atomically(stations_dict, filename)
+    print(f"Successfully generated {filename}")
+
+def save_as_binary(stations_dict, filename):
+    """Saves the station dictionary in the memory-mapped binary format (see binary_store.py)."""
+    StationStore.from_json_dict(stations_dict).save_binary(filename)
+    print(f"Successfully generated {filename}")
+
+def save_as_sqlite(stations_dict, filename):
+    """Writes the stations into an SQLite database, updating only what changed if it exists."""
+    repository = SQLiteStationRepository(filename)
+    repository.replace(stations_dict)
+    repository.close()
     print(f"Successfully generated {filename}")
 
+def save_as_tiles(stations_dict, directory, precision=DEFAULT_TILE_PRECISION):
+    """Writes the stations as a directory of geohash tiles, rewriting only the tiles that changed."""
+    TiledStationRepository(directory, precision).replace(stations_dict)
+    print(f"Successfully generated {directory}")
+
 def save_as_csv(stations_dict, filename):
     """Saves the station data as a CSV file."""
     if not stations_dict:
@@ -176,10 +203,274 @@ def save_as_csv(stations_dict, filename):
             
     print(f"Successfully generated {filename}")
 
+# --- Bulk synthetic data for load testing ---
+
+# Metro areas for bulk generation: center, spread (standard deviation in
+# degrees), relative share of stations and ZIP prefix
+METRO_AREAS = {
+    "Orange County": {"lat": 33.70, "lon": -117.85, "spread": 0.12, "weight": 3, "zip": "926"},
+    "Los Angeles": {"lat": 34.05, "lon": -118.25, "spread": 0.25, "weight": 10, "zip": "900"},
+    "San Diego": {"lat": 32.72, "lon": -117.16, "spread": 0.15, "weight": 3, "zip": "921"},
+    "San Francisco": {"lat": 37.77, "lon": -122.42, "spread": 0.15, "weight": 4, "zip": "941"},
+    "Phoenix": {"lat": 33.45, "lon": -112.07, "spread": 0.20, "weight": 4, "zip": "850"},
+    "Las Vegas": {"lat": 36.17, "lon": -115.14, "spread": 0.12, "weight": 2, "zip": "891"},
+    "Seattle": {"lat": 47.61, "lon": -122.33, "spread": 0.15, "weight": 3, "zip": "981"},
+    "Denver": {"lat": 39.74, "lon": -104.99, "spread": 0.15, "weight": 3, "zip": "802"},
+    "Dallas": {"lat": 32.78, "lon": -96.80, "spread": 0.25, "weight": 6, "zip": "752"},
+    "Chicago": {"lat": 41.88, "lon": -87.63, "spread": 0.20, "weight": 7, "zip": "606"},
+    "Atlanta": {"lat": 33.75, "lon": -84.39, "spread": 0.20, "weight": 5, "zip": "303"},
+    "New York": {"lat": 40.71, "lon": -74.01, "spread": 0.20, "weight": 12, "zip": "100"},
+}
+
+# The brand mix follows how often each brand appears in STATION_DEFINITIONS
+_BRAND_COUNTS = Counter(station_def['brand'] for station_def in STATION_DEFINITIONS)
+BULK_BRANDS = list(_BRAND_COUNTS)
+BULK_BRAND_WEIGHTS = np.array([_BRAND_COUNTS[brand] for brand in BULK_BRANDS], dtype=np.float64)
+BULK_BRAND_WEIGHTS /= BULK_BRAND_WEIGHTS.sum()
+BULK_BRAND_PREMIUMS = np.array([BRAND_PREMIUMS.get(brand, 0.0) for brand in BULK_BRANDS])
+
+STREET_NAMES = ["Main St", "Harbor Blvd", "Bristol St", "Newport Blvd", "Fairview Rd",
+                "Baker St", "Broadway", "Park Ave", "Oak St", "Maple Ave", "Elm St",
+                "Washington Blvd", "Lincoln Ave", "Central Ave", "Market St", "Airport Rd"]
+
+BULK_CHUNK_SIZE = 100_000
+
+def generate_bulk_stations(count: int, metros: Optional[Sequence[str]] = None,
+                           bbox: Optional[Tuple[float, float, float, float]] = None,
+                           seed: Optional[int] = None,
+                           chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Generates `count` synthetic stations as column chunks of at most `chunk_size` rows.
+
+    Stations are spread uniformly over bbox (min_lat, min_lon, max_lat, max_lon)
+    if given, otherwise clustered around the named metro areas (all of them by
+    default). Prices follow the same model as generate_station_data, with one
+    base price per metro area. The same seed and chunk_size always give the
+    same stations.
+    """
+    rng = np.random.default_rng(seed)
+    if bbox is None:
+        names = list(metros or METRO_AREAS)
+        areas = [METRO_AREAS[name] for name in names]
+        area_weights = np.array([area['weight'] for area in areas], dtype=np.float64)
+        area_weights /= area_weights.sum()
+        centers = np.array([(area['lat'], area['lon']) for area in areas])
+        spreads = np.array([area['spread'] for area in areas])
+        zip_prefixes = np.array([int(area['zip']) for area in areas])
+        base_prices = rng.uniform(4.80, 5.10, size=len(areas))
+    else:
+        base_price = rng.uniform(4.80, 5.10)
+
+    for start in range(0, count, chunk_size):
+        n = min(chunk_size, count - start)
+
+        if bbox is None:
+            area = rng.choice(len(areas), size=n, p=area_weights)
+            lats = centers[area, 0] + rng.normal(0.0, spreads[area])
+            lons = centers[area, 1] + rng.normal(0.0, spreads[area])
+            zips = zip_prefixes[area] * 100 + rng.integers(0, 100, size=n)
+            base = base_prices[area]
+        else:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            lats = rng.uniform(min_lat, max_lat, size=n)
+            lons = rng.uniform(min_lon, max_lon, size=n)
+            zips = rng.integers(10000, 100000, size=n)
+            base = base_price
+
+        brand = rng.choice(len(BULK_BRANDS), size=n, p=BULK_BRAND_WEIGHTS)
+        station_randomness = rng.uniform(-0.05, 0.05, size=n)
+
+        # --- Generate Prices ---
+        regular = np.round(base + BULK_BRAND_PREMIUMS[brand] + station_randomness, 2)
+        yield {
+            "index": np.arange(start, start + n),
+            "brand": brand,
+            "street_number": rng.integers(100, 20000, size=n),
+            "street": rng.integers(0, len(STREET_NAMES), size=n),
+            "zip_code": zips,
+            "latitude": np.round(lats, 6),
+            "longitude": np.round(lons, 6),
+            "regular": regular,
+            "midgrade": np.round(regular + 0.20, 2),
+            "premium": np.round(regular + 0.40, 2),
+            # 70% chance of having diesel, 25% chance of having E85
+            "diesel": np.where(rng.random(n) < 0.7, np.round(regular + 0.60, 2), np.nan),
+            "e85": np.where(rng.random(n) < 0.25, np.round(regular - 0.50, 2), np.nan),
+        }
+
+def _bulk_rows(chunk: Dict[str, np.ndarray], id_width: int):
+    """Row tuples for one chunk, in save_as_csv column order (None for missing prices)"""
+    def prices(name):
+        return [None if price != price else price for price in chunk[name].tolist()]
+
+    ids = [f"SYN-{i:0{id_width}d}" for i in chunk["index"].tolist()]
+    brands = [BULK_BRANDS[b] for b in chunk["brand"].tolist()]
+    streets = [f"{number} {STREET_NAMES[s]}"
+               for number, s in zip(chunk["street_number"].tolist(), chunk["street"].tolist())]
+    zips = [f"{z:05d}" for z in chunk["zip_code"].tolist()]
+    return zip(ids, brands, streets, zips, chunk["latitude"].tolist(), chunk["longitude"].tolist(),
+               chunk["regular"].tolist(), chunk["midgrade"].tolist(), chunk["premium"].tolist(),
+               prices("diesel"), prices("e85"))
+
+def stream_bulk_json(chunks, filename, count):
+    """Streams generated chunks to a JSON file in the stations.json layout, one station per line."""
+    id_width = max(7, len(str(count)))
+    # Brands are a small fixed set, so encode each one once
+    encoded_brands = {brand: json.dumps(brand) for brand in BULK_BRANDS}
+    json_price = lambda price: 'null' if price is None else repr(price)
+
+    with atomic_open(filename, buffering=1 << 20) as f:
+        f.write("{")
+        separator = "\n"
+        for chunk in chunks:
+            lines = []
+            for (station_id, brand, street, zip_code, lat, lon,
+                 regular, midgrade, premium, diesel, e85) in _bulk_rows(chunk, id_width):
+                lines.append(
+                    f'{separator}"{station_id}": {{"station_id": "{station_id}", '
+                    f'"brand_name": {encoded_brands[brand]}, '
+                    f'"address": {{"street": "{street}", "zip_code": "{zip_code}"}}, '
+                    f'"location": {{"latitude": {lat!r}, "longitude": {lon!r}}}, '
+                    f'"prices": {{"regular": {regular!r}, "midgrade": {midgrade!r}, '
+                    f'"premium": {premium!r}, "diesel": {json_price(diesel)}, '
+                    f'"e85": {json_price(e85)}}}}}')
+                separator = ",\n"
+            f.write("".join(lines))
+        f.write("\n}\n")
+    print(f"Successfully generated {filename}")
+
+def stream_bulk_csv(chunks, filename, count):
+    """Streams generated chunks to a CSV file with the same columns as save_as_csv."""
+    id_width = max(7, len(str(count)))
+    headers = [
+        'station_id', 'brand_name', 'street_address', 'zip_code',
+        'latitude', 'longitude', 'regular_price', 'midgrade_price',
+        'premium_price', 'diesel_price', 'e85_price'
+    ]
+    with atomic_open(filename, newline='', buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        for chunk in chunks:
+            writer.writerows(_bulk_rows(chunk, id_width))
+    print(f"Successfully generated {filename}")
+
+def _chunk_text_columns(chunk, id_width):
+    """(station ids, brands, addresses, zip codes) lists for one chunk, as StationStore takes them"""
+    ids, brands, addresses, zips = [], [], [], []
+    for station_id, brand, street, zip_code, *_ in _bulk_rows(chunk, id_width):
+        ids.append(station_id)
+        brands.append(brand)
+        addresses.append(f"{street}, {zip_code}")
+        zips.append(zip_code)
+    return ids, brands, addresses, zips
+
+def _bulk_store(chunks, count):
+    """Builds one StationStore from generated chunks."""
+    id_width = max(7, len(str(count)))
+    columns = {'ids': [], 'brands': [], 'addresses': [], 'zips': []}
+    arrays = {name: [] for name in ('latitude', 'longitude', 'regular', 'midgrade', 'premium', 'diesel', 'e85')}
+    for chunk in chunks:
+        for name, values in zip(columns, _chunk_text_columns(chunk, id_width)):
+            columns[name].extend(values)
+        for name, parts in arrays.items():
+            parts.append(chunk[name])
+    arrays = {name: np.concatenate(parts) if parts else np.empty(0) for name, parts in arrays.items()}
+
+    prices = {grade: arrays[key] for grade, key in JSON_GRADE_KEYS.items()}
+    return StationStore(columns['ids'], columns['brands'], columns['addresses'], columns['zips'],
+                        arrays['latitude'], arrays['longitude'], prices)
+
+def save_bulk_binary(chunks, filename, count):
+    """Builds a store from generated chunks and saves it in the memory-mapped binary format."""
+    _bulk_store(chunks, count).save_binary(filename)
+    print(f"Successfully generated {filename}")
+
+def save_bulk_tiles(chunks, directory, count, precision=DEFAULT_TILE_PRECISION):
+    """Builds a store from generated chunks and splits it into geohash tiles."""
+    TiledStationRepository(directory, precision).replace_store(_bulk_store(chunks, count))
+    print(f"Successfully generated {directory}")
+
+def save_bulk_sqlite(chunks, filename, count):
+    """Loads generated chunks into a new SQLite station database, one chunk at a time."""
+    id_width = max(7, len(str(count)))
+    # Built under a temporary name and renamed, like the other outputs
+    with atomic_path(filename, suffix='.sqlite3') as temp_path:
+        repository = SQLiteStationRepository(temp_path)
+        for chunk in chunks:
+            ids, brands, addresses, zips = _chunk_text_columns(chunk, id_width)
+            prices = {grade: chunk[key] for grade, key in JSON_GRADE_KEYS.items()}
+            repository.append(StationStore(ids, brands, addresses, zips,
+                                           chunk['latitude'], chunk['longitude'], prices))
+        repository.close()
+    print(f"Successfully generated {filename}")
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate station price data. With --stations, generate a large "
+                    "synthetic catalog for load testing instead of the 43 real stations.")
+    parser.add_argument('--stations', type=int, help="Number of synthetic stations to generate")
+    parser.add_argument('--metros', help="Comma-separated metro areas to cluster stations around "
+                                         f"(default: all of {', '.join(METRO_AREAS)})")
+    parser.add_argument('--bbox', help="Spread stations uniformly over min_lat,min_lon,max_lat,max_lon")
+    parser.add_argument('--seed', type=int, help="Random seed, for reproducible datasets")
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE,
+                        help="Stations generated and written per chunk")
+    parser.add_argument('--json', default=OUTPUT_JSON_FILE, help="JSON output path ('' to skip)")
+    parser.add_argument('--csv', default=OUTPUT_CSV_FILE, help="CSV output path ('' to skip)")
+    parser.add_argument('--binary', help="Also write the memory-mapped binary format to this path")
+    parser.add_argument('--sqlite', help="Also write an SQLite station database to this path")
+    parser.add_argument('--tiles', help="Also write a directory of geohash tiles to this path")
+    parser.add_argument('--tile-precision', type=int, default=DEFAULT_TILE_PRECISION,
+                        help="Geohash length of each tile (default: %(default)s, about 20 x 39 km)")
+    args = parser.parse_args(argv)
+
+    if args.metros:
+        args.metros = [name.strip() for name in args.metros.split(',')]
+        unknown = [name for name in args.metros if name not in METRO_AREAS]
+        if unknown:
+            parser.error(f"unknown metro area(s): {', '.join(unknown)}")
+    if args.bbox:
+        try:
+            args.bbox = tuple(float(value) for value in args.bbox.split(','))
+        except ValueError:
+            args.bbox = ()
+        if len(args.bbox) != 4:
+            parser.error("--bbox needs four numbers: min_lat,min_lon,max_lat,max_lon")
+    return args
+
 # --- Main execution ---
 if __name__ == "__main__":
-    station_data_dict = generate_station_data()
-    
-    # Save both files
-    save_as_json(station_data_dict, OUTPUT_JSON_FILE)
-    save_as_csv(station_data_dict, OUTPUT_CSV_FILE)
\ No newline at end of file
+    args = _parse_args()
+
+    if args.stations:
+        # Each output regenerates the same chunks from the seed, so nothing is
+        # ever held in memory beyond one chunk
+        seed = args.seed if args.seed is not None else random.randrange(2**32)
+        options = dict(metros=args.metros, bbox=args.bbox, seed=seed, chunk_size=args.chunk_size)
+        if args.json:
+            stream_bulk_json(generate_bulk_stations(args.stations, **options), args.json, args.stations)
+        if args.csv:
+            stream_bulk_csv(generate_bulk_stations(args.stations, **options), args.csv, args.stations)
+        if args.binary:
+            save_bulk_binary(generate_bulk_stations(args.stations, **options), args.binary, args.stations)
+        if args.sqlite:
+            save_bulk_sqlite(generate_bulk_stations(args.stations, **options), args.sqlite, args.stations)
+        if args.tiles:
+            save_bulk_tiles(generate_bulk_stations(args.stations, **options), args.tiles, args.stations,
+                            args.tile_precision)
+    else:
+        if args.seed is not None:
+            random.seed(args.seed)
+        station_data_dict = generate_station_data()
+
+        # Save both files
+        if args.json:
+            save_as_json(station_data_dict, args.json)
+        if args.csv:
+            save_as_csv(station_data_dict, args.csv)
+        if args.binary:
+            save_as_binary(station_data_dict, args.binary)
+        if args.sqlite:
+            save_as_sqlite(station_data_dict, args.sqlite)
+        if args.tiles:
+            save_as_tiles(station_data_dict, args.tiles, args.tile_precision)
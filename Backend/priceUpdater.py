@@ -4,26 +4,47 @@ Web-based Gas Station Finder using Flask
 This version provides a web GUI that works without tkinter
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Response, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 import requests
 from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
 import json
 import random
-from typing import List, Dict
+from typing import List, Dict, Optional
 import math
+import numpy as np
 import os
+import asyncio
 import sys
+import threading
+import time
 from dotenv import load_dotenv
-from mapbox_integration import MapboxGasStationService
+from mapbox_integration import AsyncMapboxGasStationService, MapboxGasStationService
+from station_store import StationStore, grade_key, reseed_versions
+from station_repository import FileStationRepository, open_repository
+from ranking import cheapest_trips, cheapest_within, top_k, trip_costs
+from distance import distance_miles
+from cache import DirectionsCache, GeocodeCache, MISSING
+from listing_cache import ListingCache
+from price_feed import PriceFeed, format_sse
+from price_history import MAX_TIMESTAMP, PriceHistory, downsample
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, ndjson_response, wants_ndjson
+from metrics import instrument, metrics, span, upstream
+from serialization import FragmentCache, can_splice, encode_envelope, json_response
+import async_upstream
+from async_upstream import AsyncFlask, shared_client, upstream_loop
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = Flask(__name__)
+# Async views (/geocode, /travel-info) run on one event loop per process with a
+# pooled HTTP client, instead of a new loop per request
+app = AsyncFlask(__name__)
 # Enable CORS for all routes, allowing the frontend to communicate with the backend
-CORS(app)
+# (and to read the cursor of NDJSON pages)
+CORS(app, expose_headers=[NEXT_CURSOR_HEADER])
+# Per-request Server-Timing header plus the counters and histograms behind /metrics
+instrument(app)
 
 # --- Data Generation Logic (from Gas Stations.py) ---
 
@@ -105,100 +126,330 @@ def generate_station_data():
         stations_output[station_id] = station_data
     return stations_output
 
-def save_as_json(stations_dict, filename):
-    with open(filename, 'w') as f:
-        json.dump(stations_dict, f, indent=2)
-
 # --- End of Data Generation Logic ---
 
+# Defaults for the 'optimal' sort's cost model; requests can override each one
+OPTIMAL_COST_DEFAULTS = {
+    'fill_gallons': float(os.getenv('OPTIMAL_FILL_GALLONS', '12')),
+    'cost_per_mile': float(os.getenv('OPTIMAL_COST_PER_MILE', '0.30')),
+    'value_of_time': float(os.getenv('OPTIMAL_VALUE_OF_TIME', '0')),
+}
+
+# Map travel mode names to Mapbox profiles
+MAPBOX_PROFILES = {
+    'driving': 'driving',
+    'walking': 'walking',
+    'bicycling': 'cycling',
+    'transit': 'driving'  # Mapbox doesn't have transit in basic plan
+}
+
+# Most destinations one request may route through the Directions Matrix API
+# (/travel-info/batch, /search road_times); each 25 (10 for traffic) cost one call
+MAX_BATCH_DESTINATIONS = int(os.getenv('MAX_BATCH_DESTINATIONS', '100'))
+# Upper bound on /price-history buckets; each one is a row of the response
+MAX_HISTORY_POINTS = int(os.getenv('MAX_HISTORY_POINTS', '10000'))
+# How often an idle /price-stream checks for a refresh made by another worker
+PRICE_FEED_POLL_SECONDS = float(os.getenv('PRICE_FEED_POLL_SECONDS', '1'))
+
 class GasStationFinderWeb:
-    def __init__(self):
+    def __init__(self, data_path: Optional[str] = None):
+        self.data_path = data_path or os.getenv('STATIONS_FILE', 'stations.json')
+        self._refresh_lock = threading.Lock()
+
+        # Geocoding results are cached in memory and on disk, shared by
+        # Nominatim and Mapbox lookups (keys are namespaced by provider)
+        self.geocode_cache = GeocodeCache(os.getenv('GEOCODE_CACHE_PATH', 'geocode_cache.sqlite3'))
+        self.geolocator = self._make_geolocator()
+
+        # Routes to stations, keyed by profile, origin snapped to a grid and station id
+        self.directions_cache = DirectionsCache(
+            grid_deg=float(os.getenv('DIRECTIONS_CACHE_GRID_DEG', '0.002')),
+            max_entries=int(os.getenv('DIRECTIONS_CACHE_SIZE', '4096')),
+            ttl=float(os.getenv('DIRECTIONS_CACHE_TTL', '900')))
+
         # Initialize Mapbox API service
         # Use environment variable first, with a hardcoded fallback for convenience.
         self.mapbox_access_token = os.getenv('MAPBOX_ACCESS_TOKEN', 'pk.eyJ1Ijoid3JhaXRod2FpdCIsImEiOiJjbWg2cHRiajgwa3N0MmpvbW9mZ2lxeGtqIn0.UXl2DSFjbSSRntzofhFm9g')
         if self.mapbox_access_token:
-            self.mapbox_service = MapboxGasStationService(self.mapbox_access_token)
+            self.mapbox_service = MapboxGasStationService(self.mapbox_access_token,
+                                                          geocode_cache=self.geocode_cache)
+            # Coroutine client for the per-request calls made from async views
+            self.async_mapbox_service = AsyncMapboxGasStationService(
+                self.mapbox_access_token, geocode_cache=self.geocode_cache,
+                request_timeout=self.mapbox_service.request_timeout,
+                base_url=self.mapbox_service.base_url)
             self.use_real_data = True
         else:
             self.mapbox_service = None
+            self.async_mapbox_service = None
             self.use_real_data = False
             print("⚠️  MAPBOX_ACCESS_TOKEN not set. Using mock data.")
         
-        # Load station data from JSON file, which is the primary source of truth
-        self.gas_stations = self.load_stations_from_json('stations.json')
-        if not self.gas_stations:
-            print("⚠️ Could not load station data from stations.json. The app may not function correctly.")
-        
-        # Dynamically get a unique list of brands from the loaded stations
-        self.available_brands = sorted(list(set(s['brand'] for s in self.gas_stations if s.get('brand'))))
-    
-    def load_stations_from_json(self, filepath: str) -> List[Dict]:
-        """Load gas station data from a JSON file."""
-        # ========================================
-        # HOOK: GAS PRICING INFORMATION SOURCE
-        # ========================================
-        # This is where gas station data is loaded from a static file.
-        # To update the data, run 'Gas Stations.py' manually.
+        # Station data comes from STATIONS_FILE: a JSON or .bin file held in
+        # memory, an SQLite database (.sqlite3/.sqlite/.db) queried per request,
+        # or a directory of geohash tiles (.tiles) loaded as searches reach them
+        self.repository = open_repository(self.data_path)
+        if not len(self.repository):
+            print(f"⚠️ Could not load station data from {self.data_path}. The app may not function correctly.")
+
+        # Each station's JSON, encoded once per snapshot and spliced into responses
+        self.fragments = FragmentCache()
+
+        # Price deltas between snapshots, for the /price-stream SSE feed. A
+        # sibling worker's refresh reaches this worker as a file reload, which
+        # publishes the deltas here too
+        self.price_feed = PriceFeed(self.repository.version)
+        if isinstance(self.repository, FileStationRepository):
+            self.repository.on_reload = self.price_feed.publish
+
+        # Every price change is appended to on-disk history for /price-history.
+        # An in-memory snapshot is also recorded once as the starting point;
+        # SQLite and tile catalogs are read lazily, so reading all of them here
+        # is skipped and their history starts with the first refresh
+        self.price_history = PriceHistory(os.getenv('PRICE_HISTORY_DIR', 'price_history'))
+        if (isinstance(self.repository, FileStationRepository) and len(self.repository)
+                and not self.price_history.has_data()):
+            for store, _ in self.repository.pages():
+                self.price_history.record(store, self.repository.loaded_at)
+
+    @staticmethod
+    def _make_geolocator() -> Nominatim:
+        # NOMINATIM_DOMAIN/NOMINATIM_SCHEME point geocoding at a stand-in server
+        return Nominatim(user_agent="gas_station_finder",
+                         domain=os.getenv('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org'),
+                         scheme=os.getenv('NOMINATIM_SCHEME', 'https'))
+
+    def after_fork(self):
+        """
+        Reset per-process state in a forked worker (see serve.py)
+
+        The station snapshot is kept, shared copy-on-write with the parent;
+        connections, HTTP pools, locks and version numbers are not.
+        """
+        reseed_versions()
+        self._refresh_lock = threading.Lock()
+        self.geocode_cache.after_fork()
+        self.geolocator = self._make_geolocator()
+        upstream_loop.after_fork()
+        if self.mapbox_service is not None:
+            self.mapbox_service.after_fork()
+        self.repository.after_fork()
+        self.price_history.after_fork()
+
+    @property
+    def available_brands(self) -> List[str]:
+        """Unique list of brands in the current data"""
+        return self.repository.brand_names()
+
+    def refresh_stations(self, generate=None) -> int:
+        """
+        Regenerate station data and publish it, returning the new version
+
+        For file data the new store, its indexes and its serialized records
+        are all built before the swap, and in-flight requests finish on the
+        snapshot they started with. SQLite data is updated in place, row by
+        changed row, and tile directories rewrite only the tiles that
+        changed. Only one refresh runs at a time.
+        """
+        with self._refresh_lock:
+            return self.refresh_stations_locked(generate)
+
+    def refresh_stations_locked(self, generate=None) -> int:
+        """refresh_stations() for a caller that already holds _refresh_lock"""
+        station_data_dict = (generate or generate_station_data)()
+        previous_version = self.repository.version
+        changes = self.repository.replace(station_data_dict, prepare=self._prepare_snapshot)
+        version = self.repository.version
+        if version != previous_version:
+            self.price_feed.publish_changes(previous_version, version, changes)
+            try:
+                self.price_history.record_changes(changes, self.repository.loaded_at)
+            except OSError as e:
+                print(f"⚠️ Could not record price history: {e}")
+        return version
+
+    def sync_price_feed(self):
+        """
+        Catch price_feed up with data another worker changed
+
+        File data is reloaded here if needed, publishing its deltas; SQLite and
+        tile data have no old snapshot to compare, so the feed resets and its
+        clients resync. Skipped while this worker's own refresh is publishing.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            stations_list = []
-            for station_id, station_data in data.items():
-                # Map fuel types from JSON to application's expected keys
-                prices = station_data.get("prices", {})
-                mapped_prices = {
-                    "E85": prices.get("e85"),
-                    "87": prices.get("regular"),
-                    "89": prices.get("midgrade"),
-                    "91": prices.get("premium"),
-                    "diesel": prices.get("diesel")
-                }
+            version = self.repository.version
+            if version != self.price_feed.version:
+                self.price_feed.reset(version)
+        finally:
+            self._refresh_lock.release()
 
-                # Construct full address string
-                addr = station_data.get("address", {})
-                full_address = f"{addr.get('street', '')}, {addr.get('zip_code', '')}"
-
-                stations_list.append({
-                    "name": station_data.get('brand_name', 'Unknown Station'),
-                    "brand": station_data.get("brand_name"),
-                    "lat": station_data.get("location", {}).get("latitude"),
-                    "lon": station_data.get("location", {}).get("longitude"),
-                    "address": full_address,
-                    "prices": {k: v for k, v in mapped_prices.items() if v is not None}
-                })
-            return stations_list
-        except FileNotFoundError:
-            print(f"❌ CRITICAL ERROR: The data file '{filepath}' was not found.")
-            print("💡 Please create a 'stations.json' file or run 'Gas Stations.py' to generate it.")
-            return []
-        except json.JSONDecodeError:
-            print(f"❌ CRITICAL ERROR: Could not decode JSON from '{filepath}'. The file might be corrupt.")
-            return []
-        except Exception as e:
-            print(f"❌ An unexpected error occurred while loading '{filepath}': {e}")
-            return []
+    def _prepare_snapshot(self, store: StationStore):
+        """Build a new snapshot's serialized records before it goes live"""
+        store.records()
+        self.fragments.get(store).warm()
+
+    @property
+    def gas_stations(self) -> List[Dict]:
+        """All stations serialized as dicts"""
+        records = []
+        for store, indices in self.repository.pages():
+            store_records = store.records()
+            records.extend(store_records[i] for i in indices.tolist())
+        return records
     
     def get_user_location(self, address: str) -> tuple:
         """Get user's coordinates from address input"""
         try:
-            geolocator = Nominatim(user_agent="gas_station_finder")
-            location = geolocator.geocode(address)
+            location = self.geocode_cache.lookup('nominatim', address, self._geocode_nominatim)
             
             if location:
-                return location.latitude, location.longitude, location.address
+                return location
             else:
                 return None, None, "Address not found"
                 
         except Exception as e:
             return None, None, f"Error: {str(e)}"
+
+    async def get_user_location_async(self, address: str) -> tuple:
+        """get_user_location() for async views; the Nominatim call waits as a coroutine"""
+        if not async_upstream.available():
+            return await asyncio.to_thread(self.get_user_location, address)
+        try:
+            location = await self.geocode_cache.lookup_async(
+                'nominatim', address, self._geocode_nominatim_async)
+
+            if location:
+                return location
+            else:
+                return None, None, "Address not found"
+
+        except Exception as e:
+            return None, None, f"Error: {str(e)}"
+
+    def _geocode_nominatim(self, address: str) -> Optional[tuple]:
+        """Live Nominatim lookup; returns (lat, lon, display address) or None"""
+        with upstream('nominatim', 'geocode'):
+            location = self.geolocator.geocode(address)
+        if location:
+            return location.latitude, location.longitude, location.address
+        return None
+
+    async def _geocode_nominatim_async(self, address: str) -> Optional[tuple]:
+        """_geocode_nominatim() as a coroutine, with the geolocator's URL, headers and timeout"""
+        with upstream('nominatim', 'geocode'):
+            places = await shared_client().get_json(
+                self.geolocator.api, params={'q': address, 'format': 'json', 'limit': 1},
+                headers=self.geolocator.headers, timeout=self.geolocator.timeout)
+        if places:
+            place = places[0]
+            return float(place['lat']), float(place['lon']), place.get('display_name')
+        return None
+
+    def _route_key(self, destination: tuple) -> str:
+        """
+        Directions cache key for a destination: the id of the station there, if any
+
+        The id is always looked up from the coordinates, never taken from the
+        client, so a route can only be cached under the station it leads to.
+        """
+        station_id = self.repository.station_id_at(*destination)
+        if station_id is None:
+            # Not one of our stations; key on the rounded destination instead
+            station_id = f"{destination[0]:.5f},{destination[1]:.5f}"
+        return station_id
     
+    def get_directions(self, origin: tuple, destination: tuple,
+                       profile: str = 'driving') -> Optional[Dict]:
+        """Mapbox directions to a station, served from the directions cache when possible"""
+        station_id = self._route_key(destination)
+        route = self.directions_cache.get(profile, origin, station_id)
+        if route is MISSING:
+            route = self.mapbox_service.get_directions(origin, destination, profile)
+            if route:
+                self.directions_cache.set(profile, origin, station_id, route)
+        return route
+
+    async def get_directions_async(self, origin: tuple, destination: tuple,
+                                   profile: str = 'driving') -> Optional[Dict]:
+        """get_directions() for async views; a cache miss waits on Mapbox as a coroutine"""
+        if not async_upstream.available():
+            return await asyncio.to_thread(self.get_directions, origin, destination, profile)
+        station_id = self._route_key(destination)
+        route = self.directions_cache.get(profile, origin, station_id)
+        if route is MISSING:
+            route = await self.async_mapbox_service.get_directions(origin, destination, profile)
+            if route:
+                self.directions_cache.set(profile, origin, station_id, route)
+        return route
+
+    def add_road_times(self, results: List[Dict], user_lat: float, user_lon: float,
+                       profile: str = 'driving') -> List[Dict]:
+        """
+        Replace the 30 mph duration estimate with Mapbox road times
+
+        All stations are sent through the Directions Matrix API in as few
+        requests as its coordinate limit allows. Stations Mapbox can't route
+        keep their estimate.
+        """
+        if not results or not (self.use_real_data and self.mapbox_service):
+            return results
+
+        travel_times = self.mapbox_service.get_travel_times(
+            (user_lat, user_lon), [(s['lat'], s['lon']) for s in results], profile)
+        for station, travel in zip(results, travel_times):
+            if travel is None:
+                continue
+            station['duration'] = round(travel['duration_seconds'] / 60)
+            if travel['distance_meters'] is not None:
+                station['road_distance_miles'] = round(travel['distance_meters'] / 1609.34, 2)
+            station['duration_source'] = 'mapbox'
+        return results
+
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate distance between two points in miles"""
-        return geodesic((lat1, lon1), (lat2, lon2)).miles
-    
+        return distance_miles(lat1, lon1, lat2, lon2)
+
+    def find_nearest_stations(self, user_lat: float, user_lon: float, count: int = 5,
+                              max_radius: Optional[float] = None) -> List[Dict]:
+        """Return the `count` closest stations using the spatial index"""
+        store, nearest = self.repository.nearest(user_lat, user_lon, count, max_radius)
+        return [
+            store.record(i).to_dict(distance_miles=round(distance, 2),
+                                    duration=round((distance / 30) * 60))
+            for i, distance in nearest
+        ]
+
     def search_gas_stations(self, user_lat: float, user_lon: float, sort_by: str = "closest", 
-                          gas_type: str = "all", brand: str = "all", radius: float = 10.0) -> List[Dict]:
-        """Search and return gas stations based on criteria"""
+                          gas_type: str = "all", brand: str = "all", radius: float = 10.0,
+                          limit: Optional[int] = None,
+                          cost_options: Optional[Dict[str, float]] = None) -> List[Dict]:
+        """
+        Search and return gas stations based on criteria, keeping at most `limit` results
+
+        `cost_options` overrides OPTIMAL_COST_DEFAULTS (fill_gallons, cost_per_mile,
+        value_of_time in $/hour) for the 'optimal' sort.
+        """
+        ranked = self.rank_stations(user_lat, user_lon, sort_by, gas_type, brand, radius,
+                                    limit, cost_options)
+        return list(self.iter_results(ranked))
+
+    def rank_stations(self, user_lat: float, user_lon: float, sort_by: str = "closest",
+                      gas_type: str = "all", brand: str = "all", radius: float = 10.0,
+                      limit: Optional[int] = None,
+                      cost_options: Optional[Dict[str, float]] = None,
+                      after: Optional[tuple] = None) -> tuple:
+        """
+        Filter and order stations without building any result dicts
+
+        `after` is a (sort key, catalog position) pair from a previous page;
+        only stations ordered strictly after it are returned.
+
+        Returns:
+            (store, indices, distances, sort_keys, costs) - arrays in result
+            order; costs is None unless sorting by 'optimal'
+        """
         # ========================================
         # HOOK: GAS STATION SEARCH AND FILTERING
         # ========================================
@@ -207,60 +458,123 @@ class GasStationFinderWeb:
         # Output: List of filtered and sorted gas stations with pricing data
         # Integration point: Add real-time price updates, availability checks
 
-        # Create a fresh copy of stations to process for this search
-        stations_to_process = [s.copy() for s in self.gas_stations]
+        empty = np.empty(0, dtype=np.int64)
+        grade = None
+        if gas_type != "all":
+            grade = grade_key(gas_type)
+            if grade is None:
+                return StationStore.empty(), empty, empty.astype(float), empty.astype(float), None
 
-        # Always use straight-line ("as the crow flies") distance
-        for station in stations_to_process:
-            # Calculate distance
-            distance = self.calculate_distance(
-                user_lat, user_lon, station["lat"], station["lon"])
-            station["distance_miles"] = round(distance, 2)
-            
-            # Estimate travel time assuming an average speed of 30 mph
-            # (distance / speed) * 60 minutes/hour
-            if distance < float('inf'):
-                estimated_time_minutes = (distance / 30) * 60
-                station['duration'] = round(estimated_time_minutes)
-        
-        # 2. Filter the processed stations list in-place
-        results = []
-        for station in stations_to_process: # Use the list that has distance/duration data
+        # 1-2. Stations inside the radius that pass the brand and grade filters.
+        # The repository applies all three, in memory or in SQL.
+        store, indices, distances = self.repository.search(
+            user_lat, user_lon, radius, brand if brand != "all" else None, grade)
 
-            # Apply radius filter
-            if station.get('distance_miles', float('inf')) > radius:
-                continue
+        # Price to rank by for 'cheapest' and 'optimal'. Default to '87' if 'all' is selected.
+        price_key_to_sort = grade or '87'
+        options = {**OPTIMAL_COST_DEFAULTS, **(cost_options or {})}
 
-            # Apply brand filter
-            if brand != "all" and station.get("brand", "").lower() != brand.lower():
-                continue
-            # Apply gas type filter
-            if gas_type != "all":
-                # Make the check case-insensitive by comparing lowercase keys
-                station_price_keys = [k.lower() for k in station.get("prices", {}).keys()]
-                if gas_type.lower() not in station_price_keys:
-                    continue
-            results.append(station)
-
-        # 3. Sort the filtered results
-        if sort_by == 'closest':
-            # Sort by the 'distance_miles' key, from smallest to largest
-            results.sort(key=lambda s: s.get('distance_miles', float('inf')))
-        elif sort_by == 'cheapest':
-            # Determine which price to sort by. Default to '87' if 'all' is selected.
-            price_key_to_sort = gas_type if gas_type != 'all' else '87'
-            
-            # Sort by the selected gas price, from cheapest to most expensive.
-            # Stations without a price for the selected type are pushed to the end.
-            results.sort(key=lambda s: s.get('prices', {}).get(price_key_to_sort, float('inf')))
-        
-        # The 'optimal' sort is not implemented, so no action is taken for it.
+        def sort_keys(selected):
+            if sort_by == 'closest':
+                return distances[selected]
+            if sort_by == 'cheapest':
+                return np.nan_to_num(store.prices[price_key_to_sort][indices[selected]], nan=np.inf)
+            if sort_by == 'optimal':
+                return trip_costs(store.prices[price_key_to_sort][indices[selected]],
+                                  distances[selected], **options)
+            return store.catalog_positions(indices[selected]).astype(np.float64)
 
+        # Resume after the last station of the previous page
+        if after is not None:
+            after_key, after_index = after
+            keys = sort_keys(slice(None))
+            positions = store.catalog_positions(indices)
+            keep = (keys > after_key) | ((keys == after_key) & (positions > after_index))
+            indices, distances = indices[keep], distances[keep]
 
-        return results
+        # 3. Sort the filtered results. Ties keep station file order. With a
+        # limit only the top `limit` stations are selected and ordered.
+        with span('sort'):
+            costs = None
+            if sort_by == 'closest':
+                # Sort by distance, from smallest to largest
+                order = top_k(distances, indices, limit)
+            elif sort_by == 'cheapest':
+                # Sort by the selected gas price, from cheapest to most expensive.
+                # Stations without a price for the selected type are pushed to the end.
+                order = cheapest_within(store.price_order[price_key_to_sort],
+                                        store.prices[price_key_to_sort], indices, len(store), limit)
+            elif sort_by == 'optimal':
+                # Rank by total trip cost: fuel bill plus the cost of the detour
+                order, costs = cheapest_trips(store.prices[price_key_to_sort][indices], distances,
+                                              indices, limit, **options)
+            else:
+                # Unknown sorts leave results in file order.
+                order = np.argsort(indices, kind='stable')[:limit]
+
+            keys = costs if costs is not None else sort_keys(order)
+        return store, indices[order], distances[order], keys, costs
+
+    def iter_results(self, ranked: tuple):
+        """Yield result dicts for the output of rank_stations, one at a time"""
+        store, indices, distances, _, costs = ranked
+        for position, (i, distance) in enumerate(zip(indices.tolist(), distances.tolist())):
+            # Estimate travel time assuming an average speed of 30 mph
+            # (distance / speed) * 60 minutes/hour
+            estimated_time_minutes = (distance / 30) * 60
+            station = store.record(i).to_dict(
+                distance_miles=round(distance, 2),
+                duration=round(estimated_time_minutes))
+            if costs is not None:
+                cost = float(costs[position])
+                station['total_cost'] = round(cost, 2) if np.isfinite(cost) else None
+            yield station
+
+    def encode_stations(self, pages):
+        """Cached JSON fragments for (store, indices) batches such as repository.pages()"""
+        for store, indices in pages:
+            yield from self.fragments.get(store).encode(indices.tolist())
+
+    def encode_results(self, ranked: tuple):
+        """Like iter_results, but yield each station as JSON spliced from its cached fragment"""
+        store, indices, distances, _, costs = ranked
+        if not len(indices):
+            return iter(())
+        distances = distances.tolist()
+        extras = {
+            'distance_miles': [round(distance, 2) for distance in distances],
+            # Same 30 mph estimate as iter_results
+            'duration': [round((distance / 30) * 60) for distance in distances],
+        }
+        if costs is not None:
+            extras['total_cost'] = [round(cost, 2) if np.isfinite(cost) else None
+                                    for cost in costs.tolist()]
+        return self.fragments.get(store).encode(indices.tolist(), extras)
 
 # Initialize the finder
 finder = GasStationFinderWeb()
+listing_cache = ListingCache()
+
+def before_fork():
+    """serve.py hook: build what every worker will share before forking them"""
+    if isinstance(finder.repository, FileStationRepository):
+        finder._prepare_snapshot(finder.repository.store)
+
+def after_fork():
+    """serve.py hook, run in each worker process"""
+    finder.after_fork()
+
+def positive_int(value, name: str) -> Optional[int]:
+    """None for a missing request value, else a whole number >= 1; raises ValueError otherwise"""
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = 0
+    if number < 1 or isinstance(value, bool):
+        raise ValueError(f"'{name}' must be a positive integer")
+    return number
 
 @app.route('/')
 def index():
@@ -271,7 +585,7 @@ def index():
     })
 
 @app.route('/geocode', methods=['POST'])
-def geocode():
+async def geocode():
     # ========================================
     # HOOK: LOCATION SEARCH FIELD PROCESSING
     # ========================================
@@ -283,7 +597,7 @@ def geocode():
     data = request.get_json()
     address = data.get('address', '')
     
-    lat, lon, message = finder.get_user_location(address)
+    lat, lon, message = await finder.get_user_location_async(address)
     
     if lat and lon:
         return jsonify({
@@ -305,7 +619,8 @@ def search():
     # ========================================
     # This endpoint processes all search criteria from the frontend
     # Input fields processed:
-    # - sort_by: 'closest', 'cheapest', 'gas_type', 'brand'
+    # - sort_by: 'closest', 'cheapest', 'optimal', 'gas_type', 'brand'
+    # - fill_gallons, cost_per_mile, value_of_time: optional 'optimal' cost model overrides
     # - gas_type: 'all', 'E85', '87', '89', '91'
     # - brand: 'all', 'Shell', 'Exxon', 'BP', 'Chevron', 'Mobil', 'Speedway', '7-Eleven'
     # Integration point: Connect to real gas station APIs here
@@ -318,39 +633,278 @@ def search():
     gas_type = data.get('gas_type', 'all')
     brand = data.get('brand', 'all')
     radius = float(data.get('radius', 10.0))
+    try:
+        limit = positive_int(data.get('limit'), 'limit')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     if not user_lat or not user_lon:
         return jsonify({'error': 'Location not set'})
     
-    results = finder.search_gas_stations(user_lat, user_lon, sort_by, gas_type, brand, radius)
+    # Optional overrides for the 'optimal' sort's cost model
+    # (the ranking's lower-bound pruning is only valid for non-negative values)
+    try:
+        cost_options = {key: float(data[key]) for key in OPTIMAL_COST_DEFAULTS if data.get(key) is not None}
+    except (TypeError, ValueError):
+        cost_options = None
+    if cost_options is None or not all(math.isfinite(v) and v >= 0 for v in cost_options.values()):
+        return jsonify({'error': f"{', '.join(OPTIMAL_COST_DEFAULTS)} must be non-negative numbers"}), 400
     
-    return jsonify({
-        'success': True,
-        'results': results
-    })
+    # Cursor pagination: 'page_size' caps each page, 'cursor' resumes after the
+    # last station of the previous page
+    try:
+        page_size = positive_int(data.get('page_size'), 'page_size')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if limit is not None and (page_size is not None or data.get('cursor')):
+        return jsonify({'error': "'limit' cannot be combined with 'page_size' or 'cursor'"}), 400
+    after = None
+    if data.get('cursor'):
+        try:
+            position = decode_cursor(data['cursor'])
+            if position.get('sort_by') != sort_by:
+                raise ValueError("Cursor belongs to a different sort")
+            after = (float(position['key']), int(position['index']))
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+
+    # Road times cost Matrix API calls per returned station, so they need a bounded page
+    if data.get('road_times'):
+        count = page_size if page_size is not None else limit
+        if count is None or count > MAX_BATCH_DESTINATIONS:
+            return jsonify({'error': f"road_times needs a limit or page_size of at most "
+                                     f"{MAX_BATCH_DESTINATIONS}"}), 400
+
+    fetch = page_size + 1 if page_size is not None else limit
+    store, indices, distances, keys, costs = finder.rank_stations(
+        user_lat, user_lon, sort_by, gas_type, brand, radius, fetch, cost_options, after)
+    
+    next_cursor = None
+    if page_size is not None and len(indices) > page_size:
+        indices, distances, keys = indices[:page_size], distances[:page_size], keys[:page_size]
+        costs = costs[:page_size] if costs is not None else None
+        next_cursor = encode_cursor({'sort_by': sort_by, 'key': float(keys[-1]),
+                                     'index': int(store.catalog_positions(indices[-1:])[0])})
+    ranked = (store, indices, distances, keys, costs)
+    
+    # Stream one station per line so the map can render while the rest arrive
+    if wants_ndjson(data):
+        return ndjson_response(finder.encode_results(ranked), encoded=True, next_cursor=next_cursor)
+    
+    fields = {'success': True}
+    if page_size is not None:
+        fields['next_cursor'] = next_cursor
+    
+    # Splice per-request fields into each station's cached JSON, unless road
+    # times will rewrite them or debug mode wants pretty-printed output
+    if not data.get('road_times') and can_splice():
+        with span('serialize'):
+            return json_response(fields, finder.encode_results(ranked))
+    
+    with span('serialize'):
+        results = list(finder.iter_results(ranked))
+    
+    # Optionally swap estimated durations for real road times in one batch
+    if data.get('road_times'):
+        profile = MAPBOX_PROFILES.get(data.get('mode', 'driving'), 'driving')
+        with span('road_times'):
+            finder.add_road_times(results, float(user_lat), float(user_lon), profile)
+    
+    with span('jsonify'):
+        return jsonify({**fields, 'results': results})
 
 @app.route('/all-stations', methods=['GET'])
 def all_stations():
     """Returns the complete list of all gas stations from the data source."""
     # The 'distance' key will be missing, which the frontend will handle.
-    return jsonify({
+    # Optional: ?page_size=N&cursor=... for pages in file order, or
+    # ?format=ndjson to stream one station per line.
+    repository = finder.repository
+    try:
+        page_size = positive_int(request.args.get('page_size'), 'page_size')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    cursor = request.args.get('cursor')
+    
+    if page_size is None and not cursor:
+        if wants_ndjson():
+            return ndjson_response(finder.encode_stations(repository.pages()), encoded=True)
+        
+        def build():
+            if can_splice():
+                return (encode_envelope({'success': True}, finder.encode_stations(repository.pages())) + "\n").encode('utf-8')
+            return jsonify({'success': True, 'results': finder.gas_stations}).get_data()
+        
+        # The full listing only changes with the data, so it is encoded and
+        # compressed once per data version and answered with ETags after that
+        with span('serialize'):
+            listing = listing_cache.get(repository.version, build, repository.loaded_at)
+        return listing.response()
+    
+    start = 0
+    if cursor:
+        try:
+            start = int(decode_cursor(cursor)['index']) + 1
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+    
+    # One extra station tells whether there is another page
+    count = None if page_size is None else page_size + 1
+    store, indices = repository.page(start, count)
+    next_cursor = None
+    if page_size is not None and len(indices) > page_size:
+        indices = indices[:page_size]
+        next_cursor = encode_cursor({'index': int(store.catalog_positions(indices[-1:])[0])})
+    
+    if wants_ndjson():
+        return ndjson_response(finder.encode_stations([(store, indices)]), encoded=True,
+                               next_cursor=next_cursor)
+    
+    fields = {
         'success': True,
-        'results': finder.gas_stations
-    })
+        'next_cursor': next_cursor
+    }
+    if can_splice():
+        return json_response(fields, finder.encode_stations([(store, indices)]))
+    return jsonify({**fields, 'results': [store.record(i).to_dict() for i in indices.tolist()]})
 
 @app.route('/refresh-data', methods=['POST'])
 def refresh_data():
-    """Generates a new stations.json file with updated prices."""
+    """
+    Generates a new stations.json file with updated prices and swaps it in.
+
+    The refresh runs on a background thread; pass {"wait": true} to block
+    until the new snapshot is live.
+    """
+    data = request.get_json(silent=True) or {}
+    
+    # Taken here and released by the worker thread, so two requests can't both start one
+    if not finder._refresh_lock.acquire(blocking=False):
+        return jsonify({'success': False, 'error': 'A refresh is already in progress.'}), 409
+    
+    result = {}
+    
+    def run_refresh():
+        try:
+            print("🔄 Regenerating station data file...")
+            result['version'] = finder.refresh_stations_locked()
+        except Exception as e:
+            print(f"❌ Station data refresh failed: {e}")
+            result['error'] = str(e)
+        finally:
+            finder._refresh_lock.release()
+    
+    worker = threading.Thread(target=run_refresh, name='refresh-data', daemon=True)
     try:
-        print("🔄 Regenerating station data file...")
-        station_data_dict = generate_station_data()
-        save_as_json(station_data_dict, 'stations.json')
-        return jsonify({'success': True, 'message': 'Station data has been refreshed.'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        worker.start()
+    except RuntimeError:
+        finder._refresh_lock.release()
+        raise
+    
+    if not data.get('wait'):
+        return jsonify({'success': True, 'message': 'Station data refresh started.'}), 202
+    
+    worker.join()
+    if 'error' in result:
+        return jsonify({'success': False, 'error': result['error']})
+    return jsonify({
+        'success': True,
+        'message': 'Station data has been refreshed.',
+        'version': result['version']
+    })
+
+@app.route('/price-stream', methods=['GET'])
+def price_stream():
+    """
+    Server-Sent Events feed of price changes.
+
+    Each 'prices' event carries the snapshot version (also the event id) and
+    the changed (station_id, grade, old_price, new_price) entries. Reconnecting
+    clients resume from the Last-Event-ID header or ?since=<version>. If the
+    missed deltas have aged out of the buffer, a 'resync' event tells the
+    client to reload /all-stations.
+    """
+    last_seen = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(last_seen) if last_seen else None
+    except ValueError:
+        return jsonify({'error': 'Invalid version'}), 400
+    
+    feed = finder.price_feed
+    finder.sync_price_feed()
+    
+    def generate():
+        version = since
+        if version is None:
+            version = feed.version
+            yield format_sse('snapshot', {'version': version}, version)
+        
+        keep_alive_at = time.monotonic() + 15
+        while True:
+            # Other workers' refreshes are noticed by polling, not woken on
+            events, complete = feed.wait_for_events(version, timeout=PRICE_FEED_POLL_SECONDS)
+            if not events and complete:
+                finder.sync_price_feed()
+                events, complete = feed.events_since(version)
+            if not complete:
+                version = feed.version
+                yield format_sse('resync', {'version': version}, version)
+            elif not events:
+                if time.monotonic() >= keep_alive_at:
+                    # Comment line keeps proxies from closing an idle connection
+                    keep_alive_at = time.monotonic() + 15
+                    yield ": keep-alive\n\n"
+            else:
+                for event in events:
+                    yield format_sse('prices', event, event['version'])
+                version = events[-1]['version']
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/price-history', methods=['GET'])
+def price_history():
+    """
+    Price history for one station and grade.
+
+    Query parameters: station_id, gas_type, start and end (epoch seconds,
+    default the last 30 days) and points. With points (at most
+    MAX_HISTORY_POINTS), the series is downsampled server-side to that many
+    min/max/mean buckets.
+    """
+    station_id = request.args.get('station_id')
+    grade = grade_key(request.args.get('gas_type', ''))
+    if not station_id or grade is None:
+        return jsonify({'error': 'station_id and a valid gas_type are required'}), 400
+    
+    try:
+        end = int(request.args.get('end', time.time()))
+        start = int(request.args.get('start', end - 30 * 24 * 3600))
+    except ValueError:
+        return jsonify({'error': 'start and end must be integers'}), 400
+    if not 0 <= start <= end <= MAX_TIMESTAMP:
+        return jsonify({'error': f"start and end must satisfy 0 <= start <= end <= {MAX_TIMESTAMP}"}), 400
+    try:
+        points = positive_int(request.args.get('points'), 'points')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if points is not None and points > MAX_HISTORY_POINTS:
+        return jsonify({'error': f"'points' must be at most {MAX_HISTORY_POINTS}"}), 400
+    
+    timestamps, prices = finder.price_history.series(station_id, grade, start, end)
+    response = {'success': True, 'station_id': station_id, 'gas_type': grade,
+                'start': start, 'end': end}
+    if points is not None:
+        response['buckets'] = downsample(timestamps, prices, start, end, points)
+    else:
+        response['ticks'] = [
+            {'ts': ts, 'price': None if price != price else round(price, 3)}
+            for ts, price in zip(timestamps.tolist(), prices.tolist())
+        ]
+    return jsonify(response)
 
 @app.route('/travel-info', methods=['POST'])
-def get_travel_info():
+async def get_travel_info():
     """Get travel time and directions to a gas station"""
     # ========================================
     # HOOK: TRAVEL INFORMATION API
@@ -377,16 +931,9 @@ def get_travel_info():
             origin = (float(origin_lat), float(origin_lon))
             destination = (float(dest_lat), float(dest_lon))
             
-            # Map mode names to Mapbox profiles
-            profile_map = {
-                'driving': 'driving',
-                'walking': 'walking',
-                'bicycling': 'cycling',
-                'transit': 'driving'  # Mapbox doesn't have transit in basic plan
-            }
-            mapbox_profile = profile_map.get(mode, 'driving')
+            mapbox_profile = MAPBOX_PROFILES.get(mode, 'driving')
             
-            travel_info = finder.mapbox_service.get_directions(origin, destination, mapbox_profile)
+            travel_info = await finder.get_directions_async(origin, destination, mapbox_profile)
             
             if travel_info:
                 return jsonify({
@@ -421,6 +968,98 @@ def get_travel_info():
             }
         })
 
+@app.route('/travel-info/batch', methods=['POST'])
+def get_travel_info_batch():
+    """Get travel times from one origin to many stations in a single batch"""
+    # Input: origin_lat, origin_lon, mode, destinations: [{'lat': ..., 'lon': ...}, ...]
+    # Output: one travel_info entry per destination, in the same order
+    data = request.get_json()
+    
+    origin_lat = data.get('origin_lat')
+    origin_lon = data.get('origin_lon')
+    destinations = data.get('destinations') or []
+    mode = data.get('mode', 'driving')
+    
+    if not origin_lat or not origin_lon or not destinations:
+        return jsonify({'error': 'Missing coordinates'})
+    if len(destinations) > MAX_BATCH_DESTINATIONS:
+        return jsonify({'error': f'At most {MAX_BATCH_DESTINATIONS} destinations per request'}), 400
+    
+    try:
+        origin = (float(origin_lat), float(origin_lon))
+        points = [(float(d['lat']), float(d['lon'])) for d in destinations]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid destination coordinates'})
+    
+    travel_times = [None] * len(points)
+    if finder.use_real_data and finder.mapbox_service:
+        travel_times = finder.mapbox_service.get_travel_times(
+            origin, points, MAPBOX_PROFILES.get(mode, 'driving'))
+    
+    results = []
+    for point, travel in zip(points, travel_times):
+        if travel is not None:
+            distance_meters = travel['distance_meters'] or 0
+            results.append({
+                'distance_text': f"{distance_meters / 1609.34:.1f} mi",
+                'distance_meters': distance_meters,
+                'duration_text': f"{int(travel['duration_seconds'] / 60)} min",
+                'duration_seconds': travel['duration_seconds']
+            })
+        else:
+            # Fallback: straight-line distance at an assumed 30 mph
+            distance = finder.calculate_distance(origin[0], origin[1], point[0], point[1])
+            estimated_time_minutes = (distance / 30) * 60
+            results.append({
+                'distance_text': f"{distance:.1f} miles",
+                'distance_meters': distance * 1609.34,
+                'duration_text': f"{int(estimated_time_minutes)} min",
+                'duration_seconds': int(estimated_time_minutes * 60),
+                'note': 'Estimated travel time (straight-line distance)'
+            })
+    
+    return jsonify({
+        'success': True,
+        'results': results
+    })
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the geocoding, directions and station tile caches"""
+    stats = {
+        'success': True,
+        'geocode': finder.geocode_cache.stats(),
+        'directions': finder.directions_cache.stats()
+    }
+    station_cache = finder.repository.cache_stats()
+    if station_cache is not None:
+        stats['station_tiles'] = station_cache
+    return jsonify(stats)
+
+def collect_app_metrics():
+    """Scrape-time values for /metrics: cache counters and the current snapshot"""
+    repository = finder.repository
+    caches = [('geocode', finder.geocode_cache.stats()), ('directions', finder.directions_cache.stats())]
+    station_cache = repository.cache_stats()
+    if station_cache is not None:
+        caches.append(('station_tiles', station_cache))
+    for name, stats in caches:
+        yield 'cache_hits_total', 'counter', 'Cache hits', {'cache': name}, stats['hits']
+        yield 'cache_misses_total', 'counter', 'Cache misses', {'cache': name}, stats['misses']
+        yield 'cache_entries', 'gauge', 'Entries currently cached', {'cache': name}, stats['size']
+        if 'bytes' in stats:
+            yield 'cache_bytes', 'gauge', 'Bytes currently cached', {'cache': name}, stats['bytes']
+            yield 'cache_evictions_total', 'counter', 'Entries evicted', {'cache': name}, stats['evictions']
+    yield 'stations_loaded', 'gauge', 'Stations in the current snapshot', {}, len(repository)
+    yield 'station_snapshot_version', 'gauge', 'Version of the current snapshot', {}, repository.version
+
+metrics.add_collector(collect_app_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, stage, upstream and cache metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/station-details', methods=['POST'])
 def get_station_details():
     """Get detailed information about a specific gas station"""
@@ -488,13 +1127,14 @@ if __name__ == '__main__':
     
     if selected_port is None:
         print("❌ Could not find an available port.")
-        print("💡 Try running: pkill -f 'python3 gas_station_finder_web.py'")
+        print("💡 Try running: pkill -f 'python3 priceUpdater.py'")
         print("💡 Or use: python3 start_app.py stop")
         sys.exit(1)
     
     print(f"📱 Starting server on port {selected_port}...")
     print(f"🌐 Open your browser and go to: http://localhost:{selected_port}")
     print("🛑 Press Ctrl+C to stop the server")
+    print("💡 For production, run: python3 serve.py --workers N")
     
     try:
         app.run(debug=True, host='127.0.0.1', port=selected_port, use_reloader=False)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Price change feed for Server-Sent Events
+Diffs consecutive station snapshots and keeps the recent deltas in a bounded
+ring buffer so reconnecting clients can resume from the version they last saw
+"""
+
+import json
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from station_store import GRADES, StationStore
+
+
+def _price(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def diff_stores(old: StationStore, new: StationStore) -> List[Dict]:
+    """
+    Per-station, per-grade price changes between two snapshots
+
+    Stations are matched by station_id. A station that appears or disappears
+    shows up as changes from/to None for each grade it sells.
+    """
+    if old.station_ids == new.station_ids:
+        old_rows = new_rows = np.arange(len(new))
+        ids = new.station_ids
+    else:
+        old_position = {station_id: i for i, station_id in enumerate(old.station_ids)}
+        common = [(old_position[station_id], i) for i, station_id in enumerate(new.station_ids)
+                  if station_id in old_position]
+        old_rows = np.array([o for o, _ in common], dtype=np.int64)
+        new_rows = np.array([n for _, n in common], dtype=np.int64)
+        ids = [new.station_ids[n] for n in new_rows.tolist()]
+
+    changes = []
+    for grade in GRADES:
+        before = old.prices[grade][old_rows]
+        after = new.prices[grade][new_rows]
+        # NaN != NaN, so compare "both missing" separately
+        changed = np.flatnonzero((before != after) & ~(np.isnan(before) & np.isnan(after)))
+        for row in changed.tolist():
+            changes.append({
+                'station_id': ids[row],
+                'grade': grade,
+                'old_price': _price(before[row]),
+                'new_price': _price(after[row]),
+            })
+
+    if ids is not new.station_ids:
+        kept = set(ids)
+        for store, key in ((old, 'old_price'), (new, 'new_price')):
+            for i, station_id in enumerate(store.station_ids):
+                if station_id in kept:
+                    continue
+                for grade in GRADES:
+                    price = _price(store.prices[grade][i])
+                    if price is not None:
+                        change = {'station_id': station_id, 'grade': grade,
+                                  'old_price': None, 'new_price': None}
+                        change[key] = price
+                        changes.append(change)
+    return changes
+
+
+class PriceFeed:
+    """Ring buffer of price deltas keyed by snapshot version"""
+
+    def __init__(self, current_version: int, max_events: int = 256):
+        self.version = current_version
+        self._events = deque(maxlen=max_events)
+        self._condition = threading.Condition()
+
+    def publish(self, old: StationStore, new: StationStore):
+        """Record the deltas from old to new and wake every waiting client"""
+        self.publish_changes(old.version, new.version, diff_stores(old, new))
+
+    def publish_changes(self, previous_version: int, version: int, changes: List[Dict]):
+        """Record changes already in diff_stores() form, e.g. from an incremental update"""
+        event = {
+            'version': version,
+            'previous_version': previous_version,
+            'changes': changes,
+        }
+        with self._condition:
+            self._events.append(event)
+            self.version = version
+            self._condition.notify_all()
+
+    def reset(self, version: int):
+        """
+        Move to `version` without deltas, e.g. when another process changed
+        data this one has no old snapshot of; waiting clients are told to resync
+        """
+        with self._condition:
+            self._events.clear()
+            self.version = version
+            self._condition.notify_all()
+
+    def events_since(self, version: int) -> Tuple[List[Dict], bool]:
+        """
+        Events newer than `version`
+
+        Returns:
+            (events, complete) - complete is False when the buffer no longer
+            reaches back to `version`, so the client must reload everything
+        """
+        with self._condition:
+            return self._events_since(version)
+
+    def wait_for_events(self, version: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """Like events_since, but blocks up to `timeout` seconds for something new"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout=timeout)
+            return self._events_since(version)
+
+    def _events_since(self, version: int) -> Tuple[List[Dict], bool]:
+        if version == self.version:
+            return [], True
+        events = [event for event in self._events if event['version'] > version]
+        complete = bool(events) and events[0]['previous_version'] == version
+        return events, complete
+
+
+def format_sse(event: str, data: Dict, event_id: Optional[int] = None) -> str:
+    """Encode one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
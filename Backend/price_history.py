@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Append-only price history
+Price ticks (timestamp, station, grade, price) are stored as fixed-width binary
+records in one segment file per UTC day, so months of history can be queried
+through memory maps instead of millions of dicts
+"""
+
+import datetime
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from station_store import GRADES, StationStore
+
+SECONDS_PER_DAY = 86400
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+# Last second of 9999-12-31, the latest day a segment file can be named for
+MAX_TIMESTAMP = (datetime.date.max.toordinal() - EPOCH_ORDINAL + 1) * SECONDS_PER_DAY - 1
+
+# One tick: epoch seconds, station code, grade code, price (NaN once a grade stops being sold)
+TICK_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('station', '<u4'),
+    ('grade', 'u1'),
+    ('price', '<f4'),
+])
+
+GRADE_CODES = {grade: code for code, grade in enumerate(GRADES)}
+
+
+def downsample(timestamps: np.ndarray, prices: np.ndarray, start: int, end: int,
+               points: int) -> List[Dict]:
+    """
+    Reduce a series to at most `points` equal-width time buckets
+
+    Each non-empty bucket reports its start time and the min, max and mean
+    price of the ticks that fall in it. Missing prices (NaN) are ignored.
+    """
+    keep = ~np.isnan(prices)
+    timestamps, prices = timestamps[keep], prices[keep].astype(np.float64)
+    if not timestamps.size or points <= 0:
+        return []
+
+    width = max(1, -(-(end - start + 1) // points))
+    buckets = np.minimum((timestamps - start) // width, points - 1)
+    counts = np.bincount(buckets, minlength=points)
+    sums = np.bincount(buckets, weights=prices, minlength=points)
+    lows = np.full(points, np.inf)
+    highs = np.full(points, -np.inf)
+    np.minimum.at(lows, buckets, prices)
+    np.maximum.at(highs, buckets, prices)
+
+    return [{
+        'start': int(start + bucket * width),
+        'min': round(float(lows[bucket]), 3),
+        'max': round(float(highs[bucket]), 3),
+        'mean': round(float(sums[bucket] / counts[bucket]), 3),
+        'count': int(counts[bucket]),
+    } for bucket in np.flatnonzero(counts).tolist()]
+
+
+class PriceHistory:
+    """
+    Day-segmented price tick store
+
+    Layout of `directory`:
+        stations.txt   - station ids, one per line; the line number is the station code
+        YYYY-MM-DD.bin - TICK_DTYPE records for that UTC day, in append order
+
+    A tick is written only when a station's price for a grade changes, so a
+    series is a step function: each price holds until the next tick.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._stations_path = os.path.join(directory, 'stations.txt')
+        self._codes: Dict[str, int] = {}
+        # (inode, bytes read) of stations.txt; other processes append to it
+        self._codes_read = (None, 0)
+        self._sync_codes()
+
+    def after_fork(self):
+        """Reset the lock in a forked worker and catch up on ids registered since the fork"""
+        self._lock = threading.Lock()
+        self._sync_codes()
+
+    def _segment_path(self, day: int) -> str:
+        name = time.strftime('%Y-%m-%d', time.gmtime(day * SECONDS_PER_DAY))
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _sync_codes(self, f=None):
+        """
+        Read station ids other processes appended to stations.txt (caller holds
+        the lock, or is __init__)
+
+        The file is append-only, so normally only its new tail is read. A file
+        that was replaced or truncated is read again from the start. An
+        unfinished last line is left for the next call.
+        """
+        try:
+            info = os.fstat(f.fileno()) if f is not None else os.stat(self._stations_path)
+        except FileNotFoundError:
+            return
+        inode, offset = self._codes_read
+        if info.st_ino != inode or info.st_size < offset:
+            self._codes, offset = {}, 0
+        if info.st_size == offset:
+            self._codes_read = (info.st_ino, offset)
+            return
+
+        if f is None:
+            with open(self._stations_path, 'rb') as f:
+                f.seek(offset)
+                tail = f.read()
+        else:
+            f.seek(offset)
+            tail = f.read()
+        complete = tail[:tail.rfind(b'\n') + 1]
+        for line in complete.decode('utf-8').splitlines():
+            self._codes.setdefault(line, len(self._codes))
+        self._codes_read = (info.st_ino, offset + len(complete))
+
+    def _station_codes(self, f, station_ids: List[str]) -> np.ndarray:
+        """
+        Codes for station_ids, registering unseen ids (caller holds the lock
+        and an exclusive flock on stations.txt, open as f)
+        """
+        self._sync_codes(f)
+        new_ids = [station_id for station_id in dict.fromkeys(station_ids)
+                   if station_id not in self._codes]
+        if new_ids:
+            data = ''.join(f"{station_id}\n" for station_id in new_ids).encode('utf-8')
+            f.write(data)
+            f.flush()
+            for station_id in new_ids:
+                self._codes[station_id] = len(self._codes)
+            self._codes_read = (self._codes_read[0], self._codes_read[1] + len(data))
+        return np.fromiter((self._codes[station_id] for station_id in station_ids),
+                           dtype=np.uint32, count=len(station_ids))
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold this process's lock and an exclusive flock on stations.txt
+
+        Every process that records history appends to the same stations.txt
+        and segment files; the flock keeps their station codes consistent and
+        their records from interleaving.
+        """
+        with self._lock, open(self._stations_path, 'ab+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def has_data(self) -> bool:
+        return any(name.endswith('.bin') for name in os.listdir(self.directory))
+
+    def _segment_days(self, first: int, last: int) -> List[int]:
+        """Sorted day numbers in [first, last] that have a segment file"""
+        days = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.bin'):
+                continue
+            try:
+                day = datetime.date.fromisoformat(name[:-4]).toordinal() - EPOCH_ORDINAL
+            except ValueError:
+                continue
+            if first <= day <= last:
+                days.append(day)
+        return sorted(days)
+
+    def record(self, store: StationStore, timestamp: Optional[float] = None,
+               previous: Optional[StationStore] = None) -> int:
+        """
+        Append ticks for a snapshot and return how many were written
+
+        With `previous` (the snapshot it replaces) only changed prices are
+        written; otherwise every price the snapshot has is.
+        """
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        same_stations = previous is not None and previous.station_ids == store.station_ids
+
+        ticks = []
+        for grade in GRADES:
+            after = store.prices[grade]
+            if same_stations:
+                before = previous.prices[grade]
+                rows = np.flatnonzero((before != after) & ~(np.isnan(before) & np.isnan(after)))
+            else:
+                rows = np.flatnonzero(~np.isnan(after))
+            if rows.size:
+                ticks.append((grade, rows, after[rows]))
+        if not ticks:
+            return 0
+
+        with self._writing() as f:
+            codes = self._station_codes(f, store.station_ids)
+            records = np.empty(sum(rows.size for _, rows, _ in ticks), dtype=TICK_DTYPE)
+            records['ts'] = timestamp
+            offset = 0
+            for grade, rows, prices in ticks:
+                block = records[offset:offset + rows.size]
+                block['station'] = codes[rows]
+                block['grade'] = GRADE_CODES[grade]
+                block['price'] = prices
+                offset += rows.size
+            self._append(records, timestamp)
+        return records.size
+
+    def record_changes(self, changes: List[Dict], timestamp: Optional[float] = None) -> int:
+        """
+        Append ticks for price changes in the price feed's form
+        ({station_id, grade, old_price, new_price}) and return how many were written
+        """
+        if not changes:
+            return 0
+        timestamp = int(time.time() if timestamp is None else timestamp)
+
+        with self._writing() as f:
+            records = np.empty(len(changes), dtype=TICK_DTYPE)
+            records['ts'] = timestamp
+            records['station'] = self._station_codes(f, [change['station_id'] for change in changes])
+            records['grade'] = [GRADE_CODES[change['grade']] for change in changes]
+            records['price'] = [np.nan if change['new_price'] is None else change['new_price']
+                                for change in changes]
+            self._append(records, timestamp)
+        return records.size
+
+    def _append(self, records: np.ndarray, timestamp: int):
+        """Append records to the segment for timestamp's day (caller is in _writing())"""
+        with open(self._segment_path(timestamp // SECONDS_PER_DAY), 'ab') as f:
+            f.write(records.tobytes())
+
+    def _segment(self, day: int) -> Optional[np.ndarray]:
+        path = self._segment_path(day)
+        try:
+            count = os.path.getsize(path) // TICK_DTYPE.itemsize
+        except OSError:
+            return None
+        if not count:
+            return None
+        # A concurrent append may have left a partial record at the end; map whole records only
+        return np.memmap(path, dtype=TICK_DTYPE, mode='r', shape=(count,))
+
+    def series(self, station_id: str, grade: str, start: int,
+               end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ticks for one station and grade with start <= timestamp <= end
+
+        Returns:
+            (timestamps, prices) arrays in time order; a NaN price means the
+            grade stopped being sold at that time
+        """
+        with self._lock:
+            self._sync_codes()
+            code = self._codes.get(station_id)
+        if code is None or grade not in GRADE_CODES or end < start:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        timestamps, prices = [], []
+        # Only days that have a segment file; a wide range costs nothing for the empty days in it
+        for day in self._segment_days(start // SECONDS_PER_DAY, end // SECONDS_PER_DAY):
+            segment = self._segment(day)
+            if segment is None:
+                continue
+            mask = (segment['station'] == code) & (segment['grade'] == GRADE_CODES[grade])
+            mask &= (segment['ts'] >= start) & (segment['ts'] <= end)
+            matches = segment[mask]
+            timestamps.append(np.array(matches['ts']))
+            prices.append(np.array(matches['price']))
+
+        if not timestamps:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        timestamps, prices = np.concatenate(timestamps), np.concatenate(prices)
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], prices[order]
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Ranking helpers for station search results
+Partial (top-K) selection so a result page does not pay for sorting every match,
+and the trip cost model behind the 'optimal' sort
+"""
+
+from typing import Optional
+
+import numpy as np
+
+# Walk the global price order in blocks of this many stations
+PRICE_WALK_BLOCK = 4096
+
+
+def top_k(keys: np.ndarray, tiebreak: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """
+    Positions of the k smallest keys, ordered by (key, tiebreak)
+
+    With k set this selects with np.argpartition (introselect, O(n)) and only
+    sorts the k survivors; without k it falls back to a full lexsort.
+    """
+    n = keys.size
+    if k is None or k >= n:
+        return np.lexsort((tiebreak, keys))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # Everything strictly below the k-th key is in; ties on the k-th key are
+    # settled by the tiebreak so results are deterministic
+    kth = np.partition(keys, k - 1)[k - 1]
+    chosen = np.flatnonzero(keys <= kth)
+    order = chosen[np.lexsort((tiebreak[chosen], keys[chosen]))]
+    return order[:k]
+
+
+def cheapest_within(price_order: np.ndarray, prices: np.ndarray, indices: np.ndarray,
+                    catalog_size: int, k: Optional[int] = None) -> np.ndarray:
+    """
+    Positions into `indices` of the k cheapest stations, cheapest first
+
+    Args:
+        price_order: Station indices with a price, sorted by (price, station index)
+        prices: Price column for the grade (NaN where not sold), by station index
+        indices: Candidate station indices (e.g. everything inside the radius)
+        catalog_size: Number of stations in the catalog
+        k: How many to return (None for all)
+
+    Stations without a price for the grade come last, in station order. When the
+    candidates are a large share of the catalog, walk the prebuilt price order
+    until k candidates are seen; otherwise select over the candidates directly.
+    """
+    if k is None or indices.size * 8 < catalog_size or k * 8 > indices.size:
+        keys = np.nan_to_num(prices[indices], nan=np.inf)
+        return top_k(keys, indices, k)
+
+    position = np.full(catalog_size, -1, dtype=np.int64)
+    position[indices] = np.arange(indices.size)
+
+    found = []
+    remaining = k
+    for start in range(0, price_order.size, PRICE_WALK_BLOCK):
+        block = position[price_order[start:start + PRICE_WALK_BLOCK]]
+        block = block[block >= 0][:remaining]
+        found.append(block)
+        remaining -= block.size
+        if remaining == 0:
+            break
+
+    if remaining:
+        # Not enough priced candidates; pad with unpriced ones in station order
+        unpriced = np.flatnonzero(np.isnan(prices[indices]))
+        unpriced = unpriced[np.argsort(indices[unpriced], kind='stable')]
+        found.append(unpriced[:remaining])
+
+    return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+def trip_costs(prices: np.ndarray, distances: np.ndarray, fill_gallons: float,
+               cost_per_mile: float, value_of_time: float = 0.0,
+               detour_factor: float = 2.0, speed_mph: float = 30.0) -> np.ndarray:
+    """
+    Total cost of filling up at each station, vectorized over all of them
+
+    total = fill_gallons * price
+            + detour miles * cost_per_mile
+            + detour hours * value_of_time
+
+    where the detour is `detour_factor` times the straight-line distance (out
+    and back by default) driven at `speed_mph`. Stations without a price for
+    the grade cost infinity.
+    """
+    detour = distances * detour_factor
+    costs = fill_gallons * prices + detour * (cost_per_mile + value_of_time / speed_mph)
+    return np.nan_to_num(costs, nan=np.inf)
+
+
+def cheapest_trips(prices: np.ndarray, distances: np.ndarray, tiebreak: np.ndarray,
+                   k: Optional[int] = None, **cost_options):
+    """
+    Positions of the k lowest-cost stations, cheapest first, and their costs
+
+    The fuel bill alone is a lower bound on a station's total cost. The k
+    stations with the smallest fuel bill give an upper bound for the k-th best
+    total; any station whose fuel bill already exceeds it is pruned before the
+    full cost model runs.
+    """
+    fill_gallons = cost_options['fill_gallons']
+    lower = np.nan_to_num(fill_gallons * prices, nan=np.inf)
+
+    candidates = np.arange(prices.size)
+    if k is not None and 0 < k < prices.size:
+        seed = top_k(lower, tiebreak, k)
+        bound = trip_costs(prices[seed], distances[seed], **cost_options).max()
+        if np.isfinite(bound):
+            candidates = np.flatnonzero(lower <= bound)
+
+    costs = trip_costs(prices[candidates], distances[candidates], **cost_options)
+    order = top_k(costs, tiebreak[candidates], k)
+    return candidates[order], costs[order]
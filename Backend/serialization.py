@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Pre-serialized station JSON
+Each station's static fields are encoded once per store version; responses
+splice in the per-request fields (distance_miles, duration, total_cost)
+instead of re-encoding every station dict on every request
+"""
+
+import json
+import os
+import threading
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from flask import Response, current_app
+
+from station_store import StationStore
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; without it output is byte-identical to jsonify
+    orjson = None
+
+# JSON_ENCODER=stdlib turns orjson off even when it is installed
+if os.getenv('JSON_ENCODER', '').lower() == 'stdlib':
+    orjson = None
+
+
+def _stdlib_dumps(value) -> str:
+    # Same settings as Flask's default provider in non-debug mode
+    return json.dumps(value, ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+
+
+def dumps(value) -> str:
+    """
+    Compact, key-sorted, ASCII-only JSON
+
+    With the stdlib encoder this is byte-identical to jsonify outside debug
+    mode. orjson gives the same bytes except for floats below 1e-4 or from
+    1e16 up, which it writes in a shorter but equal exponent form.
+    """
+    if orjson is not None:
+        try:
+            raw = orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            raw = b''
+        # orjson writes non-ASCII as UTF-8 rather than \u escapes; leave those to the stdlib
+        if raw and raw.isascii():
+            return raw.decode('ascii')
+    return _stdlib_dumps(value)
+
+
+def encode_value(value) -> str:
+    """JSON for one per-request scalar, without a full encoder call for the common cases"""
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if type(value) is int:
+        return int.__repr__(value)
+    if type(value) is float and value == value and value not in (float('inf'), float('-inf')):
+        return float.__repr__(value)
+    return _stdlib_dumps(value)
+
+
+class StationFragments:
+    """
+    Encoded stations for one store version
+
+    Fragments are built lazily (or all at once with warm()) and kept for the
+    life of the store. Every fragment has the same top-level keys, so the
+    point where each extra field belongs in sorted key order is the same for
+    all stations and is located by a single substring search.
+    """
+
+    def __init__(self, store: StationStore):
+        self.store = store
+        self._fragments: List[Optional[str]] = [None] * len(store)
+        self._static_keys = sorted(store.record(0).to_dict()) if len(store) else []
+
+    def fragment(self, index: int) -> str:
+        text = self._fragments[index]
+        if text is None:
+            text = self._fragments[index] = dumps(self.store.record(index).to_dict())
+        return text
+
+    def warm(self):
+        """Encode every station up front (e.g. before a new snapshot goes live)"""
+        for i in range(len(self.store)):
+            self.fragment(i)
+
+    def _insertion_markers(self, extra_keys: Sequence[str]) -> List[tuple]:
+        """
+        For each group of extra keys, the static key it goes in front of
+
+        Returns (marker, keys) pairs in key order, where marker is the text
+        ',"<static key>":' to insert before, or None to append at the end.
+        """
+        groups: Dict[Optional[str], List[str]] = {}
+        for key in sorted(extra_keys):
+            following = next((k for k in self._static_keys if k > key), None)
+            if self._static_keys and following == self._static_keys[0]:
+                raise ValueError(f"Extra field {key!r} would sort before every station field")
+            groups.setdefault(following, []).append(key)
+        return [(f',{dumps(k)}:' if k is not None else None, keys) for k, keys in groups.items()]
+
+    def encode(self, indices: Iterable[int], extras: Optional[Dict[str, Sequence]] = None) -> Iterator[str]:
+        """
+        Yield one JSON object per station, with extras[key][position] spliced in
+
+        Without extras this is just the cached fragments. Extra values are
+        encoded as given, so round them the way the response should show them.
+        """
+        if not extras:
+            for i in indices:
+                yield self.fragment(i)
+            return
+        # An empty store has no key order to splice into, and nothing to encode
+        if not self._static_keys:
+            return
+
+        markers = self._insertion_markers(list(extras))
+        encoded_keys = {key: f',{dumps(key)}:' for key in extras}
+        for position, i in enumerate(indices):
+            text = self.fragment(i)
+            pieces = []
+            start = 0
+            for marker, keys in markers:
+                end = text.index(marker, start) if marker is not None else len(text) - 1
+                pieces.append(text[start:end])
+                for key in keys:
+                    pieces.append(encoded_keys[key])
+                    pieces.append(encode_value(extras[key][position]))
+                start = end
+            pieces.append(text[start:])
+            yield ''.join(pieces)
+
+
+class FragmentCache:
+    """
+    StationFragments per live store
+
+    Keyed weakly by store, so a refresh can warm the next snapshot while
+    requests still use the current one, and a snapshot's fragments are freed
+    with it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_store: "weakref.WeakKeyDictionary[StationStore, StationFragments]" = weakref.WeakKeyDictionary()
+
+    def get(self, store: StationStore) -> StationFragments:
+        fragments = self._by_store.get(store)
+        if fragments is None:
+            with self._lock:
+                fragments = self._by_store.get(store)
+                if fragments is None:
+                    fragments = self._by_store[store] = StationFragments(store)
+        return fragments
+
+
+def can_splice() -> bool:
+    """False when the app pretty-prints JSON (debug mode), so jsonify must be used"""
+    provider = current_app.json
+    compact = getattr(provider, 'compact', None)
+    return not (compact is False or (compact is None and current_app.debug))
+
+
+def encode_envelope(fields: Dict, results: Iterable[str]) -> str:
+    """Encode a response dict whose 'results' list is already encoded, one JSON text per item"""
+    parts = []
+    for key in sorted(list(fields) + ['results']):
+        value = '[' + ','.join(results) + ']' if key == 'results' else dumps(fields[key])
+        parts.append(f'{dumps(key)}:{value}')
+    return '{' + ','.join(parts) + '}'
+
+
+def json_response(fields: Dict, results: Iterable[str]) -> Response:
+    """jsonify({**fields, 'results': [...]}) for pre-encoded results"""
+    return current_app.response_class(encode_envelope(fields, results) + "\n",
+                                      mimetype=current_app.json.mimetype)
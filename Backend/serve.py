@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Production server for the Gas Station Finder
+Imports the app once - loading the station snapshot and its indexes - then
+pre-forks worker processes that all accept connections on one listening
+socket. Workers inherit the snapshot copy-on-write instead of loading their
+own, so every core is used without multiplying memory by the worker count.
+Each worker serves its connections on threads, at most --threads at once; a
+worker at that limit stops accepting and leaves new connections queued for
+its siblings.
+
+    python serve.py                      # one worker per core on port 5000
+    python serve.py --workers 4 --port 8080 --host 0.0.0.0 --threads 32
+
+The app module may define before_fork() (run once in the parent) and
+after_fork() (run in every worker) to share what can be shared and to reopen
+what cannot, e.g. database connections.
+"""
+
+import argparse
+import gc
+import importlib
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Dict
+
+from werkzeug.serving import ThreadedWSGIServer
+
+# A worker that dies sooner than this after starting is restarted only after a pause
+MIN_WORKER_LIFETIME = 1.0
+# How long a worker at its thread limit waits for a free thread before polling again
+ACCEPT_WAIT = 0.5
+
+
+class BoundedWSGIServer(ThreadedWSGIServer):
+    """
+    Werkzeug's threaded server, with at most `threads` connections served at once
+
+    A connection is accepted only once a thread is free. Until then it stays
+    in the listen queue, where another worker sharing the socket can take it.
+    """
+
+    def __init__(self, host: str, port: int, app, threads: int, fd: int):
+        self.slots = threading.BoundedSemaphore(threads)
+        self._slot_taken = False
+        super().__init__(host, port, app, fd=fd)
+
+    def _handle_request_noblock(self):
+        if not self.slots.acquire(timeout=ACCEPT_WAIT):
+            return
+        self._slot_taken = True
+        try:
+            super()._handle_request_noblock()
+        finally:
+            # Nothing was handed to a thread (e.g. the accept failed); give the slot back
+            if self._slot_taken:
+                self.slots.release()
+
+    def process_request(self, request, client_address):
+        super().process_request(request, client_address)
+        # The new thread now owns the slot and releases it when it finishes
+        self._slot_taken = False
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.slots.release()
+
+
+def load_app(spec: str):
+    """(module, WSGI app) for a 'module:attribute' spec"""
+    module_name, _, attribute = spec.partition(':')
+    module = importlib.import_module(module_name)
+    return module, getattr(module, attribute or 'app')
+
+
+def run_worker(listener: socket.socket, host: str, port: int, app, module, threads: int):
+    """Serve on the inherited socket until SIGTERM; never returns"""
+    status = 0
+    try:
+        # The parent handles Ctrl+C and then stops the workers with SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        hook = getattr(module, 'after_fork', None)
+        if hook is not None:
+            hook()
+        server = BoundedWSGIServer(host, port, app, threads, listener.fileno())
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever() to return, so it needs another thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        server.serve_forever()
+    except BaseException as e:
+        print(f"❌ Worker {os.getpid()} failed: {e}")
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Skip the parent's atexit handlers and buffered state
+        os._exit(status)
+
+
+class Prefork:
+    """Parent process: forks the workers, restarts any that exit, stops them on a signal"""
+
+    def __init__(self, listener: socket.socket, host: str, port: int, app, module, workers: int,
+                 threads: int):
+        self.listener = listener
+        self.host = host
+        self.port = port
+        self.app = app
+        self.module = module
+        self.worker_count = workers
+        self.threads = threads
+        self.workers: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.listener, self.host, self.port, self.app, self.module, self.threads)
+        self.workers[pid] = time.monotonic()
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.worker_count):
+            self.spawn()
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            print(f"⚠️ Worker {pid} exited (status {status}); starting a replacement")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            if not self.stopping:
+                self.spawn()
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Gas Station Finder with pre-forked workers.")
+    parser.add_argument('--app', default='priceUpdater:app', help="WSGI app as module:attribute")
+    parser.add_argument('--host', default=os.getenv('HOST', '127.0.0.1'), help="Address to listen on")
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '5000')), help="Port to listen on")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', os.cpu_count() or 1)),
+                        help="Worker processes (default: one per core)")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', '64')),
+                        help="Connections each worker serves at once (default: 64)")
+    parser.add_argument('--backlog', type=int, default=1024, help="Listen queue length")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.threads < 1:
+        print("❌ --threads must be at least 1")
+        sys.exit(1)
+
+    # Bind before loading the app, so a busy port fails fast
+    try:
+        listener = socket.create_server((args.host, args.port), backlog=args.backlog,
+                                        family=socket.AF_INET6 if ':' in args.host else socket.AF_INET)
+    except OSError as e:
+        print(f"❌ Could not listen on {args.host}:{args.port}: {e}")
+        sys.exit(1)
+    listener.set_inheritable(True)
+
+    module, app = load_app(args.app)
+    hook = getattr(module, 'before_fork', None)
+    if hook is not None:
+        hook()
+
+    # Move everything loaded so far out of the collector's reach: collections in
+    # a worker would otherwise write to (and so copy) every shared object's page
+    gc.collect()
+    gc.freeze()
+
+    url_host = f"[{args.host}]" if ':' in args.host else args.host
+    if not hasattr(os, 'fork') or args.workers <= 1:
+        print(f"🌐 Serving on http://{url_host}:{args.port} (1 process)")
+        try:
+            BoundedWSGIServer(args.host, args.port, app, args.threads, listener.fileno()).serve_forever()
+        except KeyboardInterrupt:
+            print("\n🛑 Server stopped by user")
+        return
+
+    print(f"🌐 Serving on http://{url_host}:{args.port} with {args.workers} workers")
+    print("🛑 Press Ctrl+C to stop the server")
+    Prefork(listener, args.host, args.port, app, module, args.workers, args.threads).run()
+    print("\n🛑 Server stopped")
+
+
+if __name__ == '__main__':
+    main()
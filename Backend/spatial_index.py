@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Spatial index for gas station lookups
+Buckets stations into a fixed lat/lon grid so radius and nearest-station
+queries only touch the cells around the search point
+"""
+
+import heapq
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from distance import SPHERICAL_ERROR, haversine_miles, within_radius
+
+MILES_PER_DEGREE_LAT = 69.0
+
+
+def lon_span_deg(lat: float, miles: float) -> float:
+    """
+    Degrees of longitude covering `miles` anywhere in the bounding box of a
+    `miles` circle around `lat`
+
+    A degree of longitude is shortest at the box's poleward edge, so the span
+    is measured there; measured at `lat` it would fall short near that edge.
+    """
+    poleward = abs(lat) + miles / MILES_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(min(poleward, 89.0)))
+    return miles / (MILES_PER_DEGREE_LAT * cos_lat)
+
+
+class StationSpatialIndex:
+    """
+    Uniform grid index over station coordinates
+
+    Each station is stored in the bucket for its (lat, lon) cell. A radius query
+    visits only the cells overlapping the search circle's bounding box, and a
+    k-nearest query expands ring by ring until no unvisited cell can hold a
+    closer station.
+    """
+
+    def __init__(self, lats, lons, cell_size_deg: float = 0.05):
+        """
+        Args:
+            lats, lons: Station coordinates in station order (NaN for unknown)
+            cell_size_deg: Grid cell edge in degrees (0.05 deg is ~3.5 miles of latitude)
+        """
+        self.cell_size = cell_size_deg
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.buckets: Dict[Tuple[int, int], np.ndarray] = {}
+        # (min row, max row, min col, max col) of the non-empty cells, or None
+        self.bounds: Optional[Tuple[int, int, int, int]] = None
+
+        valid = np.flatnonzero(~(np.isnan(self.lats) | np.isnan(self.lons)))
+        if valid.size == 0:
+            return
+
+        # Group station indices by cell with one sort instead of per-station appends
+        rows = np.floor(self.lats[valid] / cell_size_deg).astype(np.int64)
+        cols = np.floor(self.lons[valid] / cell_size_deg).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        rows, cols, valid = rows[order], cols[order], valid[order]
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])])
+        ends = np.r_[starts[1:], valid.size]
+        for start, end in zip(starts, ends):
+            self.buckets[(int(rows[start]), int(cols[start]))] = valid[start:end]
+        self.bounds = (int(rows[0]), int(rows[-1]), int(cols.min()), int(cols.max()))
+
+    @classmethod
+    def from_cells(cls, lats, lons, cell_size_deg: float, cells: np.ndarray,
+                   starts: np.ndarray, stations: np.ndarray) -> "StationSpatialIndex":
+        """
+        Rebuild an index from the arrays returned by cell_arrays()
+
+        Buckets are slices of `stations`, so nothing is copied (the arrays can
+        be views into a memory-mapped file).
+        """
+        index = cls.__new__(cls)
+        index.cell_size = cell_size_deg
+        index.lats = np.asarray(lats, dtype=np.float64)
+        index.lons = np.asarray(lons, dtype=np.float64)
+        bounds = starts.tolist() + [stations.size]
+        index.buckets = {(row, col): stations[bounds[i]:bounds[i + 1]]
+                         for i, (row, col) in enumerate(cells.tolist())}
+        index.bounds = None
+        if len(cells):
+            index.bounds = (int(cells[:, 0].min()), int(cells[:, 0].max()),
+                            int(cells[:, 1].min()), int(cells[:, 1].max()))
+        return index
+
+    def cell_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The grid as flat arrays, for saving alongside the station data
+
+        Returns:
+            (cells, starts, stations) - (n, 2) int64 cell rows/cols, the offset
+            of each cell's bucket in `stations`, and all buckets concatenated
+        """
+        cells = np.array(list(self.buckets), dtype=np.int64).reshape(-1, 2)
+        buckets = list(self.buckets.values())
+        sizes = np.array([bucket.size for bucket in buckets], dtype=np.int64)
+        starts = np.zeros(len(buckets), dtype=np.int64)
+        np.cumsum(sizes[:-1], out=starts[1:])
+        stations = np.concatenate(buckets).astype(np.int64) if buckets else np.empty(0, dtype=np.int64)
+        return cells, starts, stations
+
+    def __len__(self) -> int:
+        return self.lats.size
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def _lon_span_deg(self, lat: float, miles: float) -> float:
+        return lon_span_deg(lat, miles)
+
+    def _gather(self, cells) -> np.ndarray:
+        found = [self.buckets[cell] for cell in cells if cell in self.buckets]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return found[0] if len(found) == 1 else np.concatenate(found)
+
+    def candidates(self, lat: float, lon: float, radius_miles: float) -> np.ndarray:
+        """Indices of stations in the cells overlapping the radius' bounding box"""
+        padded = radius_miles * (1 + SPHERICAL_ERROR)
+        lat_span = padded / MILES_PER_DEGREE_LAT
+        lon_span = self._lon_span_deg(lat, padded)
+        row_lo, col_lo = self._cell(lat - lat_span, lon - lon_span)
+        row_hi, col_hi = self._cell(lat + lat_span, lon + lon_span)
+
+        # A huge radius covers more cells than there are buckets; scan buckets instead
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(self.buckets):
+            cells = [cell for cell in self.buckets
+                     if row_lo <= cell[0] <= row_hi and col_lo <= cell[1] <= col_hi]
+        else:
+            cells = [(row, col) for row in range(row_lo, row_hi + 1)
+                     for col in range(col_lo, col_hi + 1)]
+        return self._gather(cells)
+
+    def query_radius(self, lat: float, lon: float, radius_miles: float,
+                     refine: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find all stations within radius_miles of (lat, lon)
+
+        Returns:
+            (station indices, distances in miles), unordered
+        """
+        candidates = self.candidates(lat, lon, radius_miles)
+        positions, distances = within_radius(
+            lat, lon, self.lats[candidates], self.lons[candidates], radius_miles, refine)
+        return candidates[positions], distances
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                max_radius_miles: Optional[float] = None) -> List[Tuple[int, float]]:
+        """
+        Find the k stations closest to (lat, lon)
+
+        Returns:
+            List of (station index, distance in miles), closest first
+        """
+        if k <= 0 or not self.buckets:
+            return []
+
+        center_row, center_col = self._cell(lat, lon)
+        row_min, row_max, col_min, col_max = self.bounds
+        max_ring = max(abs(center_row - row_min), abs(center_row - row_max),
+                       abs(center_col - col_min), abs(center_col - col_max))
+
+        best: List[Tuple[float, int]] = []  # max-heap of (-distance, index)
+        for ring in range(max_ring + 1):
+            ring_indices = self._gather(self._ring_cells(center_row, center_col, ring))
+            if ring_indices.size:
+                distances = haversine_miles(lat, lon, self.lats[ring_indices],
+                                            self.lons[ring_indices])
+                for i, distance in zip(ring_indices.tolist(), distances.tolist()):
+                    if max_radius_miles is not None and distance > max_radius_miles:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, i))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, i))
+
+            # Every unvisited cell is at least `covered` miles away: `ring` cells
+            # of latitude, or of longitude measured where those cells are
+            # narrowest, at the poleward edge of the rows visited so far
+            poleward = max(abs(center_row - ring), abs(center_row + ring + 1)) * self.cell_size
+            covered = ring * self.cell_size * MILES_PER_DEGREE_LAT * math.cos(
+                math.radians(min(poleward, 89.0)))
+            if len(best) == k and -best[0][0] <= covered:
+                break
+            if max_radius_miles is not None and covered > max_radius_miles:
+                break
+
+        return sorted(((i, -neg) for neg, i in best), key=lambda item: item[1])
+
+    @staticmethod
+    def _ring_cells(center_row: int, center_col: int, ring: int):
+        """Yield the cells on the square ring `ring` steps out from the center"""
+        if ring == 0:
+            yield (center_row, center_col)
+            return
+        for col in range(center_col - ring, center_col + ring + 1):
+            yield (center_row - ring, col)
+            yield (center_row + ring, col)
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield (row, center_col - ring)
+            yield (row, center_col + ring)
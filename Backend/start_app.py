@@ -22,15 +22,16 @@ def check_port(port):
 def kill_existing_processes():
     """Kill any existing Flask processes"""
     try:
-        subprocess.run(["pkill", "-f", "gas_station_finder_web.py"], 
-                      capture_output=True, text=True)
+        for script in ("serve.py", "priceUpdater.py"):
+            subprocess.run(["pkill", "-f", script],
+                          capture_output=True, text=True)
         subprocess.run(["pkill", "-f", "flask"], 
                       capture_output=True, text=True)
         print("🧹 Cleaned up existing processes")
     except:
         pass
 
-def start_application():
+def start_application(server_args=()):
     """Start the Flask application"""
     print("🚀 Starting Gas Station Finder...")
     
@@ -41,7 +42,10 @@ def start_application():
     # Try to start the application
     try:
         print("🌐 Launching web interface...")
-        subprocess.run([sys.executable, "gas_station_finder_web.py"])
+        # serve.py pre-forks one worker per core; extra arguments (e.g. --workers 4) go to it
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        subprocess.run([sys.executable, os.path.join(backend_dir, "serve.py"), *server_args],
+                       cwd=backend_dir)
     except KeyboardInterrupt:
         print("\n🛑 Application stopped by user")
     except Exception as e:
@@ -67,7 +71,7 @@ def main():
         command = sys.argv[1]
         
         if command == "start":
-            start_application()
+            start_application(sys.argv[2:])
         elif command == "stop":
             kill_existing_processes()
             print("🛑 Application stopped")
@@ -76,7 +80,7 @@ def main():
         elif command == "restart":
             kill_existing_processes()
             time.sleep(2)
-            start_application()
+            start_application(sys.argv[2:])
         else:
             print("❌ Unknown command. Use: start, stop, status, or restart")
     else:
@@ -90,6 +94,7 @@ def main():
         print("")
         print("Examples:")
         print("  python3 start_app.py start")
+        print("  python3 start_app.py start --workers 4 --port 8080")
         print("  python3 start_app.py status")
 
 if __name__ == "__main__":
@@ -0,0 +1,890 @@
+#!/usr/bin/env python3
+"""
+Station repositories for the Gas Station Finder
+Where GasStationFinderWeb reads stations from: a JSON or binary file held in
+memory as one StationStore, or - so a catalog does not have to fit in each
+worker's memory - an SQLite database queried per request or a directory of
+geohash tiles loaded as queries reach them.
+
+Every read returns a StationStore plus row indices into it. For file
+repositories that store is the whole catalog; for SQLite and tiles it holds
+only part of it, with the rows' catalog positions in `store.positions`.
+"""
+
+import bisect
+import filecmp
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from atomic_file import atomic_open
+from cache import MISSING, SizedLRUCache
+from distance import SPHERICAL_ERROR, within_radius
+from geohash import cell_of, cells_of, decode_cell, encode_cell, grid_shape
+from metrics import span
+from price_feed import diff_stores
+from ranking import top_k
+from spatial_index import MILES_PER_DEGREE_LAT, lon_span_deg
+from station_store import GRADES, StationStore, next_version
+
+# STATIONS_FILE paths with this suffix are read and written in the binary format
+BINARY_SUFFIX = '.bin'
+# ...and paths with these suffixes are SQLite databases
+SQLITE_SUFFIXES = ('.sqlite3', '.sqlite', '.db')
+
+# Stations per query when walking a whole SQLite catalog
+PAGE_BATCH = 50_000
+
+# Longest possible great-circle distance; a nearest-station search stops here
+MAX_SEARCH_MILES = 12_500.0
+
+SearchResult = Tuple[StationStore, np.ndarray, np.ndarray]
+
+
+def save_as_json(stations_dict: Dict, filename: str):
+    # Readers only ever see the complete old file or the complete new one
+    with atomic_open(filename) as f:
+        json.dump(stations_dict, f, indent=2)
+
+
+class StationRepository:
+    """
+    Interface shared by the station sources
+
+    version changes whenever the data does and is never reused, so caches can
+    key on it; loaded_at is when that data was written.
+    """
+
+    version: int
+    loaded_at: float
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def brand_names(self) -> List[str]:
+        """Distinct brand names, sorted"""
+        raise NotImplementedError
+
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        """Counters for the repository's own cache, if it has one"""
+        return None
+
+    def after_fork(self):
+        """Replace anything a forked worker must not share with its parent, e.g. connections"""
+
+    def station_id_at(self, lat: float, lon: float) -> Optional[str]:
+        """Id of the station at exactly these coordinates (to 6 decimals), if any"""
+        raise NotImplementedError
+
+    def search(self, lat: float, lon: float, radius: float, brand: Optional[str] = None,
+               grade: Optional[str] = None) -> SearchResult:
+        """
+        Stations within `radius` miles, optionally of one brand (case-insensitive)
+        and selling one grade
+
+        Returns:
+            (store, indices, distances in miles) - unordered
+        """
+        raise NotImplementedError
+
+    def nearest(self, lat: float, lon: float, k: int,
+                max_radius: Optional[float] = None) -> Tuple[StationStore, List[Tuple[int, float]]]:
+        """The k closest stations as (store, [(index, distance), ...]), closest first"""
+        # Widen the search until it holds k stations; everything closer than
+        # the radius is then inside it
+        limit = MAX_SEARCH_MILES if max_radius is None else max_radius
+        radius = min(5.0, limit)
+        while True:
+            store, indices, distances = self.search(lat, lon, radius)
+            if len(indices) >= k or radius >= limit:
+                break
+            radius = min(radius * 4, limit)
+        order = top_k(distances, indices, k)
+        return store, list(zip(indices[order].tolist(), distances[order].tolist()))
+
+    def page(self, start: int, count: Optional[int] = None) -> Tuple[StationStore, np.ndarray]:
+        """Up to `count` stations from catalog position `start` on, in catalog order"""
+        raise NotImplementedError
+
+    def pages(self) -> Iterator[Tuple[StationStore, np.ndarray]]:
+        """The whole catalog in catalog order, a batch at a time"""
+        start = 0
+        while True:
+            store, indices = self.page(start, PAGE_BATCH)
+            if not len(indices):
+                return
+            yield store, indices
+            start = int(store.catalog_positions(indices[-1:])[0]) + 1
+
+    def replace(self, stations_dict: Dict,
+                prepare: Optional[Callable[[StationStore], None]] = None) -> List[Dict]:
+        """
+        Make stations_dict (the stations.json layout) the catalog
+
+        `prepare` is called with the new snapshot before it goes live, when
+        the repository has one. Returns the price changes in diff_stores() form.
+        """
+        raise NotImplementedError
+
+
+def _file_fingerprint(path: str) -> Optional[tuple]:
+    """(inode, mtime, size) of a file, which changes whenever it is replaced; None if missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _search_store(store: StationStore, lat: float, lon: float, radius: float,
+                  brand: Optional[str], grade: Optional[str]) -> SearchResult:
+    """StationRepository.search() over one in-memory store"""
+    # 1. Pull only the stations in grid cells near the user and measure them
+    # in one vectorized pass. Stations right at the radius boundary get an
+    # exact geodesic distance so the cut-off matches the old behaviour.
+    with span('distance'):
+        indices, distances = store.index.query_radius(lat, lon, radius)
+
+    # 2. Filter with boolean masks over the store's columns
+    with span('filter'):
+        mask = np.ones(len(indices), dtype=bool)
+        if brand is not None:
+            mask &= store.brand_mask(brand, indices)
+        if grade is not None:
+            mask &= ~np.isnan(store.prices[grade][indices])
+    return store, indices[mask], distances[mask]
+
+
+class FileStationRepository(StationRepository):
+    """
+    stations.json or a binary station file, loaded into one in-memory snapshot
+
+    `store` is the current snapshot: requests read it once and keep using that
+    object, and replace() swaps in a new one with a single assignment. When
+    another process (e.g. a sibling worker) replaces the file, a read of
+    `store` starts loading the new file on a background thread and keeps
+    returning the current snapshot until it is ready; on_reload(old, new) is
+    called after the swap, if set. A .bin file is mapped, not parsed, so its
+    reload is immediate and its pages stay shared between processes. A JSON
+    file is parsed again in every process that reloads it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.on_reload: Optional[Callable[[StationStore, StationStore], None]] = None
+        self._lock = threading.Lock()
+        # Set while replace() rewrites the file, which it then swaps in itself
+        self._writing = False
+        # Counts replace() swaps, so a background reload can tell it was overtaken
+        self._generation = 0
+        self._reloader: Optional[threading.Thread] = None
+        self._fingerprint = _file_fingerprint(path)
+        self._store = self.load(path)
+
+    def after_fork(self):
+        # A reload running in the parent at fork time does not exist in the worker
+        self._lock = threading.Lock()
+        self._reloader = None
+
+    @property
+    def store(self) -> StationStore:
+        fingerprint = _file_fingerprint(self.path)
+        # A missing file keeps the current snapshot rather than emptying it
+        if (fingerprint is not None and fingerprint != self._fingerprint
+                and not self._writing and self._reloader is None):
+            with self._lock:
+                if fingerprint != self._fingerprint and not self._writing and self._reloader is None:
+                    self._reloader = threading.Thread(target=self._reload, name="station-reload",
+                                                      daemon=True)
+                    self._reloader.start()
+        return self._store
+
+    def _reload(self):
+        """Load the file another process wrote and swap it in (runs on the reloader thread)"""
+        try:
+            while True:
+                generation = self._generation
+                fingerprint = _file_fingerprint(self.path)
+                if fingerprint is None or fingerprint == self._fingerprint:
+                    return
+                new_store = self.load(self.path)
+                with self._lock:
+                    # replace() ran meanwhile; its snapshot is newer than this one
+                    if self._writing or generation != self._generation:
+                        return
+                    # Replaced again while loading: start over with the newest file
+                    if _file_fingerprint(self.path) != fingerprint:
+                        continue
+                    old_store, self._store = self._store, new_store
+                    self._fingerprint = fingerprint
+                    # Under the lock, so listeners see reloads in order
+                    if self.on_reload is not None:
+                        self.on_reload(old_store, new_store)
+                    return
+        except Exception as e:
+            print(f"❌ Could not reload '{self.path}': {e}")
+        finally:
+            with self._lock:
+                self._reloader = None
+
+    @property
+    def version(self) -> int:
+        return self.store.version
+
+    @property
+    def loaded_at(self) -> float:
+        return self.store.loaded_at
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @classmethod
+    def load(cls, path: str) -> StationStore:
+        """Load a .bin file (memory-mapped) or a JSON file"""
+        if path.endswith(BINARY_SUFFIX):
+            return cls.load_binary(path)
+        return cls.load_json(path)
+
+    @staticmethod
+    def load_binary(path: str) -> StationStore:
+        """Map a binary station file written by priceGenerator.py --binary"""
+        try:
+            return StationStore.load_binary(path)
+        except FileNotFoundError:
+            print(f"❌ CRITICAL ERROR: The data file '{path}' was not found.")
+            print("💡 Run 'python priceGenerator.py --binary stations.bin' to generate it.")
+            return StationStore.empty()
+        except (ValueError, KeyError) as e:
+            print(f"❌ CRITICAL ERROR: Could not read station binary '{path}': {e}")
+            return StationStore.empty()
+
+    @staticmethod
+    def load_json(path: str) -> StationStore:
+        """Load gas station data from a JSON file into a columnar store with its spatial index."""
+        # ========================================
+        # HOOK: GAS PRICING INFORMATION SOURCE
+        # ========================================
+        # This is where gas station data is loaded from a static file.
+        # To update the data, run 'Gas Stations.py' manually.
+        try:
+            return StationStore.load_json(path)
+        except FileNotFoundError:
+            print(f"❌ CRITICAL ERROR: The data file '{path}' was not found.")
+            print("💡 Please create a 'stations.json' file or run 'Gas Stations.py' to generate it.")
+            return StationStore.empty()
+        except json.JSONDecodeError:
+            print(f"❌ CRITICAL ERROR: Could not decode JSON from '{path}'. The file might be corrupt.")
+            return StationStore.empty()
+        except Exception as e:
+            print(f"❌ An unexpected error occurred while loading '{path}': {e}")
+            return StationStore.empty()
+
+    def brand_names(self) -> List[str]:
+        return sorted(name for name in self.store.brand_names if name)
+
+    def station_id_at(self, lat: float, lon: float) -> Optional[str]:
+        return self.store.station_id_at(lat, lon)
+
+    def search(self, lat: float, lon: float, radius: float, brand: Optional[str] = None,
+               grade: Optional[str] = None) -> SearchResult:
+        return _search_store(self.store, lat, lon, radius, brand, grade)
+
+    def nearest(self, lat: float, lon: float, k: int,
+                max_radius: Optional[float] = None) -> Tuple[StationStore, List[Tuple[int, float]]]:
+        store = self.store
+        return store, store.index.nearest(lat, lon, k, max_radius)
+
+    def page(self, start: int, count: Optional[int] = None) -> Tuple[StationStore, np.ndarray]:
+        store = self.store
+        end = len(store) if count is None else min(len(store), start + count)
+        return store, np.arange(start, max(start, end))
+
+    def pages(self) -> Iterator[Tuple[StationStore, np.ndarray]]:
+        # The snapshot is already in memory; one batch keeps its cached fragments in use
+        store = self.store
+        if len(store):
+            yield store, np.arange(len(store))
+
+    def replace(self, stations_dict: Dict,
+                prepare: Optional[Callable[[StationStore], None]] = None) -> List[Dict]:
+        with self._lock:
+            self._writing = True
+        try:
+            if self.path.endswith(BINARY_SUFFIX):
+                StationStore.from_json_dict(stations_dict).save_binary(self.path)
+                new_store = StationStore.load_binary(self.path)
+            else:
+                save_as_json(stations_dict, self.path)
+                new_store = StationStore.from_json_dict(
+                    stations_dict, loaded_at=os.path.getmtime(self.path))
+            if prepare is not None:
+                prepare(new_store)
+            with self._lock:
+                old_store, self._store = self._store, new_store
+                self._fingerprint = _file_fingerprint(self.path)
+                self._generation += 1
+        finally:
+            self._writing = False
+        return diff_stores(old_store, new_store)
+
+
+def _price_column(grade: str) -> str:
+    return f"price_{grade.lower()}"
+
+
+# Station columns in StationStore order: position, id, brand, address, zip, lat, lon, prices
+_COLUMNS = ("position", "station_id", "brand", "address", "zip_code", "lat", "lon") + tuple(
+    _price_column(grade) for grade in GRADES)
+_SELECT_COLUMNS = ", ".join(f"s.{column}" for column in _COLUMNS)
+_SELECT = f"SELECT {_SELECT_COLUMNS} FROM stations AS s"
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS stations ("
+    " position INTEGER PRIMARY KEY, station_id TEXT NOT NULL UNIQUE,"
+    " brand TEXT, address TEXT, zip_code TEXT, lat REAL, lon REAL, "
+    + ", ".join(f"{_price_column(grade)} REAL" for grade in GRADES) + ")",
+    # Each station is a zero-size box; the R*Tree answers bounding-box queries
+    "CREATE VIRTUAL TABLE IF NOT EXISTS station_locations USING rtree("
+    " id, min_lat, max_lat, min_lon, max_lon)",
+    "CREATE INDEX IF NOT EXISTS stations_brand ON stations (brand COLLATE NOCASE)",
+] + [
+    f"CREATE INDEX IF NOT EXISTS stations_{_price_column(grade)} ON stations ({_price_column(grade)})"
+    for grade in GRADES
+]
+
+
+def _station_rows(store: StationStore, first_position: int):
+    """(position, station_id, brand, address, zip, lat, lon, prices...) rows for a store"""
+    brands = [store.brand_names[code] if code >= 0 else None for code in store.brand_codes.tolist()]
+    zips = [store.zip_names[code] if code >= 0 else None for code in store.zip_codes.tolist()]
+
+    def column(values):
+        return [None if value != value else value for value in values.tolist()]
+
+    return zip(range(first_position, first_position + len(store)), store.station_ids, brands,
+               store.addresses, zips, column(store.lats), column(store.lons),
+               *(column(store.prices[grade]) for grade in GRADES))
+
+
+def _location_rows(rows):
+    """R*Tree entries for station rows that have coordinates"""
+    return [(row[0], row[5], row[5], row[6], row[6]) for row in rows
+            if row[5] is not None and row[6] is not None]
+
+
+class SQLiteStationRepository(StationRepository):
+    """
+    Stations in an SQLite database, queried per request
+
+    An R*Tree over the coordinates narrows a radius search to its bounding box
+    and the brand and grade filters run in the same query, so only matching
+    rows are read into memory. B-tree indexes on brand and on each grade's
+    price serve filters and orderings that do not start from a location.
+    replace() writes only the rows whose data changed.
+
+    Reads use one connection per thread; writes go through a single
+    connection. The database is in WAL mode, so readers never wait on a
+    writer. Changes committed by other processes are picked up too: they
+    bump `version` the next time it is read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = sqlite3.connect(path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        with self._writer:
+            for statement in _SCHEMA:
+                self._writer.execute(statement)
+
+        # PRAGMA data_version on a connection that never writes changes whenever
+        # any other connection commits, so it tracks our own writes as well
+        self._version_lock = threading.Lock()
+        self._monitor = sqlite3.connect(path, check_same_thread=False)
+        self._data_version = self._monitor.execute("PRAGMA data_version").fetchone()[0]
+        self._version = next_version()
+        self._loaded_at = os.path.getmtime(path)
+        self._summary: Optional[Tuple[int, int, List[str]]] = None
+
+    def after_fork(self):
+        # SQLite connections must not be used across fork; open this worker's own
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = sqlite3.connect(self.path, check_same_thread=False)
+        self._version_lock = threading.Lock()
+        self._monitor = sqlite3.connect(self.path, check_same_thread=False)
+        self._data_version = self._monitor.execute("PRAGMA data_version").fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path)
+        return connection
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        self._monitor.close()
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    @property
+    def version(self) -> int:
+        with self._version_lock:
+            data_version = self._monitor.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._version = next_version()
+                self._loaded_at = time.time()
+            return self._version
+
+    @property
+    def loaded_at(self) -> float:
+        self.version  # notice commits from other connections first
+        return self._loaded_at
+
+    def _catalog_summary(self) -> Tuple[int, List[str]]:
+        """(station count, brand names), cached per version"""
+        version = self.version
+        summary = self._summary
+        if summary is None or summary[0] != version:
+            connection = self._connection()
+            count = connection.execute("SELECT COUNT(*) FROM stations").fetchone()[0]
+            brands = sorted(brand for (brand,) in connection.execute(
+                "SELECT DISTINCT brand FROM stations WHERE brand IS NOT NULL AND brand != ''"))
+            summary = self._summary = (version, count, brands)
+        return summary[1], summary[2]
+
+    def __len__(self) -> int:
+        return self._catalog_summary()[0]
+
+    def brand_names(self) -> List[str]:
+        return self._catalog_summary()[1]
+
+    def _box_query(self, lat: float, lon: float, miles: float, where: str = "",
+                   params: tuple = ()) -> List[tuple]:
+        lat_span = miles / MILES_PER_DEGREE_LAT
+        lon_span = lon_span_deg(lat, miles)
+        # CROSS JOIN keeps the R*Tree as the outer loop; otherwise the planner may
+        # walk the brand index across the whole catalog and probe the box per row
+        sql = (f"SELECT {_SELECT_COLUMNS} FROM station_locations AS box"
+               " CROSS JOIN stations AS s ON s.position = box.id"
+               " WHERE box.min_lat <= ? AND box.max_lat >= ? AND box.min_lon <= ? AND box.max_lon >= ?"
+               f"{where} ORDER BY s.position")
+        return self._connection().execute(
+            sql, (lat + lat_span, lat - lat_span, lon + lon_span, lon - lon_span) + params).fetchall()
+
+    @staticmethod
+    def _store_for(rows: List[tuple]) -> StationStore:
+        """A store holding just these rows, with their catalog positions"""
+        columns = list(zip(*rows)) if rows else [()] * len(_COLUMNS)
+        positions, station_ids, brands, addresses, zip_codes, lats, lons = columns[:7]
+        prices = {grade: np.array(values, dtype=np.float64)
+                  for grade, values in zip(GRADES, columns[7:])}
+        store = StationStore(list(station_ids), brands, list(addresses), zip_codes,
+                             np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64),
+                             prices)
+        store.positions = np.array(positions, dtype=np.int64)
+        return store
+
+    def station_id_at(self, lat: float, lon: float) -> Optional[str]:
+        target = (round(lat, 6), round(lon, 6))
+        for row in self._box_query(lat, lon, 1e-4):
+            if (round(row[5], 6), round(row[6], 6)) == target:
+                return row[1]
+        return None
+
+    def search(self, lat: float, lon: float, radius: float, brand: Optional[str] = None,
+               grade: Optional[str] = None) -> SearchResult:
+        where, params = "", ()
+        if brand is not None:
+            where += " AND s.brand = ? COLLATE NOCASE"
+            params += (brand,)
+        if grade is not None:
+            where += f" AND s.{_price_column(grade)} IS NOT NULL"
+
+        # The box is padded like the grid index's, so boundary stations reach
+        # the exact distance check
+        with span('sql'):
+            store = self._store_for(self._box_query(lat, lon, radius * (1 + SPHERICAL_ERROR),
+                                                    where, params))
+        with span('distance'):
+            indices, distances = within_radius(lat, lon, store.lats, store.lons, radius)
+        return store, indices, distances
+
+    def page(self, start: int, count: Optional[int] = None) -> Tuple[StationStore, np.ndarray]:
+        rows = self._connection().execute(
+            f"{_SELECT} WHERE s.position >= ? ORDER BY s.position LIMIT ?",
+            (start, -1 if count is None else count)).fetchall()
+        store = self._store_for(rows)
+        return store, np.arange(len(store))
+
+    def append(self, store: StationStore):
+        """Add a store's stations after the existing ones (e.g. when bulk-loading a catalog)"""
+        with self._write_lock, self._writer as db:
+            first = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM stations").fetchone()[0]
+            rows = list(_station_rows(store, first))
+            db.executemany(f"INSERT INTO stations ({', '.join(_COLUMNS)}) "
+                           f"VALUES ({', '.join('?' * len(_COLUMNS))})", rows)
+            db.executemany("INSERT INTO station_locations VALUES (?, ?, ?, ?, ?)", _location_rows(rows))
+
+    def replace(self, stations_dict: Dict,
+                prepare: Optional[Callable[[StationStore], None]] = None) -> List[Dict]:
+        incoming = StationStore.from_json_dict(stations_dict)
+        data_columns = _COLUMNS[1:]
+        price_columns = [_price_column(grade) for grade in GRADES]
+        changes = []
+
+        with self._write_lock, self._writer as db:
+            db.execute(f"CREATE TEMP TABLE IF NOT EXISTS incoming ({', '.join(_COLUMNS)})")
+            db.execute("DELETE FROM incoming")
+            db.executemany(f"INSERT INTO incoming VALUES ({', '.join('?' * len(_COLUMNS))})",
+                           _station_rows(incoming, 0))
+            db.execute("CREATE INDEX IF NOT EXISTS temp.incoming_station_id ON incoming (station_id)")
+
+            # Stations that are gone: every price they had changes to None
+            removed = db.execute(
+                f"SELECT position, station_id, {', '.join(price_columns)} FROM stations"
+                " WHERE station_id NOT IN (SELECT station_id FROM incoming)").fetchall()
+            for position, station_id, *prices in removed:
+                changes.extend({'station_id': station_id, 'grade': grade, 'old_price': price,
+                                'new_price': None}
+                               for grade, price in zip(GRADES, prices) if price is not None)
+            db.executemany("DELETE FROM stations WHERE position = ?", [(row[0],) for row in removed])
+            db.executemany("DELETE FROM station_locations WHERE id = ?", [(row[0],) for row in removed])
+
+            # Stations in both: update only the columns that differ
+            matched = "FROM incoming AS i WHERE i.station_id = stations.station_id"
+            for grade, column in zip(GRADES, price_columns):
+                changes.extend(
+                    {'station_id': station_id, 'grade': grade, 'old_price': old, 'new_price': new}
+                    for station_id, old, new in db.execute(
+                        f"SELECT s.station_id, s.{column}, i.{column} FROM stations AS s"
+                        f" JOIN incoming AS i ON i.station_id = s.station_id"
+                        f" WHERE s.{column} IS NOT i.{column}"))
+            differs = " OR ".join(f"i.{column} IS NOT stations.{column}" for column in data_columns[1:])
+            moved = [row[0] for row in db.execute(
+                f"SELECT position FROM stations WHERE EXISTS (SELECT 1 {matched}"
+                " AND (i.lat IS NOT stations.lat OR i.lon IS NOT stations.lon))")]
+            db.execute(
+                f"UPDATE stations SET ({', '.join(data_columns[1:])}) = "
+                f"(SELECT {', '.join(f'i.{column}' for column in data_columns[1:])} {matched})"
+                f" WHERE EXISTS (SELECT 1 {matched} AND ({differs}))")
+            db.executemany("DELETE FROM station_locations WHERE id = ?", [(p,) for p in moved])
+            db.executemany(
+                "INSERT INTO station_locations SELECT position, lat, lat, lon, lon FROM stations"
+                " WHERE position = ? AND lat IS NOT NULL AND lon IS NOT NULL", [(p,) for p in moved])
+
+            # New stations go after the existing ones, in incoming order
+            added = db.execute(
+                f"SELECT {', '.join(data_columns)} FROM incoming"
+                " WHERE station_id NOT IN (SELECT station_id FROM stations) ORDER BY position").fetchall()
+            if added:
+                first = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM stations").fetchone()[0]
+                rows = [(first + i,) + row for i, row in enumerate(added)]
+                db.executemany(f"INSERT INTO stations ({', '.join(_COLUMNS)}) "
+                               f"VALUES ({', '.join('?' * len(_COLUMNS))})", rows)
+                db.executemany("INSERT INTO station_locations VALUES (?, ?, ?, ?, ?)",
+                               _location_rows(rows))
+                for row in rows:
+                    changes.extend({'station_id': row[1], 'grade': grade, 'old_price': None,
+                                    'new_price': price}
+                                   for grade, price in zip(GRADES, row[7:]) if price is not None)
+            db.execute("DELETE FROM incoming")
+        return changes
+
+
+# STATIONS_FILE paths with this suffix (or any directory) are tile directories
+TILES_SUFFIX = '.tiles'
+TILE_MANIFEST = 'manifest.json'
+# Geohash length of a tile; 4 characters is about 20 x 39 km
+DEFAULT_TILE_PRECISION = 4
+# Tile key for stations without coordinates; '~' sorts after every geohash
+UNLOCATED_TILE = '~'
+
+# Memory budget for loaded tiles, in MB of tile files
+TILE_CACHE_BYTES = int(float(os.getenv('TILE_CACHE_MB', '256')) * 2**20)
+
+
+def _partition(store: StationStore, precision: int) -> Iterator[Tuple[str, np.ndarray]]:
+    """(tile key, row indices) for each non-empty tile, in key order; rows keep store order"""
+    located = ~(np.isnan(store.lats) | np.isnan(store.lons))
+    rows, cols = cells_of(store.lats[located], store.lons[located], precision)
+    cols_per_row = grid_shape(precision)[1]
+    cell_ids = np.full(len(store), -1, dtype=np.int64)
+    cell_ids[located] = rows * cols_per_row + cols
+
+    cells, inverse = np.unique(cell_ids, return_inverse=True)
+    keys = [UNLOCATED_TILE if cell < 0 else encode_cell(cell // cols_per_row, cell % cols_per_row, precision)
+            for cell in cells.tolist()]
+    key_order = sorted(range(len(keys)), key=keys.__getitem__)
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[key_order] = np.arange(len(keys))
+    tile_of = rank[inverse.reshape(-1)]
+    order = np.argsort(tile_of, kind='stable')
+    bounds = np.r_[0, np.cumsum(np.bincount(tile_of, minlength=len(keys)))]
+    for i, j in enumerate(key_order):
+        yield keys[j], order[bounds[i]:bounds[i + 1]]
+
+
+def _combine_moves(changes: List[Dict]) -> List[Dict]:
+    """
+    Merge the removal and addition of a station that moved to another tile
+
+    Per-tile diffs see such a station disappear from one tile (prices to None)
+    and appear in another (prices from None); together they are one change.
+    """
+    combined: Dict[tuple, Dict] = {}
+    for change in changes:
+        key = (change['station_id'], change['grade'])
+        previous = combined.get(key)
+        if previous is None:
+            combined[key] = dict(change)
+        elif change['old_price'] is None:
+            previous['new_price'] = change['new_price']
+        else:
+            previous['old_price'] = change['old_price']
+    return [change for change in combined.values() if change['old_price'] != change['new_price']]
+
+
+class _TileManifest:
+    """One version of a tile directory's manifest"""
+
+    def __init__(self, data: Dict, fingerprint: Optional[tuple] = None,
+                 loaded_at: Optional[float] = None):
+        self.fingerprint = fingerprint
+        self.version = next_version()
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        self.generation = data.get('generation', 0)
+        self.precision = data.get('precision', DEFAULT_TILE_PRECISION)
+        self.count = data.get('count', 0)
+        self.brands = data.get('brands', [])
+        # Tiles in catalog order, each {'key', 'file', 'offset', 'count'}
+        self.tiles: List[Dict] = data.get('tiles', [])
+        self.offsets = [tile['offset'] for tile in self.tiles]
+        self.by_cell = {decode_cell(tile['key']): tile for tile in self.tiles
+                        if tile['key'] != UNLOCATED_TILE}
+
+
+class TiledStationRepository(StationRepository):
+    """
+    Stations split into geohash tiles, one binary station file per tile
+
+    The directory holds manifest.json (each tile's file, station count and
+    catalog offset, plus the catalog's brand names) and a .bin file per
+    non-empty tile. Nothing is loaded up front: a search maps only the tiles
+    its radius overlaps, and loaded tiles stay in an LRU cache bounded by
+    TILE_CACHE_MB, so memory follows the regions actually being queried.
+
+    Catalog order is tile order (geohash order, stations without coordinates
+    last), then the original order within a tile. replace() rewrites only the
+    tiles whose stations changed, under new file names, before swapping in
+    the new manifest. Other processes serving the same directory pick up the
+    new manifest the next time they read `version`.
+    """
+
+    def __init__(self, path: str, precision: Optional[int] = None,
+                 cache_bytes: int = TILE_CACHE_BYTES):
+        """
+        Args:
+            path: Tile directory
+            precision: Geohash length for tiles written by replace() (default:
+                keep the directory's, or DEFAULT_TILE_PRECISION for a new one)
+            cache_bytes: Memory budget for loaded tiles
+        """
+        self.path = path
+        self.precision = precision
+        self.cache = SizedLRUCache(cache_bytes)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._manifest = _TileManifest({})
+        self._current()
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, TILE_MANIFEST)
+
+    def _current(self) -> _TileManifest:
+        """The manifest on disk, re-read when the file has been replaced"""
+        fingerprint = _file_fingerprint(self._manifest_path())
+        if fingerprint == self._manifest.fingerprint:
+            return self._manifest
+
+        with self._lock:
+            if fingerprint != self._manifest.fingerprint:
+                with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                    stat = os.fstat(f.fileno())
+                    data = json.load(f)
+                self._manifest = _TileManifest(
+                    data, (stat.st_ino, stat.st_mtime_ns, stat.st_size), stat.st_mtime)
+            return self._manifest
+
+    @property
+    def version(self) -> int:
+        return self._current().version
+
+    @property
+    def loaded_at(self) -> float:
+        return self._current().loaded_at
+
+    def __len__(self) -> int:
+        return self._current().count
+
+    def brand_names(self) -> List[str]:
+        return list(self._current().brands)
+
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        return self.cache.stats()
+
+    def _load_tile(self, tile: Dict) -> StationStore:
+        """A tile's stations (memory-mapped), with their catalog positions"""
+        # Offsets shift when an earlier tile changes size, so they are part of the key
+        key = (tile['file'], tile['offset'])
+        store = self.cache.get(key)
+        if store is MISSING:
+            path = os.path.join(self.path, tile['file'])
+            size = os.path.getsize(path)
+            store = StationStore.load_binary(path)
+            store.positions = np.arange(tile['offset'], tile['offset'] + tile['count'])
+            self.cache.set(key, store, size + store.positions.nbytes)
+        return store
+
+    @staticmethod
+    def _covering(manifest: _TileManifest, lat: float, lon: float, miles: float) -> List[Dict]:
+        """Tiles overlapping the bounding box of a circle, in catalog order"""
+        lat_span = miles / MILES_PER_DEGREE_LAT
+        lon_span = lon_span_deg(lat, miles)
+        row_lo, col_lo = cell_of(lat - lat_span, lon - lon_span, manifest.precision)
+        row_hi, col_hi = cell_of(lat + lat_span, lon + lon_span, manifest.precision)
+
+        # A huge radius covers more cells than there are tiles; scan tiles instead
+        if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(manifest.by_cell):
+            tiles = [tile for (row, col), tile in manifest.by_cell.items()
+                     if row_lo <= row <= row_hi and col_lo <= col <= col_hi]
+        else:
+            tiles = [manifest.by_cell[(row, col)]
+                     for row in range(row_lo, row_hi + 1) for col in range(col_lo, col_hi + 1)
+                     if (row, col) in manifest.by_cell]
+        return sorted(tiles, key=lambda tile: tile['offset'])
+
+    def station_id_at(self, lat: float, lon: float) -> Optional[str]:
+        manifest = self._current()
+        tile = manifest.by_cell.get(cell_of(lat, lon, manifest.precision))
+        return None if tile is None else self._load_tile(tile).station_id_at(lat, lon)
+
+    def search(self, lat: float, lon: float, radius: float, brand: Optional[str] = None,
+               grade: Optional[str] = None) -> SearchResult:
+        manifest = self._current()
+        with span('tiles'):
+            stores = [self._load_tile(tile) for tile in
+                      self._covering(manifest, lat, lon, radius * (1 + SPHERICAL_ERROR))]
+
+        results = [result for result in (_search_store(store, lat, lon, radius, brand, grade)
+                                         for store in stores) if len(result[1])]
+        if len(results) == 1:
+            return results[0]
+
+        # Matches from several tiles are copied into one store, in catalog order
+        parts, distances = [], []
+        for store, indices, tile_distances in results:
+            order = np.argsort(indices)
+            parts.append((store, indices[order]))
+            distances.append(tile_distances[order])
+        store = StationStore.gather(parts)
+        return (store, np.arange(len(store)),
+                np.concatenate(distances) if distances else np.empty(0))
+
+    def page(self, start: int, count: Optional[int] = None) -> Tuple[StationStore, np.ndarray]:
+        manifest = self._current()
+        end = manifest.count if count is None else min(manifest.count, start + count)
+        parts = []
+        i = max(bisect.bisect_right(manifest.offsets, start) - 1, 0)
+        while start < end and i < len(manifest.tiles):
+            tile = manifest.tiles[i]
+            local_end = min(tile['count'], end - tile['offset'])
+            parts.append((self._load_tile(tile), np.arange(start - tile['offset'], local_end)))
+            start = tile['offset'] + local_end
+            i += 1
+        if len(parts) == 1:
+            return parts[0]
+        store = StationStore.gather(parts)
+        return store, np.arange(len(store))
+
+    def pages(self) -> Iterator[Tuple[StationStore, np.ndarray]]:
+        # One batch per tile, so each tile's cached fragments stay in use
+        for tile in self._current().tiles:
+            yield self._load_tile(tile), np.arange(tile['count'])
+
+    def replace(self, stations_dict: Dict,
+                prepare: Optional[Callable[[StationStore], None]] = None) -> List[Dict]:
+        # There is no whole-catalog snapshot to prepare; tiles warm up as they are read
+        return self.replace_store(StationStore.from_json_dict(stations_dict))
+
+    def replace_store(self, store: StationStore) -> List[Dict]:
+        """Make `store` the catalog, rewriting only the tiles whose stations changed"""
+        with self._write_lock:
+            os.makedirs(self.path, exist_ok=True)
+            old = self._current()
+            precision = self.precision or (old.precision if old.tiles else DEFAULT_TILE_PRECISION)
+            generation = old.generation + 1
+            old_tiles = {tile['key']: tile for tile in old.tiles}
+            tiles, changes = [], []
+            offset = 0
+
+            for key, indices in _partition(store, precision):
+                tile_store = StationStore.gather([(store, indices)])
+                file_name = f"{key}.{generation}{BINARY_SUFFIX}"
+                tile_path = os.path.join(self.path, file_name)
+                tile_store.save_binary(tile_path)
+
+                # The format is deterministic, so an unchanged tile has identical bytes
+                previous = old_tiles.pop(key, None)
+                previous_path = previous and os.path.join(self.path, previous['file'])
+                if previous is not None and filecmp.cmp(tile_path, previous_path, shallow=False):
+                    os.unlink(tile_path)
+                    file_name = previous['file']
+                else:
+                    old_store = (StationStore.load_binary(previous_path) if previous is not None
+                                 else StationStore.empty())
+                    changes.extend(diff_stores(old_store, tile_store))
+                tiles.append({'key': key, 'file': file_name, 'offset': offset, 'count': len(tile_store)})
+                offset += len(tile_store)
+
+            # Tiles with no stations left
+            for previous in old_tiles.values():
+                changes.extend(diff_stores(
+                    StationStore.load_binary(os.path.join(self.path, previous['file'])),
+                    StationStore.empty()))
+
+            if tiles == old.tiles:
+                return []
+            save_as_json({'generation': generation, 'precision': precision, 'count': offset,
+                          'brands': sorted(name for name in store.brand_names if name),
+                          'tiles': tiles}, self._manifest_path())
+
+            # Keep the previous generation's files for readers still using the old manifest
+            keep = {tile['file'] for tile in tiles} | {tile['file'] for tile in old.tiles}
+            for name in os.listdir(self.path):
+                if name.endswith(BINARY_SUFFIX) and name not in keep:
+                    os.unlink(os.path.join(self.path, name))
+            self._current()
+        return _combine_moves(changes)
+
+
+def open_repository(path: str) -> StationRepository:
+    """The repository for a STATIONS_FILE path, chosen by its suffix"""
+    if path.endswith(TILES_SUFFIX) or os.path.isdir(path):
+        if not os.path.exists(os.path.join(path, TILE_MANIFEST)):
+            print(f"❌ CRITICAL ERROR: The tile directory '{path}' has no {TILE_MANIFEST}.")
+            print(f"💡 Run 'python priceGenerator.py --tiles {path}' to generate it.")
+        return TiledStationRepository(path)
+    if path.endswith(SQLITE_SUFFIXES):
+        return SQLiteStationRepository(path)
+    return FileStationRepository(path)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Columnar station store for the Gas Station Finder
+Keeps station data as NumPy arrays (struct-of-arrays) so filtering, sorting and
+distance work run over contiguous columns instead of lists of nested dicts
+"""
+
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from binary_store import MappedFile, StringTable, encode_strings, write_sections
+from spatial_index import StationSpatialIndex
+
+# Fuel grades as exposed by the API, in the order they appear in a record
+GRADES = ("E85", "87", "89", "91", "diesel")
+
+# Every store gets a new version number, so caches keyed on it never serve data
+# from a previous load
+_versions = itertools.count(1)
+
+# Case-insensitive gas type names for each grade
+_GRADE_LOOKUP = {grade.lower(): grade for grade in GRADES}
+
+
+def next_version() -> int:
+    """A version number no store in this process has used yet"""
+    return next(_versions)
+
+
+def reseed_versions():
+    """
+    Give a forked worker its own range of version numbers
+
+    Workers share their parent's snapshot and its version, but any store a
+    worker loads later must not reuse a number a sibling gives different
+    data, or ETags from one worker would validate against another's.
+    """
+    global _versions
+    _versions = itertools.count((os.getpid() << 24) + 1)
+
+
+def grade_key(gas_type: str) -> Optional[str]:
+    """Canonical grade name for a case-insensitive gas type, or None if unknown"""
+    return _GRADE_LOOKUP.get(gas_type.lower())
+
+# stations.json price keys for each API grade
+JSON_GRADE_KEYS = {
+    "E85": "e85",
+    "87": "regular",
+    "89": "midgrade",
+    "91": "premium",
+    "diesel": "diesel",
+}
+
+
+def _encode(values: Sequence[Optional[str]]):
+    """Dictionary-encode a column of strings into (distinct values, int32 codes); None is -1"""
+    lookup: Dict[str, int] = {}
+    # setdefault hands out the next code the first time a value is seen
+    codes = np.array([-1 if value is None else lookup.setdefault(value, len(lookup))
+                      for value in values], dtype=np.int32)
+    return list(lookup), codes
+
+
+def _gather_strings(parts: Sequence[tuple], column: str):
+    """One string column of StationStore.gather(); memory-mapped tables are copied as bytes"""
+    tables = [(getattr(store, column), indices) for store, indices in parts]
+    if tables and all(isinstance(table, StringTable) for table, _ in tables):
+        return StringTable.gather(tables)
+    return [table[i] for table, indices in tables for i in indices.tolist()]
+
+
+class StationRecord:
+    """Read-only view of one station in a StationStore"""
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: "StationStore", index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def station_id(self) -> str:
+        return self.store.station_ids[self.index]
+
+    @property
+    def brand(self) -> Optional[str]:
+        code = self.store.brand_codes[self.index]
+        return self.store.brand_names[code] if code >= 0 else None
+
+    @property
+    def zip_code(self) -> Optional[str]:
+        code = self.store.zip_codes[self.index]
+        return self.store.zip_names[code] if code >= 0 else None
+
+    @property
+    def prices(self) -> Dict[str, float]:
+        prices = {}
+        for grade in GRADES:
+            price = self.store.prices[grade][self.index]
+            if not np.isnan(price):
+                prices[grade] = float(price)
+        return prices
+
+    def to_dict(self, **extra) -> Dict:
+        """Serialize in the shape the API has always returned, plus any per-request fields"""
+        store = self.store
+        i = self.index
+        brand = self.brand
+        record = {
+            "name": brand if brand is not None else "Unknown Station",
+            "brand": brand,
+            "lat": float(store.lats[i]),
+            "lon": float(store.lons[i]),
+            "address": store.addresses[i],
+            "prices": self.prices,
+        }
+        record.update(extra)
+        return record
+
+
+class StationStore:
+    """
+    Struct-of-arrays station catalog
+
+    Coordinates and per-grade prices are float64 arrays (NaN where a station does
+    not sell a grade); brand and zip code are integer-coded against small lookup
+    tables. A spatial index over the coordinates is built with the store.
+    """
+
+    def __init__(self, station_ids: List[str], brands: Sequence[Optional[str]],
+                 addresses: List[str], zip_codes: Sequence[Optional[str]],
+                 lats, lons, prices: Dict[str, np.ndarray],
+                 loaded_at: Optional[float] = None):
+        self.version = next_version()
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        # Catalog-wide position of each row, when the store holds only part of a catalog
+        self.positions: Optional[np.ndarray] = None
+        self.station_ids = station_ids
+        self.addresses = addresses
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.prices = {grade: np.asarray(prices[grade], dtype=np.float64) for grade in GRADES}
+        self.brand_names, self.brand_codes = _encode(brands)
+        self.zip_names, self.zip_codes = _encode(zip_codes)
+
+        self.index = StationSpatialIndex(self.lats, self.lons)
+
+        # Per-grade price indexes: station indices with a price, cheapest first
+        # (ties in station order). Rebuilt whenever a new store is loaded.
+        self.price_order: Dict[str, np.ndarray] = {}
+        for grade in GRADES:
+            column = self.prices[grade]
+            priced = np.flatnonzero(~np.isnan(column))
+            self.price_order[grade] = priced[np.argsort(column[priced], kind='stable')]
+
+        self._init_lookups()
+
+    def _init_lookups(self):
+        """Case-insensitive brand lookup used by the request filters, and the lazy caches"""
+        self._brand_lookup: Dict[str, List[int]] = {}
+        for code, name in enumerate(self.brand_names):
+            self._brand_lookup.setdefault(name.lower(), []).append(code)
+
+        self._records: Optional[List[Dict]] = None
+        self._by_location: Optional[Dict[tuple, str]] = None
+
+    def __len__(self) -> int:
+        return len(self.station_ids)
+
+    @classmethod
+    def empty(cls) -> "StationStore":
+        return cls([], [], [], [], [], [], {grade: [] for grade in GRADES})
+
+    @classmethod
+    def from_json_dict(cls, data: Dict, loaded_at: Optional[float] = None) -> "StationStore":
+        """Build a store from the stations.json layout ({station_id: station_data})"""
+        count = len(data)
+        station_ids, brands, addresses, zip_codes = [], [], [], []
+        lats = np.empty(count, dtype=np.float64)
+        lons = np.empty(count, dtype=np.float64)
+        prices = {grade: np.full(count, np.nan) for grade in GRADES}
+
+        for i, (station_id, station_data) in enumerate(data.items()):
+            addr = station_data.get("address", {})
+            location = station_data.get("location", {})
+            station_prices = station_data.get("prices", {})
+
+            station_ids.append(station_data.get("station_id", station_id))
+            brands.append(station_data.get("brand_name"))
+            addresses.append(f"{addr.get('street', '')}, {addr.get('zip_code', '')}")
+            zip_codes.append(addr.get("zip_code"))
+            lat = location.get("latitude")
+            lon = location.get("longitude")
+            lats[i] = np.nan if lat is None else lat
+            lons[i] = np.nan if lon is None else lon
+            for grade, json_key in JSON_GRADE_KEYS.items():
+                price = station_prices.get(json_key)
+                if price is not None:
+                    prices[grade][i] = price
+
+        return cls(station_ids, brands, addresses, zip_codes, lats, lons, prices, loaded_at)
+
+    @classmethod
+    def gather(cls, parts: Sequence[tuple]) -> "StationStore":
+        """
+        A store of chosen rows from other stores, in the order given
+
+        `parts` is a sequence of (store, indices). The new store keeps each
+        row's catalog position, so results merged from several partial stores
+        still sort and page by catalog order.
+        """
+        parts = [(store, np.asarray(indices, dtype=np.int64)) for store, indices in parts]
+
+        def coded(names_attr, codes_attr):
+            values = []
+            for store, indices in parts:
+                names = getattr(store, names_attr)
+                values.extend(names[code] if code >= 0 else None
+                              for code in getattr(store, codes_attr)[indices].tolist())
+            return values
+
+        def concat(arrays, dtype=np.float64):
+            arrays = list(arrays)
+            return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+        prices = {grade: concat(store.prices[grade][indices] for store, indices in parts)
+                  for grade in GRADES}
+        gathered = cls(_gather_strings(parts, "station_ids"), coded("brand_names", "brand_codes"),
+                       _gather_strings(parts, "addresses"), coded("zip_names", "zip_codes"),
+                       concat(store.lats[indices] for store, indices in parts),
+                       concat(store.lons[indices] for store, indices in parts), prices)
+        gathered.positions = concat((store.catalog_positions(indices) for store, indices in parts),
+                                    dtype=np.int64)
+        return gathered
+
+    @classmethod
+    def load_json(cls, filepath: str) -> "StationStore":
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return cls.from_json_dict(json.load(f), loaded_at=os.path.getmtime(filepath))
+
+    def save_binary(self, filepath: str):
+        """
+        Write the store, including its spatial and price indexes, in the
+        memory-mapped format read by load_binary()
+        """
+        sections = {"lat": self.lats, "lon": self.lons}
+        for grade in GRADES:
+            sections[f"price:{grade}"] = self.prices[grade]
+            sections[f"order:{grade}"] = self.price_order[grade].astype(np.int64)
+        sections["brand_codes"] = self.brand_codes
+        sections["zip_codes"] = self.zip_codes
+        for name, values in (("brand_names", self.brand_names), ("zip_names", self.zip_names),
+                             ("station_ids", self.station_ids), ("addresses", self.addresses)):
+            offsets, data = encode_strings(values)
+            sections[f"{name}.offsets"] = offsets
+            sections[f"{name}.data"] = np.frombuffer(data, dtype=np.uint8)
+        sections["grid.cells"], sections["grid.starts"], sections["grid.stations"] = \
+            self.index.cell_arrays()
+        write_sections(filepath, len(self), self.index.cell_size, sections)
+
+    @classmethod
+    def load_binary(cls, filepath: str) -> "StationStore":
+        """
+        Map a file written by save_binary()
+
+        Every array is a read-only view into the mapping, so loading does no
+        parsing or index building and costs the same for any catalog size.
+        Station ids and addresses decode on access.
+        """
+        mapped = MappedFile(filepath)
+        store = cls.__new__(cls)
+        store.version = next_version()
+        store.loaded_at = mapped.mtime
+        store.positions = None
+        store.station_ids = mapped.strings("station_ids")
+        store.addresses = mapped.strings("addresses")
+        store.lats = mapped["lat"]
+        store.lons = mapped["lon"]
+        store.prices = {grade: mapped[f"price:{grade}"] for grade in GRADES}
+        store.price_order = {grade: mapped[f"order:{grade}"] for grade in GRADES}
+        store.brand_names = mapped.string_list("brand_names")
+        store.brand_codes = mapped["brand_codes"]
+        store.zip_names = mapped.string_list("zip_names")
+        store.zip_codes = mapped["zip_codes"]
+        store.index = StationSpatialIndex.from_cells(
+            store.lats, store.lons, mapped.cell_size,
+            mapped["grid.cells"].reshape(-1, 2), mapped["grid.starts"], mapped["grid.stations"])
+        store._init_lookups()
+        return store
+
+    def record(self, index: int) -> StationRecord:
+        return StationRecord(self, index)
+
+    def records(self) -> List[Dict]:
+        """All stations serialized as dicts, built once per store"""
+        if self._records is None:
+            self._records = [StationRecord(self, i).to_dict() for i in range(len(self))]
+        return self._records
+
+    def station_id_at(self, lat: float, lon: float) -> Optional[str]:
+        """Id of the station at exactly these coordinates (to 6 decimals), if any"""
+        if self._by_location is None:
+            self._by_location = {
+                (round(float(la), 6), round(float(lo), 6)): station_id
+                for station_id, la, lo in zip(self.station_ids, self.lats, self.lons)}
+        return self._by_location.get((round(lat, 6), round(lon, 6)))
+
+    def brand_mask(self, brand: str, indices: np.ndarray) -> np.ndarray:
+        """Boolean mask over `indices` for stations of `brand` (case-insensitive)"""
+        codes = self._brand_lookup.get(brand.lower())
+        if not codes:
+            return np.zeros(len(indices), dtype=bool)
+        return np.isin(self.brand_codes[indices], codes)
+
+    def grade_key(self, gas_type: str) -> Optional[str]:
+        """Canonical grade name for a case-insensitive gas type, or None if unknown"""
+        return grade_key(gas_type)
+
+    def catalog_positions(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Catalog-wide positions of rows in this store
+
+        The same numbers as `indices` unless the store is a query result that
+        holds only some of the catalog's stations.
+        """
+        return indices if self.positions is None else self.positions[indices]